@@ -1,19 +1,528 @@
 """This module contains async actions."""
 
+import collections
+import datetime
+import functools
 import logging
+import time
 import uuid
 
 import tor_async_util
+import tornado.ioloop
 
 import async_docker_remote_api
+import event_loop_monitor
+import metrics
 
 _logger = logging.getLogger(__name__)
 
+# pull policies determine when AsyncEndToEndContainerRunner pulls
+# a task's docker image
+#
+#   always - always pull the image
+#   if-not-present - only pull the image if it's not known to be present
+#   never - never pull the image; tasks fail if the image isn't present
+PULL_POLICY_ALWAYS = 'always'
+PULL_POLICY_IF_NOT_PRESENT = 'if-not-present'
+PULL_POLICY_NEVER = 'never'
+
+PULL_POLICIES = [
+    PULL_POLICY_ALWAYS,
+    PULL_POLICY_IF_NOT_PRESENT,
+    PULL_POLICY_NEVER,
+]
+
+# the pull policy used when a task doesn't specify one
+pull_policy = PULL_POLICY_ALWAYS
+
+# max number of containers the container reaper deletes concurrently
+container_reaper_max_concurrency = 10
+
+# max number of times the container reaper attempts to delete a container
+container_reaper_max_attempts = 3
+
+# time (in milliseconds) the container reaper waits before
+# retrying a failed container delete
+container_reaper_retry_delay = 1000
+
+# time (in milliseconds) between container sweeps - 0 disables sweeping
+container_sweeper_interval = 60 * 1000
+
+# min age (in milliseconds) of an exited container before it's swept
+container_sweeper_min_age = 5 * 60 * 1000
+
+# max age (in milliseconds) of a container before it's swept regardless
+# of whether or not the container has exited
+container_sweeper_max_age = 60 * 60 * 1000
+
+# max number of containers queued for deletion by a single sweep
+container_sweeper_batch_size = 25
+
+# max time (in milliseconds) a task's container is allowed to run before
+# it's killed - a task's own timeout is clamped to this max and tasks
+# which don't specify a timeout get this max. 0 means no max
+task_max_timeout = 5 * 60 * 1000
+
+# number of pre-created containers a task template's container pool
+# holds when the template doesn't define its own pool size
+task_template_pool_size = 2
+
+# time (in milliseconds) a task template's container pool waits before
+# retrying after failing to pull the template's image or create a container
+task_template_refill_retry_delay = 5 * 1000
+
+# time (in milliseconds) between background checks of the Docker Remote
+# API's health - comprehensive health checks are answered using the result
+# of the most recent background check (see HealthCheckCache). 0 disables
+# background checks so every comprehensive health check talks to the
+# Docker Remote API
+health_check_refresh_interval = 5 * 1000
+
+
+class ContainerReaper(object):
+    """Deletes containers in the background so that deleting a task's
+    container isn't on the critical path of responding to the task's
+    creator.
+
+    Containers waiting to be deleted are queued and deleted in FIFO
+    order with at most ```container_reaper_max_concurrency``` deletes
+    in progress at any point in time. Failed deletes are retried
+    after ```container_reaper_retry_delay``` ms up to
+    ```container_reaper_max_attempts``` attempts. Reaping a container
+    which is already queued or being deleted is a no-op.
+    """
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.number_in_progress = 0
+        self.number_deleted = 0
+        self.number_retries = 0
+        self.number_failures = 0
+
+        self._queue = collections.deque()
+        self._container_ids = set()
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def is_reaping(self, container_id):
+        return container_id in self._container_ids
+
+    def reap(self, container_id, force=False, endpoint=None):
+        """Delete ```container_id``` from the docker host at ```endpoint```
+        (defaults to ```async_docker_remote_api.docker_remote_api_endpoint```).
+        """
+        if container_id in self._container_ids:
+            return
+        self._container_ids.add(container_id)
+        self._queue.append((container_id, force, endpoint, 1))
+        self._reap()
+
+    def _reap(self):
+        while self._queue and self.number_in_progress < container_reaper_max_concurrency:
+            (container_id, force, endpoint, attempt) = self._queue.popleft()
+            self.number_in_progress += 1
+            acd = async_docker_remote_api.AsyncContainerDelete(
+                container_id,
+                async_state=attempt,
+                force=force,
+                endpoint=endpoint)
+            acd.delete(functools.partial(self._on_acd_delete_done, time.time()))
+
+    def _on_acd_delete_done(self, started_at, is_ok, acd):
+        self.number_in_progress -= 1
+
+        metrics.metrics.observe_phase(metrics.PHASE_DELETE, time.time() - started_at)
+
+        attempt = acd.async_state
+
+        if is_ok:
+            self._container_ids.discard(acd.container_id)
+            self.number_deleted += 1
+            if acd.delete_failure_detail == type(acd).DFD_CONTAINER_NOT_FOUND:
+                fmt = 'container already deleted - container ID = %s'
+            else:
+                fmt = 'successfully deleted container - container ID = %s'
+            _logger.info(fmt, acd.container_id)
+        elif attempt < container_reaper_max_attempts:
+            self.number_retries += 1
+            fmt = 'error deleting container (attempt %d of %d) - container ID = %s'
+            _logger.warning(fmt, attempt, container_reaper_max_attempts, acd.container_id)
+            tornado.ioloop.IOLoop.current().add_timeout(
+                datetime.timedelta(0, container_reaper_retry_delay / 1000.0, 0),
+                self._retry,
+                acd.container_id,
+                acd.force,
+                acd.endpoint,
+                attempt + 1)
+        else:
+            self._container_ids.discard(acd.container_id)
+            self.number_failures += 1
+            fmt = 'error deleting container (attempt %d of %d) - giving up - container ID = %s'
+            _logger.error(fmt, attempt, container_reaper_max_attempts, acd.container_id)
+
+        fmt = 'container reaper - queue depth = %d, in progress = %d, failures = %d'
+        _logger.info(fmt, self.queue_depth, self.number_in_progress, self.number_failures)
+
+        self._reap()
+
+    def _retry(self, container_id, force, endpoint, attempt):
+        self._queue.append((container_id, force, endpoint, attempt))
+        self._reap()
+
+
+container_reaper = ContainerReaper()
+
+
+class ContainerSweeper(object):
+    """Periodically finds containers created by ecs which were never
+    deleted (because ecs crashed or restarted part way through running
+    a task, because the container reaper gave up, etc) and queues them
+    for deletion with the container reaper.
+
+    Containers are found using the labels applied by
+    ```async_docker_remote_api.AsyncContainerCreate``` so containers
+    not created by ecs are never touched. Containers belonging to this
+    instance's in-progress tasks (see ```is_running_container()```) and
+    pooled containers are never swept - age is measured from when a
+    container was created so a pooled container or a long running task's
+    container would otherwise be swept out from under it. Other containers
+    are only swept once they're old enough that they can't reasonably
+    belong to another instance's in-progress task. Exited containers (and
+    containers created but never started, other than containers labeled
+    as belonging to a task template's pool) are swept once they're older
+    than ```container_sweeper_min_age``` ms and all containers are swept
+    once they're older than ```container_sweeper_max_age``` ms. Each sweep covers all docker
+    hosts and at most ```container_sweeper_batch_size``` containers are
+    queued per docker host per sweep.
+    """
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.number_sweeps = 0
+        self.number_swept = 0
+        self.number_failures = 0
+
+        self._periodic_callback = None
+        self._number_listing = 0
+
+    def start(self):
+        if self._periodic_callback or container_sweeper_interval <= 0:
+            return
+
+        self._periodic_callback = tornado.ioloop.PeriodicCallback(
+            self.sweep,
+            container_sweeper_interval)
+        self._periodic_callback.start()
+
+    def stop(self):
+        if self._periodic_callback:
+            self._periodic_callback.stop()
+            self._periodic_callback = None
+
+    def sweep(self):
+        if self._number_listing:
+            return
+
+        docker_hosts = async_docker_remote_api.docker_hosts()
+        self._number_listing = len(docker_hosts)
+        for docker_host in docker_hosts:
+            acl = async_docker_remote_api.AsyncContainerList(
+                async_docker_remote_api.LABEL_INSTANCE,
+                endpoint=docker_host.endpoint)
+            acl.list(self._on_acl_list_done)
+
+    def _on_acl_list_done(self, is_ok, containers, acl):
+        self._number_listing -= 1
+        if not self._number_listing:
+            self.number_sweeps += 1
+
+        if not is_ok:
+            self.number_failures += 1
+            _logger.error('container sweeper - error listing containers on %s', acl.endpoint)
+            return
+
+        now = time.time()
+        number_queued = 0
+
+        for container in containers:
+            if container_sweeper_batch_size <= number_queued:
+                break
+
+            container_id = container.get('Id', None)
+            if not container_id or container_reaper.is_reaping(container_id):
+                continue
+
+            # pooled containers are created but deliberately not started
+            if is_pooled_container(container_id):
+                continue
+
+            if is_running_container(container_id):
+                continue
+
+            age = self._age(container, now)
+            if age is None:
+                continue
+
+            if age < container_sweeper_min_age:
+                continue
+
+            if age < container_sweeper_max_age and not self._is_exited(container):
+                continue
+
+            fmt = 'container sweeper - sweeping container (%d ms old) - container ID = %s'
+            _logger.info(fmt, age, container_id)
+            container_reaper.reap(container_id, force=True, endpoint=acl.endpoint)
+            number_queued += 1
+
+        self.number_swept += number_queued
+
+        fmt = 'container sweeper - %d containers found on %s, %d queued for deletion'
+        _logger.info(fmt, len(containers), acl.endpoint, number_queued)
+
+    def _age(self, container, now):
+        """Returns the age of ```container``` in milliseconds or None
+        if the age can't be determined.
+        """
+        labels = container.get('Labels', None) or {}
+        created = labels.get(async_docker_remote_api.LABEL_CREATED, None) or container.get('Created', None)
+        try:
+            return int((now - int(created)) * 1000)
+        except (TypeError, ValueError):
+            return None
+
+    def _is_exited(self, container):
+        # State was added in Docker Remote API 1.23 - for earlier versions
+        # fall back to the human readable Status
+        state = container.get('State', None)
+        if state == 'created':
+            # a container which was created but never started has been
+            # abandoned unless it's waiting in a task template's container
+            # pool - possibly another ecs process' pool so it's only swept
+            # once it's older than container_sweeper_max_age
+            labels = container.get('Labels', None) or {}
+            return async_docker_remote_api.LABEL_TASK_TEMPLATE not in labels
+        if state:
+            return state in ['exited', 'dead']
+        return container.get('Status', '').startswith('Exited')
+
+
+container_sweeper = ContainerSweeper()
+
+
+class TaskTemplate(object):
+    """A task template is a named docker image and cmd combination.
+    Each task template maintains a pool of up to ```pool_size```
+    containers which have been created (but not started) from
+    the template's docker image and cmd. Tasks referencing the
+    template take a container from the pool and go straight to
+    starting it, skipping the image pull and container create.
+
+    The pool is refilled in the background - each time a container
+    is taken from the pool a replacement container is created. If the
+    template's image isn't present it's pulled before creating containers.
+    Failed pulls and creates are retried after
+    ```task_template_refill_retry_delay``` ms - as are creates which
+    can't find the image straight after it was successfully pulled
+    (for example, because the image is deleted by something else
+    between the pull and the create) so the pool doesn't loop
+    pulling and creating as fast as the docker host responds.
+    """
+
+    def __init__(self, name, docker_image, cmd, email=None, username=None, password=None, pool_size=None):
+        object.__init__(self)
+
+        self.name = name
+        self.docker_image = docker_image
+        self.cmd = cmd
+        self.email = email
+        self.username = username
+        self.password = password
+        self.pool_size = task_template_pool_size if pool_size is None else pool_size
+
+        self.number_taken = 0
+        self.number_misses = 0
+        self.number_creating = 0
+
+        self._pool = collections.deque()
+        self._is_pulling = False
+        self._has_pulled_image = False
+        self._is_waiting_to_retry = False
+        self._is_started = False
+
+    @property
+    def number_available(self):
+        return len(self._pool)
+
+    def is_pooled(self, container_id):
+        return container_id in self._pool
+
+    def start(self):
+        self._is_started = True
+        self._refill()
+
+    def take(self):
+        """Returns the ID of a pooled container or None if the pool
+        is empty.
+        """
+        if not self._pool:
+            self.number_misses += 1
+            self._refill()
+            return None
+
+        self.number_taken += 1
+        container_id = self._pool.popleft()
+        self._refill()
+        return container_id
+
+    def _refill(self):
+        if not self._is_started or self._is_pulling or self._is_waiting_to_retry:
+            return
+
+        while self.number_available + self.number_creating < self.pool_size:
+            self.number_creating += 1
+            # async state = was the create issued after successfully pulling the image
+            acc = async_docker_remote_api.AsyncContainerCreate(
+                self.docker_image,
+                self.cmd,
+                async_state=self._has_pulled_image,
+                task_template=self.name)
+            acc.create(self._on_acc_create_done)
+
+    def _on_acc_create_done(self, is_ok, container_id, acc):
+        self.number_creating -= 1
+
+        if is_ok:
+            fmt = 'task template %s - added container to pool - container ID = %s'
+            _logger.info(fmt, self.name, container_id)
+            self._pool.append(container_id)
+            self._has_pulled_image = False
+            self._refill()
+            return
+
+        if acc.create_failure_detail == type(acc).CFD_IMAGE_NOT_FOUND:
+            if acc.async_state:
+                fmt = 'task template %s - could not find image %s after pulling it'
+                _logger.error(fmt, self.name, self.docker_image)
+                self._retry_later()
+                return
+
+            # creates issued before the image was pulled are simply reissued
+            if self._has_pulled_image:
+                self._refill()
+                return
+
+            self._pull_image()
+            return
+
+        fmt = 'task template %s - error creating container running %s'
+        _logger.error(fmt, self.name, self.docker_image)
+        self._retry_later()
+
+    def _pull_image(self):
+        if self._is_pulling:
+            return
+        self._is_pulling = True
+
+        fmt = 'task template %s - attempting to pull image %s'
+        _logger.info(fmt, self.name, self.docker_image)
+        aip = async_docker_remote_api.AsyncImagePull(
+            self.docker_image,
+            self.email,
+            self.username,
+            self.password)
+        aip.pull(self._on_aip_pull_done)
+
+    def _on_aip_pull_done(self, is_ok, is_image_found, aip):
+        self._is_pulling = False
+
+        if not is_ok or not is_image_found:
+            fmt = 'task template %s - error pulling image %s'
+            _logger.error(fmt, self.name, self.docker_image)
+            self._retry_later()
+            return
+
+        self._has_pulled_image = True
+        self._refill()
+
+    def _retry_later(self):
+        if self._is_waiting_to_retry:
+            return
+        self._is_waiting_to_retry = True
+
+        tornado.ioloop.IOLoop.current().add_timeout(
+            datetime.timedelta(0, task_template_refill_retry_delay / 1000.0, 0),
+            self._retry)
+
+    def _retry(self):
+        self._is_waiting_to_retry = False
+        self._has_pulled_image = False
+        self._refill()
+
+
+# task template name -> TaskTemplate
+task_templates = {}
+
+
+def is_pooled_container(container_id):
+    """Returns True if ```container_id``` is waiting in a task
+    template's container pool.
+    """
+    for task_template in task_templates.values():
+        if task_template.is_pooled(container_id):
+            return True
+    return False
+
+
+# IDs of the containers AsyncEndToEndContainerRunner is using to run
+# in-progress tasks - a container is added when it's created (or taken
+# from a task template's pool) and removed when it's queued for deletion
+_running_container_ids = set()
+
+
+def is_running_container(container_id):
+    """Returns True if ```container_id``` is running (or about to run)
+    an in-progress task.
+    """
+    return container_id in _running_container_ids
+
 
 class AsyncEndToEndContainerRunner(tor_async_util.AsyncAction):
     """Async'ly ...
+
+    If ```frame_callback``` is supplied the container's stdout and
+    stderr are streamed to ```frame_callback``` (see StreamDemuxer)
+    while the container runs rather than being returned when the
+    container exits - in this case stdout and stderr are passed
+    to the callback as None.
+
+    If ```progress_callback``` is supplied it's called with one of
+    the PROGRESS_* constants and the runner as the task progresses.
+
+    Each task is run on the docker host its docker image hashes to (see
+    ```async_docker_remote_api.docker_host_for_image()```) and all
+    of the task's Docker Remote API requests go to that docker host.
+    Tasks using a task template's pooled container run on the docker
+    host at ```async_docker_remote_api.docker_remote_api_endpoint```
+    because that's where task template pools are kept.
+
+    ```timeout``` is the max time (in milliseconds, clamped to
+    ```task_max_timeout```) the container is allowed to run. When the
+    timeout expires the container is killed and the task finishes
+    as usual with whatever output the container produced before it
+    was killed - ```is_timed_out``` is then True. If the container
+    can't be killed the task fails right away (CFD_ERROR_KILLING_CONTAINER)
+    rather than holding its task slot until waiting for the container
+    gives up and the container is force deleted.
     """
 
+    PROGRESS_PULLED = 'pulled'
+    PROGRESS_STARTED = 'started'
+    PROGRESS_EXITED = 'exited'
+
     # CFD = Create Failure Details
     CFD_OK = 0x0000
     CFD_ERROR = 0x0080
@@ -23,7 +532,7 @@ class AsyncEndToEndContainerRunner(tor_async_util.AsyncAction):
     CFD_ERROR_STARTING_CONTAINER = CFD_ERROR | 0x0004
     CFD_WAITING_FOR_CONTAINER_TO_EXIT = CFD_ERROR | 0x0005
     CFD_ERROR_FETCHING_CONTAINER_LOGS = CFD_ERROR | 0x0006
-    CFD_ERROR_DELETING_CONTAINER = CFD_ERROR | 0x0007
+    CFD_ERROR_KILLING_CONTAINER = CFD_ERROR | 0x0007
 
     def __init__(self,
                  docker_image,
@@ -31,6 +540,11 @@ class AsyncEndToEndContainerRunner(tor_async_util.AsyncAction):
                  email,
                  username,
                  password,
+                 pull_policy=None,
+                 task_template=None,
+                 frame_callback=None,
+                 progress_callback=None,
+                 timeout=None,
                  async_state=None):
         tor_async_util.AsyncAction.__init__(self, async_state)
 
@@ -39,31 +553,123 @@ class AsyncEndToEndContainerRunner(tor_async_util.AsyncAction):
         self.email = email
         self.username = username
         self.password = password
+        self.pull_policy = pull_policy
+        self.task_template = task_template
+        self.frame_callback = frame_callback
+        self.progress_callback = progress_callback
+
+        self.timeout = timeout or task_max_timeout
+        if task_max_timeout:
+            self.timeout = min(self.timeout, task_max_timeout)
 
         self.cid = uuid.uuid4().hex
 
         self.create_failure_detail = None
+        self.is_timed_out = False
 
+        # when create() was called and the time (in seconds) spent in
+        # each phase of running the task keyed by phase (see metrics.PHASES)
+        self.started_at = None
+        self.phase_durations = {}
+
+        self._skipped_pull = False
+        self._is_pooled_container = False
         self._container_id = None
         self._exit_code = None
         self._stdout = None
         self._stderr = None
+        self._timeout_handle = None
+        self._docker_host = None
+        self._phase_started_at = None
         self._callback = None
 
+    @property
+    def exit_code(self):
+        """The container's exit code or None if the container hasn't exited."""
+        return self._exit_code
+
+    @property
+    def endpoint(self):
+        """The Docker Remote API endpoint of the docker host the task
+        is running on or None if the task hasn't been placed yet.
+        """
+        return self._docker_host.endpoint if self._docker_host else None
+
     def create(self, callback):
         assert self._callback is None
         self._callback = callback
 
+        self.started_at = time.time()
+
+        if self.task_template:
+            container_id = self.task_template.take()
+            if container_id:
+                self._place(async_docker_remote_api.docker_host())
+                fmt = '%s - using pooled container from task template %s - container ID = %s'
+                _logger.info(fmt, self.cid, self.task_template.name, container_id)
+                self._is_pooled_container = True
+                self._container_id = container_id
+                _running_container_ids.add(self._container_id)
+                self._start_container()
+                return
+
+            fmt = '%s - task template %s\'s container pool is empty'
+            _logger.info(fmt, self.cid, self.task_template.name)
+
+        self._place(async_docker_remote_api.docker_host_for_image(self.docker_image))
+        self._create()
+
+    def _place(self, docker_host):
+        if self._docker_host:
+            self._docker_host.number_tasks -= 1
+
+        self._docker_host = docker_host
+        self._docker_host.number_tasks += 1
+
+        fmt = '%s - running on docker host %s (%d tasks)'
+        _logger.info(fmt, self.cid, self._docker_host.endpoint, self._docker_host.number_tasks)
+
+    def _create(self):
+        effective_pull_policy = self.pull_policy or pull_policy
+
+        if effective_pull_policy == PULL_POLICY_NEVER:
+            fmt = '%s - not pulling image %s because pull policy is %s'
+            _logger.info(fmt, self.cid, self.docker_image, effective_pull_policy)
+            self._skipped_pull = True
+            self._create_container()
+            return
+
+        if effective_pull_policy == PULL_POLICY_IF_NOT_PRESENT:
+            is_image_present = async_docker_remote_api.is_image_present(
+                self.docker_image,
+                self.email,
+                self.username,
+                self.password,
+                self.endpoint)
+            if is_image_present:
+                fmt = '%s - not pulling image %s because it\'s already present'
+                _logger.info(fmt, self.cid, self.docker_image)
+                self._skipped_pull = True
+                self._create_container()
+                return
+
+        self._pull_image()
+
+    def _pull_image(self):
         fmt = '%s - attempting to pull image %s'
         _logger.info(fmt, self.cid, self.docker_image)
+        self._begin_phase()
         aip = async_docker_remote_api.AsyncImagePull(
             self.docker_image,
             self.email,
             self.username,
-            self.password)
+            self.password,
+            endpoint=self.endpoint)
         aip.pull(self._on_aip_pull_done)
 
     def _on_aip_pull_done(self, is_ok, is_image_found, api):
+        self._end_phase(metrics.PHASE_PULL)
+
         if not is_ok:
             fmt = '%s - error pulling image %s'
             _logger.error(fmt, self.cid, self.docker_image)
@@ -79,14 +685,39 @@ class AsyncEndToEndContainerRunner(tor_async_util.AsyncAction):
         fmt = '%s - successfully pulled image %s'
         _logger.info(fmt, self.cid, self.docker_image)
 
+        self._progress(type(self).PROGRESS_PULLED)
+
+        self._create_container()
+
+    def _create_container(self):
         fmt = '%s - attempting to create container running %s - %s'
         _logger.info(fmt, self.cid, self.docker_image, self.cmd[0])
+        self._begin_phase()
         acc = async_docker_remote_api.AsyncContainerCreate(
             self.docker_image,
-            self.cmd)
+            self.cmd,
+            cid=self.cid,
+            endpoint=self.endpoint)
         acc.create(self._on_acc_create_done)
 
     def _on_acc_create_done(self, is_ok, container_id, acc):
+        self._end_phase(metrics.PHASE_CREATE)
+
+        if acc.create_failure_detail == type(acc).CFD_IMAGE_NOT_FOUND:
+            async_docker_remote_api.invalidate_image(self.docker_image, self.endpoint)
+
+            if self._skipped_pull and (self.pull_policy or pull_policy) != PULL_POLICY_NEVER:
+                fmt = '%s - image %s no longer present'
+                _logger.info(fmt, self.cid, self.docker_image)
+                self._skipped_pull = False
+                self._pull_image()
+                return
+
+            fmt = '%s - could not find image %s'
+            _logger.info(fmt, self.cid, self.docker_image)
+            self._call_callback(type(self).CFD_IMAGE_NOT_FOUND)
+            return
+
         if not is_ok:
             fmt = '%s - error creating container running %s - %s'
             _logger.error(fmt, self.cid, self.docker_image, self.cmd[0])
@@ -94,35 +725,157 @@ class AsyncEndToEndContainerRunner(tor_async_util.AsyncAction):
             return
 
         self._container_id = container_id
+        _running_container_ids.add(self._container_id)
 
         fmt = '%s - successfully created container %s - %s - container ID = %s'
         _logger.info(fmt, self.cid, self.docker_image, self.cmd[0], self._container_id)
 
+        self._start_container()
+
+    def _start_container(self):
         fmt = '%s - attempting to start container - container ID = %s'
         _logger.info(fmt, self.cid, self._container_id)
-        acs = async_docker_remote_api.AsyncContainerStart(self._container_id)
+        self._begin_phase()
+        acs = async_docker_remote_api.AsyncContainerStart(self._container_id, endpoint=self.endpoint)
         acs.start(self._on_acs_start_done)
 
     def _on_acs_start_done(self, is_ok, acs):
+        self._end_phase(metrics.PHASE_START)
+
+        if not is_ok and self._is_pooled_container:
+            # pooled containers can disappear from under us (for example,
+            # someone runs "docker rm") so fall back to creating a container
+            fmt = '%s - error starting pooled container - container ID = %s'
+            _logger.warning(fmt, self.cid, self._container_id)
+            self._reap_container()
+            self._is_pooled_container = False
+            self._container_id = None
+            self._place(async_docker_remote_api.docker_host_for_image(self.docker_image))
+            self._create()
+            return
+
         if not is_ok:
             fmt = '%s - error starting container - container ID = %s'
             _logger.error(fmt, self.cid, self._container_id)
             self._call_callback(type(self).CFD_ERROR_STARTING_CONTAINER)
+            self._reap_container()
             return
 
         fmt = '%s - successfully started container - container ID = %s'
         _logger.info(fmt, self.cid, self._container_id)
 
+        self._progress(type(self).PROGRESS_STARTED)
+
+        # waiting for the container to exit includes following
+        # the container's logs when they're being streamed
+        self._begin_phase()
+
+        self._start_timeout()
+
+        if self.frame_callback:
+            self._follow_container_logs()
+            return
+
+        self._fetch_container_status()
+
+    def _start_timeout(self):
+        if not self.timeout:
+            return
+
+        self._timeout_handle = tornado.ioloop.IOLoop.current().add_timeout(
+            datetime.timedelta(0, self.timeout / 1000.0, 0),
+            self._on_timeout)
+
+    def _cancel_timeout(self):
+        if self._timeout_handle is None:
+            return
+
+        tornado.ioloop.IOLoop.current().remove_timeout(self._timeout_handle)
+        self._timeout_handle = None
+
+    def _on_timeout(self):
+        self._timeout_handle = None
+        self.is_timed_out = True
+
+        fmt = '%s - container ran for more than %d ms - killing container - container ID = %s'
+        _logger.warning(fmt, self.cid, self.timeout, self._container_id)
+
+        # the container's exit (or the end of its logs when following
+        # them) is noticed as usual once the container is killed
+        ack = async_docker_remote_api.AsyncContainerKill(self._container_id, endpoint=self.endpoint)
+        ack.kill(self._on_ack_kill_done)
+
+    def _on_ack_kill_done(self, is_ok, ack):
+        if self._callback is None:
+            # the container exited while it was being killed
+            return
+
+        if not is_ok:
+            self._end_phase(metrics.PHASE_WAIT)
+            fmt = '%s - error killing container - container ID = %s'
+            _logger.error(fmt, self.cid, self._container_id)
+            self._call_callback(type(self).CFD_ERROR_KILLING_CONTAINER)
+            # force deleting the container kills it - the pending wait for the
+            # container to exit (or the end of its logs) is then ignored
+            self._reap_container(force=True)
+            return
+
+        fmt = '%s - successfully killed container - container ID = %s'
+        _logger.info(fmt, self.cid, self._container_id)
+
+    def _follow_container_logs(self):
+        fmt = '%s - attempting to follow container\'s logs - container ID = %s'
+        _logger.info(fmt, self.cid, self._container_id)
+        acl = async_docker_remote_api.AsyncContainerLogs(
+            self._container_id,
+            follow=True,
+            frame_callback=self.frame_callback,
+            endpoint=self.endpoint)
+        acl.fetch(self._on_acl_follow_done)
+
+    def _on_acl_follow_done(self, is_ok, stdout, stderr, acl):
+        if self._callback is None:
+            # the task failed because its container couldn't be killed
+            return
+
+        if not is_ok:
+            self._end_phase(metrics.PHASE_WAIT)
+            fmt = '%s - error following container\'s logs - container ID = %s'
+            _logger.error(fmt, self.cid, self._container_id)
+            self._call_callback(type(self).CFD_ERROR_FETCHING_CONTAINER_LOGS)
+            # the container may still be running so force the delete
+            self._reap_container(force=True)
+            return
+
+        fmt = '%s - finished following container\'s logs - container ID = %s'
+        _logger.info(fmt, self.cid, self._container_id)
+
+        # following a container's logs ends when the container exits
+        # so getting the container's exit status should be quick
+        self._fetch_container_status()
+
+    def _fetch_container_status(self):
         fmt = '%s - attempting to get container\'s exit status - conatiner ID = %s'
         _logger.info(fmt, self.cid, self._container_id)
-        acs = async_docker_remote_api.AsyncContainerStatus(self._container_id)
+        acs = async_docker_remote_api.AsyncContainerStatus(self._container_id, endpoint=self.endpoint)
         acs.fetch(self._on_acs_fetch_done)
 
     def _on_acs_fetch_done(self, is_ok, exit_code, acew):
+        if self._callback is None:
+            # the task failed because its container couldn't be killed
+            return
+
+        self._end_phase(metrics.PHASE_WAIT)
+
+        # the container's no longer running so there's nothing to kill
+        self._cancel_timeout()
+
         if not is_ok:
             fmt = '%s - error getting container\'s exit status - conatiner ID = %s'
             _logger.error(fmt, self.cid, self._container_id)
             self._call_callback(type(self).CFD_WAITING_FOR_CONTAINER_TO_EXIT)
+            # the container may still be running so force the delete
+            self._reap_container(force=True)
             return
 
         self._exit_code = exit_code
@@ -130,16 +883,27 @@ class AsyncEndToEndContainerRunner(tor_async_util.AsyncAction):
         fmt = '%s - got container\'s exit status (%d) - conatiner ID = %s'
         _logger.info(fmt, self.cid, self._exit_code, self._container_id)
 
+        self._progress(type(self).PROGRESS_EXITED)
+
+        if self.frame_callback:
+            self._call_callback(type(self).CFD_OK, self._exit_code)
+            self._reap_container()
+            return
+
         fmt = '%s - attempting to fetch container\'s logs - container ID = %s'
         _logger.info(fmt, self.cid, self._container_id)
-        acl = async_docker_remote_api.AsyncContainerLogs(self._container_id)
+        self._begin_phase()
+        acl = async_docker_remote_api.AsyncContainerLogs(self._container_id, endpoint=self.endpoint)
         acl.fetch(self._on_acl_fetch_done)
 
     def _on_acl_fetch_done(self, is_ok, stdout, stderr, aclf):
+        self._end_phase(metrics.PHASE_LOGS)
+
         if not is_ok:
             fmt = '%s - error fetching container\'s logs - container ID = %s'
             _logger.error(fmt, self.cid, self._container_id)
             self._call_callback(type(self).CFD_ERROR_FETCHING_CONTAINER_LOGS)
+            self._reap_container()
             return
 
         self._stdout = stdout
@@ -148,35 +912,152 @@ class AsyncEndToEndContainerRunner(tor_async_util.AsyncAction):
         fmt = '%s - successfully fetched container\'s logs - container ID = %s'
         _logger.info(fmt, self.cid, self._container_id)
 
-        fmt = '%s - attempting to delete container - container ID = %s'
-        _logger.info(fmt, self.cid, self._container_id)
-        acd = async_docker_remote_api.AsyncContainerDelete(self._container_id)
-        acd.delete(self._on_acd_delete_done)
+        self._call_callback(type(self).CFD_OK, self._exit_code, self._stdout, self._stderr)
 
-    def _on_acd_delete_done(self, is_ok, adc):
-        if not is_ok:
-            fmt = '%s - error deleting container - container ID = %s'
-            _logger.error(fmt, self.cid, self._container_id)
-            self._call_callback(type(self).CFD_ERROR_DELETING_CONTAINER)
-            return
+        # deleting the container is deliberately done after calling
+        # the callback so the delete isn't on the critical path
+        self._reap_container()
 
-        fmt = '%s - successfully deleted container - container ID = %s'
-        _logger.info(fmt, self.cid, self._container_id)
+    def _begin_phase(self):
+        self._phase_started_at = time.time()
 
-        self._call_callback(type(self).CFD_OK, self._exit_code, self._stdout, self._stderr)
+    def _end_phase(self, phase):
+        duration = time.time() - self._phase_started_at
+        self.phase_durations[phase] = self.phase_durations.get(phase, 0.0) + duration
+        metrics.metrics.observe_phase(phase, duration)
+
+    def _progress(self, progress):
+        if self.progress_callback:
+            self.progress_callback(progress, self)
+
+    def _reap_container(self, force=False):
+        fmt = '%s - queuing container for deletion - container ID = %s'
+        _logger.info(fmt, self.cid, self._container_id)
+        _running_container_ids.discard(self._container_id)
+        container_reaper.reap(self._container_id, force, self.endpoint)
 
     def _call_callback(self, create_failure_detail, exit_code=None, stdout=None, stderr=None):
         assert self._callback is not None
         assert self.create_failure_detail is None
+        self._cancel_timeout()
+        if self._docker_host:
+            self._docker_host.number_tasks -= 1
         self.create_failure_detail = create_failure_detail
+        metrics.metrics.count_failure_detail(type(self), 'CFD', self.create_failure_detail)
         is_ok = not bool(self.create_failure_detail & type(self).CFD_ERROR)
         is_image_found = self.create_failure_detail != type(self).CFD_IMAGE_NOT_FOUND if is_ok else None
         self._callback(is_ok, is_image_found, exit_code, stdout, stderr, self)
         self._callback = None
 
 
+class HealthCheckCache(object):
+    """Periodically checks the Docker Remote API's health in the background
+    so comprehensive health checks are answered without a round trip to
+    the Docker Remote API no matter how often they arrive.
+
+    Each background check times out after ```health_check_refresh_interval```
+    ms so a hung Docker Remote API is noticed by the next refresh rather
+    than after the usual request timeout. Cached details older than
+    ```_max_age_multiple``` refresh intervals (for example, because a
+    refresh is stuck) are reported as no connectivity rather than as
+    whatever the Docker Remote API's health used to be.
+    """
+
+    _max_age_multiple = 3
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.details = None
+        self.refreshed_at = None
+        self.number_refreshes = 0
+
+        self._periodic_callback = None
+        self._is_refreshing = False
+        self._waiters = []
+
+    @property
+    def is_started(self):
+        return self._periodic_callback is not None
+
+    @property
+    def age(self):
+        """Time (in seconds) since the cached details were refreshed
+        or None if they've never been refreshed.
+        """
+        if self.refreshed_at is None:
+            return None
+        return max(0.0, time.time() - self.refreshed_at)
+
+    def start(self):
+        if self._periodic_callback or health_check_refresh_interval <= 0:
+            return
+
+        self._periodic_callback = tornado.ioloop.PeriodicCallback(
+            self.refresh,
+            health_check_refresh_interval)
+        self._periodic_callback.start()
+
+        self.refresh()
+
+    def stop(self):
+        if self._periodic_callback:
+            self._periodic_callback.stop()
+            self._periodic_callback = None
+
+    def get(self, callback):
+        """Calls ```callback``` with the cached details and their age. If
+        the cached details have never been refreshed ```callback``` is
+        called once the first refresh completes.
+        """
+        if self.details is not None:
+            age = self.age
+            if age > type(self)._max_age_multiple * health_check_refresh_interval / 1000.0:
+                callback({'connectivity': False}, age)
+                return
+            callback(self.details, age)
+            return
+
+        self._waiters.append(callback)
+        self.refresh()
+
+    def refresh(self):
+        if self._is_refreshing:
+            return
+        self._is_refreshing = True
+
+        ahc = async_docker_remote_api.AsyncHealthChecker(request_timeout=health_check_refresh_interval)
+        ahc.check(self._on_ahc_check_done)
+
+    def _on_ahc_check_done(self, details, ahc):
+        self._is_refreshing = False
+
+        self.details = details
+        self.refreshed_at = time.time()
+        self.number_refreshes += 1
+
+        (waiters, self._waiters) = (self._waiters, [])
+        for waiter in waiters:
+            waiter(self.details, self.age)
+
+
+health_check_cache = HealthCheckCache()
+
+
 class AsyncHealthChecker(tor_async_util.AsyncAction):
-    """Async'ly check the service's health."""
+    """Async'ly check the service's health.
+
+    Once ```health_check_cache``` has been started comprehensive health
+    checks use its cached details and, when ```async_state``` is a request
+    handler (see ```tor_async_util.generate_health_check_response()```),
+    the details' age is returned in the response's Age header.
+
+    Once the event loop monitor has been started comprehensive health
+    checks also report the event loop's health and, when ```async_state```
+    is a request handler, the event loop's lag percentiles are returned
+    in the response's Server-Timing header (health check details can only
+    be true or false).
+    """
 
     def __init__(self, is_quick, async_state=None):
         tor_async_util.AsyncAction.__init__(self, async_state)
@@ -193,11 +1074,37 @@ class AsyncHealthChecker(tor_async_util.AsyncAction):
             self._call_callback()
             return
 
+        if health_check_cache.is_started:
+            health_check_cache.get(self._on_health_check_cache_get_done)
+            return
+
         ahc = async_docker_remote_api.AsyncHealthChecker()
         ahc.check(self._on_docker_remote_api_ahc_fetch_done)
 
+    def _on_health_check_cache_get_done(self, details, age):
+        if hasattr(self.async_state, 'set_header'):
+            self.async_state.set_header('Age', str(int(age)))
+        self._call_callback(self._details(details))
+
     def _on_docker_remote_api_ahc_fetch_done(self, details, ahc):
-        self._call_callback({'docker remote api': details})
+        self._call_callback(self._details(details))
+
+    def _details(self, docker_remote_api_details):
+        details = {
+            'docker remote api': docker_remote_api_details,
+        }
+
+        elm = event_loop_monitor.event_loop_monitor
+        if elm.is_started:
+            details['event loop'] = elm.is_healthy
+            if hasattr(self.async_state, 'set_header'):
+                server_timing = [
+                    'event-loop-lag-p%d;dur=%.3f' % (percentile, lag * 1000.0)
+                    for (percentile, lag) in elm.percentiles()
+                ]
+                self.async_state.set_header('Server-Timing', ', '.join(server_timing))
+
+        return details
 
     def _call_callback(self, details=None):
         assert self._callback is not None
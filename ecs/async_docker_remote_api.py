@@ -1,29 +1,150 @@
 """This module contains async actions against the Docker Remote API."""
 
 import base64
+import bisect
+import collections
 import datetime
+import hashlib
 import httplib
 import json
 import logging
+import math
+import struct
+import time
+import urllib
+import uuid
 
+import pycurl
 import semantic_version
 import tor_async_util
 import tornado.httpclient
 import tornado.ioloop
 
+import metrics
+
 _logger = logging.getLogger(__name__)
 
 
 docker_remote_api_endpoint = 'http://172.17.0.1:2375'
 
+# Docker Remote API endpoints (docker hosts) across which tasks are
+# run - see DockerHost. docker_remote_api_endpoint is always the first
+# of these endpoints and is used by requests which aren't for a task
+docker_remote_api_endpoints = [docker_remote_api_endpoint]
+
 # max time to wait (in milliseconds) to connect to docker remote api
 connect_timeout = 3000
 
 # max time to wait (in milliseconds) for a docker remote api request to complete
 request_timeout = 300000
 
+# every container created by ecs is labeled with the following labels.
+# LABEL_INSTANCE identifies the ecs process which created the container,
+# LABEL_CID is the cid of the task for which the container was created,
+# LABEL_CREATED is the time (in seconds since the epoch) at which the
+# container was created and LABEL_TASK_TEMPLATE is the name of the task
+# template whose container pool the container was created for
+LABEL_PREFIX = 'com.simonsdave.ecs'
+LABEL_INSTANCE = LABEL_PREFIX + '.instance'
+LABEL_CID = LABEL_PREFIX + '.cid'
+LABEL_CREATED = LABEL_PREFIX + '.created'
+LABEL_TASK_TEMPLATE = LABEL_PREFIX + '.task-template'
+
+# uniquely identifies this ecs process - see LABEL_INSTANCE
+instance_id = uuid.uuid4().hex
+
+# AsyncContainerStatus determines when a container exits using
+# one of the following modes
+#
+#   wait - a single long poll request to /containers/{id}/wait
+#   poll - repeated requests to /containers/{id}/json
+#   events - wait for the container's die event to arrive on the
+#       events stream shared by all containers (see EventStream)
+#
+# in wait and events modes AsyncContainerStatus falls back to
+# poll mode if the long poll request fails or the events stream
+# is lost
+CONTAINER_STATUS_MODE_WAIT = 'wait'
+CONTAINER_STATUS_MODE_POLL = 'poll'
+CONTAINER_STATUS_MODE_EVENTS = 'events'
+
+CONTAINER_STATUS_MODES = [
+    CONTAINER_STATUS_MODE_WAIT,
+    CONTAINER_STATUS_MODE_POLL,
+    CONTAINER_STATUS_MODE_EVENTS,
+]
+
+# time to wait (in milliseconds) before reconnecting to the events stream
+# after the events stream has been lost
+event_stream_reconnect_delay = 1000
+
+container_status_mode = CONTAINER_STATUS_MODE_WAIT
+
+# image pulls which are currently in progress. keys are the tuples
+# returned by AsyncImagePull._in_flight_key() and values are lists
+# of AsyncImagePull instances that have attached themselves to the
+# in progress pull and are waiting for it to complete
+_in_flight_image_pulls = {}
+
+# max time (in milliseconds) that an image is assumed to still be
+# present after it was last confirmed to be present
+image_cache_ttl = 5 * 60 * 1000
+
+# images known to be present. keys are (endpoint, docker_image, email, username,
+# password) tuples and values are the time (in seconds since the epoch) at
+# which the entry expires. credentials are part of the key so a private image
+# pulled on behalf of one set of credentials is never assumed to be
+# available to a caller with different (or no) credentials
+_present_images = {}
+
+
+def is_image_present(docker_image, email=None, username=None, password=None, endpoint=None):
+    """Returns True if ```docker_image``` is known to be present on
+    ```endpoint``` (defaults to ```docker_remote_api_endpoint```) and was
+    pulled using the supplied credentials otherwise returns False.
+    """
+    key = (endpoint or docker_remote_api_endpoint, docker_image, email, username, password)
+    expires_at = _present_images.get(key, None)
+    if expires_at is None:
+        return False
+    if expires_at < time.time():
+        del _present_images[key]
+        return False
+    return True
+
+
+def mark_image_present(docker_image, email=None, username=None, password=None, endpoint=None):
+    key = (endpoint or docker_remote_api_endpoint, docker_image, email, username, password)
+    _present_images[key] = time.time() + image_cache_ttl / 1000.0
+
+
+def invalidate_image(docker_image, endpoint=None):
+    """Forget ```docker_image``` is present on ```endpoint``` (defaults
+    to ```docker_remote_api_endpoint```) regardless of the credentials
+    used to pull it. If ```docker_image``` is None forget all images
+    are present on ```endpoint```.
+    """
+    endpoint = endpoint or docker_remote_api_endpoint
+    for key in _present_images.keys():
+        if key[0] == endpoint and docker_image in [None, key[1]]:
+            del _present_images[key]
+
 
 class AsyncAction(tor_async_util.AsyncAction):
+    """Requests made by an async action are sent to ```endpoint```
+    which defaults to ```docker_remote_api_endpoint```.
+    """
+
+    def __init__(self, async_state=None, endpoint=None):
+        tor_async_util.AsyncAction.__init__(self, async_state)
+
+        self.endpoint = endpoint or docker_remote_api_endpoint
+
+    def bulkhead_fetch(self, bulkhead, request, callback):
+        """Send ```request``` to ```endpoint``` using
+        the ```endpoint```'s ```bulkhead``` bulkhead.
+        """
+        docker_host(self.endpoint).bulkheads[bulkhead].fetch(request, callback=callback)
 
     def write_http_client_response_to_log(self, response):
         tor_async_util.write_http_client_response_to_log(
@@ -32,22 +153,619 @@ class AsyncAction(tor_async_util.AsyncAction):
             'Remote Docker API')
 
 
+# docker_remote_api_endpoint can be a tcp endpoint (ex http://172.17.0.1:2375)
+# or a unix domain socket (ex unix:///var/run/docker.sock)
+UNIX_SOCKET_SCHEME = 'unix://'
+
+# host used in the urls of requests sent over a unix domain socket -
+# the Docker Remote API ignores the host but curl requires one
+_unix_socket_host = 'http://docker'
+
+
+def is_unix_socket_endpoint(endpoint):
+    return endpoint.startswith(UNIX_SOCKET_SCHEME)
+
+
+def is_unix_socket_supported():
+    """Returns True if the installed pycurl and libcurl support
+    unix domain sockets (requires libcurl >= 7.40.0).
+    """
+    return hasattr(pycurl, 'UNIX_SOCKET_PATH')
+
+
 class HTTPRequest(tornado.httpclient.HTTPRequest):
+    """HTTPRequest for the Docker Remote API at the ```endpoint``` keyword
+    argument (defaults to ```docker_remote_api_endpoint```). If the endpoint
+    is a unix domain socket the request is sent over the socket - this
+    requires ```tornado.curl_httpclient.CurlAsyncHTTPClient``` which
+    reuses curl handles, and therefore keep-alive connections, across
+    requests. A curl handle remembers the unix domain socket path of the
+    last request it sent so requests must be fetched using ```http_client()```.
+    """
 
     def __init__(self, *args, **kwargs):
         assert 1 == len(args)
         args[0].startswith('/')
-        args = ['%s%s' % (docker_remote_api_endpoint, args[0])]
+        endpoint = kwargs.pop('endpoint', None) or docker_remote_api_endpoint
+        if is_unix_socket_endpoint(endpoint):
+            args = ['%s%s' % (_unix_socket_host, args[0])]
+            kwargs['prepare_curl_callback'] = self._prepare_curl_for_unix_socket
+        else:
+            args = ['%s%s' % (endpoint, args[0])]
+            if is_unix_socket_supported():
+                kwargs['prepare_curl_callback'] = self._prepare_curl_for_tcp
         kwargs['connect_timeout'] = connect_timeout / 1000.0
-        kwargs['request_timeout'] = request_timeout / 1000.0
+        kwargs.setdefault('request_timeout', request_timeout / 1000.0)
         tornado.httpclient.HTTPRequest.__init__(self, *args, **kwargs)
 
+        self.unix_socket_path = None
+        if is_unix_socket_endpoint(endpoint):
+            self.unix_socket_path = endpoint[len(UNIX_SOCKET_SCHEME):]
+
+    def _prepare_curl_for_unix_socket(self, curl):
+        curl.setopt(pycurl.UNIX_SOCKET_PATH, self.unix_socket_path)
+
+    def _prepare_curl_for_tcp(self, curl):
+        # older pycurls can't unset the unix domain socket path which is
+        # why http_client() never shares curl handles between a unix
+        # domain socket endpoint and any other endpoint
+        try:
+            curl.unsetopt(pycurl.UNIX_SOCKET_PATH)
+        except TypeError:
+            pass
+
+
+# unix domain socket endpoints' http clients keyed by socket path
+_unix_socket_http_clients = {}
+
+
+def http_client(request):
+    """Returns the http client used to fetch ```request``` (an HTTPRequest).
+    Requests to tcp endpoints share tornado's http client while each unix
+    domain socket endpoint has its own http client so a curl handle which
+    has sent a request over a unix domain socket is never used to send a
+    request to a tcp endpoint (or a different unix domain socket).
+    """
+    if not request.unix_socket_path:
+        return tornado.httpclient.AsyncHTTPClient()
+
+    io_loop = tornado.ioloop.IOLoop.current()
+    client = _unix_socket_http_clients.get(request.unix_socket_path, None)
+    if client is None or client.io_loop is not io_loop:
+        client = tornado.httpclient.AsyncHTTPClient(force_instance=True)
+        _unix_socket_http_clients[request.unix_socket_path] = client
+    return client
+
+
+# Docker Remote API requests are partitioned into bulkheads by the
+# task phase making the request - each bulkhead has its own concurrency
+# limit and wait queue so, for example, a burst of slow image pulls
+# can't starve the quick requests of tasks which are already running
+BULKHEAD_PULL = 'pull'
+BULKHEAD_CREATE = 'create'
+BULKHEAD_STATUS = 'status'
+BULKHEAD_LOGS = 'logs'
+BULKHEAD_DELETE = 'delete'
+BULKHEAD_KILL = 'kill'
+
+BULKHEADS = [
+    BULKHEAD_PULL,
+    BULKHEAD_CREATE,
+    BULKHEAD_STATUS,
+    BULKHEAD_LOGS,
+    BULKHEAD_DELETE,
+    BULKHEAD_KILL,
+]
+
+# max number of concurrent requests per bulkhead. note the status
+# bulkhead's /containers/{id}/wait long polls (see container_status_mode)
+# each hold a slot for as long as a task's container runs
+bulkhead_max_concurrency = {
+    BULKHEAD_PULL: 5,
+    BULKHEAD_CREATE: 25,
+    BULKHEAD_STATUS: 100,
+    BULKHEAD_LOGS: 25,
+    BULKHEAD_DELETE: 10,
+    BULKHEAD_KILL: 10,
+}
+
+# max number of requests waiting in each bulkhead's queue - requests
+# which arrive when the queue is full fail immediately with a 599
+bulkhead_max_queue_depth = 1000
+
+
+class Bulkhead(object):
+    """Limits the number of concurrent Docker Remote API requests in
+    a single bulkhead. Requests which arrive when
+    ```bulkhead_max_concurrency[name]``` requests are already in progress
+    wait in a FIFO queue of at most ```bulkhead_max_queue_depth``` requests.
+    Requests to a docker host whose circuit breaker isn't closed fail
+    immediately rather than being queued and requests already queued
+    fail as soon as the circuit breaker trips (see DockerHost).
+    """
+
+    def __init__(self, name, docker_host=None):
+        object.__init__(self)
+
+        self.name = name
+        self.docker_host = docker_host
+
+        self.number_in_progress = 0
+        self.number_requests = 0
+        self.number_queued = 0
+        self.number_rejected = 0
+        self.max_observed_queue_depth = 0
+
+        self._queue = collections.deque()
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def fetch(self, request, callback):
+        self.number_requests += 1
+
+        # checked before queueing since when a docker host hangs the
+        # bulkhead is full of requests waiting out request_timeout
+        if self.docker_host and not self.docker_host.is_healthy:
+            self._fail_fast(request, callback)
+            return
+
+        if self.number_in_progress < bulkhead_max_concurrency[self.name]:
+            self._fetch(request, callback)
+            return
+
+        if bulkhead_max_queue_depth <= self.queue_depth:
+            self.number_rejected += 1
+            fmt = '%s bulkhead - queue full (%d) - rejecting request to %s'
+            _logger.error(fmt, self.name, self.queue_depth, request.url)
+            error = tornado.httpclient.HTTPError(599, '%s bulkhead queue full' % self.name)
+            callback(tornado.httpclient.HTTPResponse(request, 599, error=error, request_time=0))
+            return
+
+        self.number_queued += 1
+        self._queue.append((request, callback))
+        self.max_observed_queue_depth = max(self.max_observed_queue_depth, self.queue_depth)
+
+        fmt = '%s bulkhead - in progress = %d, queue depth = %d'
+        _logger.info(fmt, self.name, self.number_in_progress, self.queue_depth)
+
+    def fail_queued(self):
+        """Fail all queued requests - called when the docker host's
+        circuit breaker trips.
+        """
+        (queue, self._queue) = (self._queue, collections.deque())
+        for (request, callback) in queue:
+            self._fail_fast(request, callback)
+
+    def _fail_fast(self, request, callback):
+        self.docker_host.number_fast_failures += 1
+        fmt = '%s bulkhead - docker host %s circuit breaker %s - failing request to %s'
+        _logger.error(fmt, self.name, self.docker_host.endpoint, self.docker_host.state, request.url)
+        error = tornado.httpclient.HTTPError(599, 'docker host %s unavailable' % self.docker_host.endpoint)
+        callback(tornado.httpclient.HTTPResponse(request, 599, error=error, request_time=0))
+
+    def _fetch(self, request, callback):
+        if self.docker_host and not self.docker_host.is_healthy:
+            self._fail_fast(request, callback)
+            return
+
+        self.number_in_progress += 1
+
+        def on_http_client_fetch_done(response):
+            self.number_in_progress -= 1
+            if self.docker_host:
+                self.docker_host.on_response(response)
+            try:
+                callback(response)
+            finally:
+                self._dispatch()
+
+        http_client(request).fetch(request, callback=on_http_client_fetch_done)
+
+    def _dispatch(self):
+        while self._queue and self.number_in_progress < bulkhead_max_concurrency[self.name]:
+            (request, callback) = self._queue.popleft()
+            self._fetch(request, callback)
+
+
+# each docker host has a circuit breaker (see DockerHost) which trips
+# after docker_host_failure_threshold consecutive requests to the docker
+# host fail to connect, time out or get a 502, 503 or 504. while tripped,
+# requests to the docker host fail immediately and every
+# docker_host_probe_interval ms a single probe request checks if the
+# docker host has recovered
+docker_host_failure_threshold = 5
+
+# response codes which say the docker host rather than the request is
+# the problem - 599 = failed to connect or timed out and 502, 503 and 504
+# come from a proxy in front of the docker daemon. 500s don't count since
+# the Docker Remote API responds with a 500 to requests which fail because
+# of what's being asked for (ex starting a container whose cmd doesn't
+# exist or pulling an image with the wrong credentials) so a caller's
+# bad tasks could otherwise trip a healthy docker host's circuit breaker
+_docker_host_failure_codes = frozenset([
+    599,
+    httplib.BAD_GATEWAY,
+    httplib.SERVICE_UNAVAILABLE,
+    httplib.GATEWAY_TIMEOUT,
+])
+
+docker_host_probe_interval = 5000
+
+
+class DockerHost(object):
+    """A Docker Remote API endpoint on which tasks are run. Each docker
+    host has its own bulkheads so one slow or overloaded docker host
+    can't hold up requests to other docker hosts.
+
+    ```number_tasks``` is the number of tasks running on the docker host
+    (see ```AsyncEndToEndContainerRunner```).
+
+    Requests to each docker host go through a circuit breaker. The
+    circuit breaker starts closed and opens (trips) after
+    ```docker_host_failure_threshold``` consecutive requests fail to
+    connect, time out or get a 502, 503 or 504 response (see
+    ```_docker_host_failure_codes```). While the circuit breaker
+    is open requests fail immediately with a 599 rather than each waiting
+    out ```connect_timeout``` or ```request_timeout``` and the docker host
+    is unhealthy so tasks aren't placed on it (see ```least_loaded_docker_host()```
+    and ```docker_host_for_image()```). ```docker_host_probe_interval``` ms
+    after tripping the circuit breaker is half-open and a single probe
+    (see ```AsyncHealthChecker```) checks the docker host - if the probe
+    connects the circuit breaker closes otherwise it opens again.
+    """
+
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half-open'
+
+    def __init__(self, endpoint):
+        object.__init__(self)
+
+        self.endpoint = endpoint
+
+        self.number_tasks = 0
+
+        self.state = type(self).STATE_CLOSED
+        self.number_consecutive_failures = 0
+        self.number_trips = 0
+        self.number_fast_failures = 0
+
+        self.bulkheads = {name: Bulkhead(name, self) for name in BULKHEADS}
+
+    @property
+    def is_healthy(self):
+        return self.state == type(self).STATE_CLOSED
+
+    def on_response(self, response):
+        if response.code not in _docker_host_failure_codes:
+            self.number_consecutive_failures = 0
+            return
+
+        self.number_consecutive_failures += 1
+        is_tripped = self.is_healthy and docker_host_failure_threshold <= self.number_consecutive_failures
+        if is_tripped:
+            self.number_trips += 1
+            fmt = 'docker host %s circuit breaker tripped after %d consecutive failures'
+            _logger.warning(fmt, self.endpoint, self.number_consecutive_failures)
+            self._open()
+            for bulkhead in self.bulkheads.values():
+                bulkhead.fail_queued()
+
+    def _open(self):
+        self.state = type(self).STATE_OPEN
+        tornado.ioloop.IOLoop.current().add_timeout(
+            datetime.timedelta(0, docker_host_probe_interval / 1000.0, 0),
+            self._probe)
+
+    def _probe(self):
+        self.state = type(self).STATE_HALF_OPEN
+        ahc = AsyncHealthChecker(endpoint=self.endpoint)
+        ahc.check(self._on_probe_done)
+
+    def _on_probe_done(self, details, ahc):
+        if not details['connectivity']:
+            fmt = 'docker host %s circuit breaker probe failed'
+            _logger.warning(fmt, self.endpoint)
+            self._open()
+            return
+
+        self.state = type(self).STATE_CLOSED
+        self.number_consecutive_failures = 0
+        fmt = 'docker host %s circuit breaker closed'
+        _logger.info(fmt, self.endpoint)
+
+
+# DockerHost instances keyed by Docker Remote API endpoint
+_docker_hosts = {}
+
+
+def docker_host(endpoint=None):
+    """Returns the DockerHost for ```endpoint``` which
+    defaults to ```docker_remote_api_endpoint```.
+    """
+    endpoint = endpoint or docker_remote_api_endpoint
+    if endpoint not in _docker_hosts:
+        _docker_hosts[endpoint] = DockerHost(endpoint)
+    return _docker_hosts[endpoint]
+
+
+def docker_hosts():
+    """Returns the DockerHost for each of ```docker_remote_api_endpoints```."""
+    return [docker_host(endpoint) for endpoint in docker_remote_api_endpoints]
+
+
+def least_loaded_docker_host():
+    """Returns the healthy docker host running the fewest tasks. Ties are
+    broken using the order of ```docker_remote_api_endpoints```. If all
+    docker hosts are unhealthy the least loaded docker host is returned
+    so tasks still fail (or succeed) quickly on their own rather than
+    being failed up front.
+    """
+    hosts = docker_hosts()
+    healthy_hosts = [host for host in hosts if host.is_healthy]
+    return min(healthy_hosts or hosts, key=lambda host: host.number_tasks)
+
+
+# tasks are placed on docker hosts by hashing the task's docker image
+# onto a consistent hash ring of docker hosts - see docker_host_for_image().
+# docker_host_load_bound is the max number of tasks (as a percentage of
+# the average number of tasks per healthy docker host) a docker host
+# runs before tasks which hash to it spill over to the next docker host
+# on the ring
+docker_host_load_bound = 125
+
+# number of points each docker host has on the hash ring - the more
+# points the more evenly docker images are spread across docker hosts
+_hash_ring_points_per_docker_host = 100
+
+# the hash ring (a sorted list of (hash, endpoint) tuples) and the
+# endpoints from which it was built
+_hash_ring = ((), [])
+
+
+def _hash(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return int(hashlib.md5(value).hexdigest()[:16], 16)
+
+
+def _get_hash_ring():
+    global _hash_ring
+
+    endpoints = tuple(docker_remote_api_endpoints)
+    if _hash_ring[0] != endpoints:
+        points = [
+            (_hash('%s-%d' % (endpoint, i)), endpoint)
+            for endpoint in endpoints
+            for i in range(_hash_ring_points_per_docker_host)
+        ]
+        _hash_ring = (endpoints, sorted(points))
+
+    return _hash_ring[1]
+
+
+def docker_host_for_image(docker_image):
+    """Returns the docker host on which a task running ```docker_image```
+    should be run using consistent hashing with bounded loads. Tasks for
+    the same docker image go to the same docker host, which most likely
+    already has the image, so cold pulls happen on as few docker hosts
+    as possible. Adding or removing a docker host only moves the docker
+    images of the docker host's neighbours on the hash ring.
+
+    A docker host is skipped if it's unhealthy or already running
+    ```docker_host_load_bound``` percent of the average number of tasks
+    per healthy docker host, and the next docker host on the ring
+    is tried, so popular docker images can't overload a single docker
+    host. If no docker host qualifies the least loaded docker host is
+    returned (see ```least_loaded_docker_host()```).
+    """
+    hosts = docker_hosts()
+    healthy_hosts = [host for host in hosts if host.is_healthy]
+    if len(hosts) == 1 or not healthy_hosts:
+        return least_loaded_docker_host()
+
+    number_tasks = sum([host.number_tasks for host in healthy_hosts]) + 1
+    max_number_tasks = int(math.ceil(number_tasks * docker_host_load_bound / 100.0 / len(healthy_hosts)))
+
+    hash_ring = _get_hash_ring()
+    start = bisect.bisect(hash_ring, (_hash(docker_image),))
+    tried_endpoints = set()
+    for i in range(len(hash_ring)):
+        (point, endpoint) = hash_ring[(start + i) % len(hash_ring)]
+        if endpoint in tried_endpoints:
+            continue
+        tried_endpoints.add(endpoint)
+
+        host = docker_host(endpoint)
+        if host.is_healthy and host.number_tasks < max_number_tasks:
+            return host
+
+    return least_loaded_docker_host()
+
+
+# EventStream instances keyed by Docker Remote API endpoint
+_event_streams = {}
+
+
+def event_stream(endpoint=None):
+    """Returns the EventStream for ```endpoint``` which
+    defaults to ```docker_remote_api_endpoint```.
+    """
+    endpoint = endpoint or docker_remote_api_endpoint
+    if endpoint not in _event_streams:
+        _event_streams[endpoint] = EventStream(endpoint)
+    return _event_streams[endpoint]
+
+
+class EventStream(object):
+    """A single long lived connection to the Docker Remote API's
+    /events endpoint which is shared by everything interested in
+    container and image lifecycle events.
+
+    Interest in a container's events is expressed by calling register()
+    with the container's ID and a callback. The callback is called with
+    a dict (keys = type, action, id, attributes and time) describing
+    each event for the container. If the events stream is lost the
+    callback is called with None and all registrations are dropped.
+
+    Events for containers which weren't created by this ecs process
+    are discarded. Image delete and untag events invalidate the image
+    presence cache.
+    """
+
+    EVENT_TYPE_CONTAINER = 'container'
+    EVENT_TYPE_IMAGE = 'image'
+
+    EVENT_ACTION_DIE = 'die'
+    EVENT_ACTION_DESTROY = 'destroy'
+    EVENT_ACTION_PULL = 'pull'
+    EVENT_ACTION_DELETE = 'delete'
+    EVENT_ACTION_UNTAG = 'untag'
+
+    def __init__(self, endpoint=None):
+        object.__init__(self)
+
+        self.endpoint = endpoint or docker_remote_api_endpoint
+
+        self.is_connected = False
+
+        self._waiters = {}
+        self._buffer = ''
+        self._since = None
+
+    def start(self):
+        if not self.is_connected:
+            self._connect()
+
+    def register(self, id, callback):
+        self._waiters.setdefault(id, []).append(callback)
+        self.start()
+
+    def unregister(self, id, callback):
+        callbacks = self._waiters.get(id, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks:
+            self._waiters.pop(id, None)
+
+    def _connect(self):
+        self.is_connected = True
+        self._buffer = ''
+
+        filters = {
+            'type': [
+                type(self).EVENT_TYPE_CONTAINER,
+                type(self).EVENT_TYPE_IMAGE,
+            ],
+            'event': [
+                type(self).EVENT_ACTION_DIE,
+                type(self).EVENT_ACTION_DESTROY,
+                type(self).EVENT_ACTION_PULL,
+                type(self).EVENT_ACTION_DELETE,
+                type(self).EVENT_ACTION_UNTAG,
+            ],
+        }
+        # since is used to replay events that occurred while
+        # the events stream was being (re)established
+        query_string = {
+            'filters': json.dumps(filters),
+            'since': self._since or int(time.time()) - 1,
+        }
+        request = HTTPRequest(
+            '/events?%s' % urllib.urlencode(query_string),
+            endpoint=self.endpoint,
+            method='GET',
+            request_timeout=0,
+            streaming_callback=self._on_chunk)
+        http_client(request).fetch(
+            request,
+            callback=self._on_http_client_fetch_done)
+
+    def _on_chunk(self, chunk):
+        self._buffer += chunk
+        lines = self._buffer.split('\n')
+        self._buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                self._on_event(json.loads(line))
+
+    def _on_event(self, raw_event):
+        actor = raw_event.get('Actor', {})
+        event = {
+            # Docker Remote API versions before 1.22 don't include
+            # Type, Action or Actor in events
+            'type': raw_event.get(
+                'Type',
+                type(self).EVENT_TYPE_CONTAINER if 'from' in raw_event else type(self).EVENT_TYPE_IMAGE),
+            'action': raw_event.get('Action', raw_event.get('status', None)),
+            'id': actor.get('ID', raw_event.get('id', None)),
+            'attributes': actor.get('Attributes', {}),
+            'time': raw_event.get('time', None),
+        }
+
+        if event['time'] is not None:
+            self._since = event['time']
+
+        if event['type'] == type(self).EVENT_TYPE_CONTAINER:
+            # the Docker Remote API ANDs filters so filtering the events
+            # stream by label would also filter out all image events.
+            # instead, container events are filtered here using the
+            # container labels included in each event's attributes
+            # (Docker Remote API versions before 1.22 don't include
+            # attributes in events)
+            if event['attributes'] and event['attributes'].get(LABEL_INSTANCE, None) != instance_id:
+                return
+
+        if event['type'] == type(self).EVENT_TYPE_IMAGE:
+            # delete and untag events identify the image by its ID (sha256:...)
+            # rather than by the repo:tag the image presence cache is keyed
+            # by so forget every image is present on the docker host
+            if event['action'] in [type(self).EVENT_ACTION_DELETE, type(self).EVENT_ACTION_UNTAG]:
+                invalidate_image(None, self.endpoint)
+
+        for callback in self._waiters.get(event['id'], [])[:]:
+            callback(event)
+
+    def _on_http_client_fetch_done(self, response):
+        tor_async_util.write_http_client_response_to_log(
+            _logger,
+            response,
+            'Remote Docker API')
+
+        self.is_connected = False
+
+        _logger.warning('lost Docker Remote API events stream on %s (%d)', self.endpoint, response.code)
+
+        waiters = self._waiters
+        self._waiters = {}
+        for callbacks in waiters.values():
+            for callback in callbacks:
+                callback(None)
+
+        tornado.ioloop.IOLoop.current().add_timeout(
+            datetime.timedelta(0, event_stream_reconnect_delay / 1000.0, 0),
+            self.start)
+
+
+# range of Docker Remote API versions supported by ecs
+_min_api_version = semantic_version.Version('1.18', partial=True)
+_max_api_version = semantic_version.Version('1.29', partial=True)
+
 
 class AsyncHealthChecker(AsyncAction):
-    """Async'ly check the health of the Docker Remote API."""
+    """Async'ly check the health of the Docker Remote API.
+
+    ```request_timeout``` is the max time (in milliseconds) to wait for
+    the Docker Remote API to respond - the module's ```request_timeout```
+    is used if it isn't supplied.
+    """
 
-    def __init__(self, async_state=None):
-        AsyncAction.__init__(self, async_state)
+    def __init__(self, async_state=None, endpoint=None, request_timeout=None):
+        AsyncAction.__init__(self, async_state, endpoint)
+
+        self.request_timeout = request_timeout
 
         self._callback = None
 
@@ -55,9 +773,11 @@ class AsyncHealthChecker(AsyncAction):
         assert self._callback is None
         self._callback = callback
 
-        request = HTTPRequest('/version', method='GET')
-        http_client = tornado.httpclient.AsyncHTTPClient()
-        http_client.fetch(
+        kwargs = {}
+        if self.request_timeout is not None:
+            kwargs['request_timeout'] = self.request_timeout / 1000.0
+        request = HTTPRequest('/version', endpoint=self.endpoint, method='GET', **kwargs)
+        http_client(request).fetch(
             request,
             callback=self._on_http_client_fetch_done)
 
@@ -74,9 +794,7 @@ class AsyncHealthChecker(AsyncAction):
         response_body = json.loads(response.body)
 
         api_version = semantic_version.Version(response_body['ApiVersion'], partial=True)
-        min_api_version = semantic_version.Version('1.18', partial=True)
-        max_api_version = semantic_version.Version('1.29', partial=True)
-        api_version_ok = (min_api_version <= api_version) and (api_version <= max_api_version)
+        api_version_ok = (_min_api_version <= api_version) and (api_version <= _max_api_version)
         details = {
             'connectivity': True,
             'api version': api_version_ok,
@@ -90,7 +808,15 @@ class AsyncHealthChecker(AsyncAction):
 
 
 class AsyncImagePull(AsyncAction):
-    """Async'ly pull an image."""
+    """Async'ly pull an image.
+
+    Concurrent pulls of the same image with the same credentials are
+    coalesced - only the first pull generates requests to the Docker
+    Remote API and all later pulls attach to the first pull and share
+    its result. Without this coalescing, the Docker Remote API responds
+    to the later pulls with "Repository ... already being pulled by
+    another client. Waiting." messages.
+    """
 
     # PFD = Pull Failure Details
     PFD_OK = 0x0000
@@ -103,8 +829,9 @@ class AsyncImagePull(AsyncAction):
                  email=None,
                  username=None,
                  password=None,
-                 async_state=None):
-        AsyncAction.__init__(self, async_state)
+                 async_state=None,
+                 endpoint=None):
+        AsyncAction.__init__(self, async_state, endpoint)
 
         self.docker_image = docker_image
         self.email = email
@@ -115,12 +842,25 @@ class AsyncImagePull(AsyncAction):
 
         self._image_found = None
 
+        self._is_in_flight_leader = False
+
         self._callback = None
 
     def pull(self, callback):
         assert self._callback is None
         self._callback = callback
 
+        key = self._in_flight_key()
+        followers = _in_flight_image_pulls.get(key, None)
+        if followers is not None:
+            fmt = 'pull of image %s already in progress - waiting for it to complete'
+            _logger.info(fmt, self.docker_image)
+            followers.append(self)
+            return
+
+        _in_flight_image_pulls[key] = []
+        self._is_in_flight_leader = True
+
         headers = {}
 
         if self.email:
@@ -134,12 +874,12 @@ class AsyncImagePull(AsyncAction):
 
         request = HTTPRequest(
             '/images/create?fromImage=%s' % self.docker_image,
+            endpoint=self.endpoint,
             method='POST',
             headers=headers,
             allow_nonstandard_methods=True,
             streaming_callback=self._pull_on_chunk)
-        http_client = tornado.httpclient.AsyncHTTPClient()
-        http_client.fetch(request, callback=self._pull_on_http_client_fetch_done)
+        self.bulkhead_fetch(BULKHEAD_PULL, request, self._pull_on_http_client_fetch_done)
 
     def _pull_on_chunk(self, chunk):
         _logger.info(chunk.strip())
@@ -149,9 +889,9 @@ class AsyncImagePull(AsyncAction):
 
         request = HTTPRequest(
             '/images/json?filter=%s' % self.docker_image.split(':')[0],
+            endpoint=self.endpoint,
             method='GET')
-        http_client = tornado.httpclient.AsyncHTTPClient()
-        http_client.fetch(request, callback=self._images_on_http_client_fetch_done)
+        self.bulkhead_fetch(BULKHEAD_PULL, request, self._images_on_http_client_fetch_done)
 
     def _images_on_http_client_fetch_done(self, response):
         self.write_http_client_response_to_log(response)
@@ -169,29 +909,68 @@ class AsyncImagePull(AsyncAction):
 
         self._call_callback(type(self).PFD_IMAGE_NOT_FOUND)
 
+    def _in_flight_key(self):
+        return (self.endpoint, self.docker_image, self.email, self.username, self.password)
+
     def _call_callback(self, pull_failure_detail):
         assert self._callback is not None
         assert self.pull_failure_detail is None
+
+        followers = []
+        if self._is_in_flight_leader:
+            followers = _in_flight_image_pulls.pop(self._in_flight_key(), [])
+            self._is_in_flight_leader = False
+
         self.pull_failure_detail = pull_failure_detail
+        metrics.metrics.count_failure_detail(type(self), 'PFD', self.pull_failure_detail)
         is_ok = not bool(self.pull_failure_detail & type(self).PFD_ERROR)
         is_image_found = self.pull_failure_detail != type(self).PFD_IMAGE_NOT_FOUND if is_ok else None
-        self._callback(is_ok, is_image_found, self)
-        self._callback = None
+
+        if is_ok:
+            if is_image_found:
+                mark_image_present(self.docker_image, self.email, self.username, self.password, self.endpoint)
+            else:
+                invalidate_image(self.docker_image, self.endpoint)
+
+        # followers are called back even if the leader's (or an earlier
+        # follower's) callback raises - they're no longer in
+        # _in_flight_image_pulls so nothing else would ever call them back
+        try:
+            self._callback(is_ok, is_image_found, self)
+        finally:
+            self._callback = None
+            self._call_followers(followers, pull_failure_detail)
+
+    def _call_followers(self, followers, pull_failure_detail):
+        if not followers:
+            return
+        try:
+            followers[0]._call_callback(pull_failure_detail)
+        finally:
+            self._call_followers(followers[1:], pull_failure_detail)
 
 
 class AsyncContainerCreate(AsyncAction):
-    """Async'ly create a container."""
+    """Async'ly create a container.
+
+    Each container is labeled with LABEL_INSTANCE, LABEL_CID (if
+    ```cid``` is supplied), LABEL_CREATED and LABEL_TASK_TEMPLATE (if
+    ```task_template``` is supplied).
+    """
 
     # CFD = Create Failure Details
     CFD_OK = 0x0000
     CFD_ERROR = 0x0080
     CFD_ERROR_CREATING_CONTAINER = CFD_ERROR | 0x0001
+    CFD_IMAGE_NOT_FOUND = CFD_ERROR | 0x0002
 
-    def __init__(self, docker_image, cmd, async_state=None):
-        AsyncAction.__init__(self, async_state)
+    def __init__(self, docker_image, cmd, async_state=None, cid=None, endpoint=None, task_template=None):
+        AsyncAction.__init__(self, async_state, endpoint)
 
         self.docker_image = docker_image
         self.cmd = cmd
+        self.cid = cid
+        self.task_template = task_template
 
         self.create_failure_detail = None
 
@@ -201,9 +980,19 @@ class AsyncContainerCreate(AsyncAction):
         assert self._callback is None
         self._callback = callback
 
+        labels = {
+            LABEL_INSTANCE: instance_id,
+            LABEL_CREATED: str(int(time.time())),
+        }
+        if self.cid:
+            labels[LABEL_CID] = self.cid
+        if self.task_template:
+            labels[LABEL_TASK_TEMPLATE] = self.task_template
+
         body = {
             'Image': self.docker_image,
             'Cmd': self.cmd,
+            'Labels': labels,
             'LogConfig': {
                 'Type': 'json-file',
                 'Config': {},
@@ -216,17 +1005,19 @@ class AsyncContainerCreate(AsyncAction):
 
         request = HTTPRequest(
             '/containers/create',
+            endpoint=self.endpoint,
             method='POST',
             headers=tornado.httputil.HTTPHeaders(headers),
             body=json.dumps(body))
-        http_client = tornado.httpclient.AsyncHTTPClient()
-        http_client.fetch(
-            request,
-            callback=self._on_create_container_http_client_fetch_done)
+        self.bulkhead_fetch(BULKHEAD_CREATE, request, self._on_create_container_http_client_fetch_done)
 
     def _on_create_container_http_client_fetch_done(self, response):
         self.write_http_client_response_to_log(response)
 
+        if response.code == httplib.NOT_FOUND:
+            self._call_callback(type(self).CFD_IMAGE_NOT_FOUND)
+            return
+
         if response.code != httplib.CREATED:
             self._call_callback(type(self).CFD_ERROR_CREATING_CONTAINER)
             return
@@ -238,6 +1029,7 @@ class AsyncContainerCreate(AsyncAction):
         assert self._callback is not None
         assert self.create_failure_detail is None
         self.create_failure_detail = create_failure_detail
+        metrics.metrics.count_failure_detail(type(self), 'CFD', self.create_failure_detail)
         is_ok = not bool(self.create_failure_detail & type(self).CFD_ERROR)
         self._callback(is_ok, container_id, self)
         self._callback = None
@@ -251,8 +1043,8 @@ class AsyncContainerStart(AsyncAction):
     SFD_ERROR = 0x0080
     SFD_ERROR_STARTING_CONTAINER = SFD_ERROR | 0x0001
 
-    def __init__(self, container_id, async_state=None):
-        AsyncAction.__init__(self, async_state)
+    def __init__(self, container_id, async_state=None, endpoint=None):
+        AsyncAction.__init__(self, async_state, endpoint)
 
         self.container_id = container_id
 
@@ -266,10 +1058,10 @@ class AsyncContainerStart(AsyncAction):
 
         request = HTTPRequest(
             '/containers/%s/start' % self.container_id,
+            endpoint=self.endpoint,
             method='POST',
             allow_nonstandard_methods=True)
-        http_client = tornado.httpclient.AsyncHTTPClient()
-        http_client.fetch(request, callback=self._on_http_client_fetch_done)
+        self.bulkhead_fetch(BULKHEAD_CREATE, request, self._on_http_client_fetch_done)
 
     def _on_http_client_fetch_done(self, response):
         self.write_http_client_response_to_log(response)
@@ -284,11 +1076,62 @@ class AsyncContainerStart(AsyncAction):
         assert self._callback is not None
         assert self.start_failure_detail is None
         self.start_failure_detail = start_failure_detail
+        metrics.metrics.count_failure_detail(type(self), 'SFD', self.start_failure_detail)
         is_ok = not bool(self.start_failure_detail & type(self).SFD_ERROR)
         self._callback(is_ok, self)
         self._callback = None
 
 
+class AsyncContainerKill(AsyncAction):
+    """Async'ly kill a running container."""
+
+    # KFD = Kill Failure Details
+    KFD_OK = 0x0000
+    KFD_ERROR = 0x0080
+    KFD_ERROR_KILLING_CONTAINER = KFD_ERROR | 0x0001
+
+    def __init__(self, container_id, async_state=None, endpoint=None):
+        AsyncAction.__init__(self, async_state, endpoint)
+
+        self.container_id = container_id
+
+        self.kill_failure_detail = None
+
+        self._callback = None
+
+    def kill(self, callback):
+        assert self._callback is None
+        self._callback = callback
+
+        # kills have their own bulkhead so a backlog of creates or of the
+        # container reaper's and container sweeper's deletes can't delay
+        # stopping a container which is holding a task slot
+        request = HTTPRequest(
+            '/containers/%s/kill' % self.container_id,
+            endpoint=self.endpoint,
+            method='POST',
+            allow_nonstandard_methods=True)
+        self.bulkhead_fetch(BULKHEAD_KILL, request, self._on_http_client_fetch_done)
+
+    def _on_http_client_fetch_done(self, response):
+        self.write_http_client_response_to_log(response)
+
+        if response.code != httplib.NO_CONTENT:
+            self._call_callback(type(self).KFD_ERROR_KILLING_CONTAINER)
+            return
+
+        self._call_callback(type(self).KFD_OK)
+
+    def _call_callback(self, kill_failure_detail):
+        assert self._callback is not None
+        assert self.kill_failure_detail is None
+        self.kill_failure_detail = kill_failure_detail
+        metrics.metrics.count_failure_detail(type(self), 'KFD', self.kill_failure_detail)
+        is_ok = not bool(self.kill_failure_detail & type(self).KFD_ERROR)
+        self._callback(is_ok, self)
+        self._callback = None
+
+
 class AsyncContainerDelete(AsyncAction):
     """Async'ly delete a container."""
 
@@ -296,11 +1139,13 @@ class AsyncContainerDelete(AsyncAction):
     DFD_OK = 0x0000
     DFD_ERROR = 0x0080
     DFD_ERROR_DELETING_CONTAINER = DFD_ERROR | 0x0001
+    DFD_CONTAINER_NOT_FOUND = 0x0002
 
-    def __init__(self, container_id, async_state=None):
-        AsyncAction.__init__(self, async_state)
+    def __init__(self, container_id, async_state=None, force=False, endpoint=None):
+        AsyncAction.__init__(self, async_state, endpoint)
 
         self.container_id = container_id
+        self.force = force
 
         self.delete_failure_detail = None
 
@@ -311,16 +1156,19 @@ class AsyncContainerDelete(AsyncAction):
         self._callback = callback
 
         request = HTTPRequest(
-            '/containers/%s' % self.container_id,
+            '/containers/%s?force=%d' % (self.container_id, 1 if self.force else 0),
+            endpoint=self.endpoint,
             method='DELETE')
-        http_client = tornado.httpclient.AsyncHTTPClient()
-        http_client.fetch(
-            request,
-            callback=self._on_http_client_fetch_done)
+        self.bulkhead_fetch(BULKHEAD_DELETE, request, self._on_http_client_fetch_done)
 
     def _on_http_client_fetch_done(self, response):
         self.write_http_client_response_to_log(response)
 
+        # a container which doesn't exist is as deleted as it's going to get
+        if response.code == httplib.NOT_FOUND:
+            self._call_callback(type(self).DFD_CONTAINER_NOT_FOUND)
+            return
+
         if response.code != httplib.NO_CONTENT:
             self._call_callback(type(self).DFD_ERROR_DELETING_CONTAINER)
             return
@@ -331,14 +1179,68 @@ class AsyncContainerDelete(AsyncAction):
         assert self._callback is not None
         assert self.delete_failure_detail is None
         self.delete_failure_detail = delete_failure_detail
+        metrics.metrics.count_failure_detail(type(self), 'DFD', self.delete_failure_detail)
         is_ok = not bool(self.delete_failure_detail & type(self).DFD_ERROR)
         self._callback(is_ok, self)
         self._callback = None
 
 
+class AsyncContainerList(AsyncAction):
+    """Async'ly list all containers (running or not) with a label."""
+
+    # LFD = List Failure Details
+    LFD_OK = 0x0000
+    LFD_ERROR = 0x0080
+    LFD_ERROR_LISTING_CONTAINERS = LFD_ERROR | 0x0001
+
+    def __init__(self, label, async_state=None, endpoint=None):
+        AsyncAction.__init__(self, async_state, endpoint)
+
+        self.label = label
+
+        self.list_failure_detail = None
+
+        self._callback = None
+
+    def list(self, callback):
+        assert self._callback is None
+        self._callback = callback
+
+        query_string = {
+            'all': 1,
+            'filters': json.dumps({'label': [self.label]}),
+        }
+        request = HTTPRequest(
+            '/containers/json?%s' % urllib.urlencode(query_string),
+            endpoint=self.endpoint,
+            method='GET')
+        self.bulkhead_fetch(BULKHEAD_DELETE, request, self._on_http_client_fetch_done)
+
+    def _on_http_client_fetch_done(self, response):
+        self.write_http_client_response_to_log(response)
+
+        if response.code != httplib.OK:
+            self._call_callback(type(self).LFD_ERROR_LISTING_CONTAINERS)
+            return
+
+        self._call_callback(type(self).LFD_OK, json.loads(response.body))
+
+    def _call_callback(self, list_failure_detail, containers=None):
+        assert self._callback is not None
+        assert self.list_failure_detail is None
+        self.list_failure_detail = list_failure_detail
+        metrics.metrics.count_failure_detail(type(self), 'LFD', self.list_failure_detail)
+        is_ok = not bool(self.list_failure_detail & type(self).LFD_ERROR)
+        self._callback(is_ok, containers, self)
+        self._callback = None
+
+
 class AsyncContainerStatus(AsyncAction):
     """Async'ly wait for a container to exit and return the
     container's status.
+
+    See ```container_status_mode``` for a description of how
+    the wait is performed.
     """
 
     # SFD = Status Failure Details
@@ -347,34 +1249,110 @@ class AsyncContainerStatus(AsyncAction):
     SFD_ERROR_FETCHING_CONTAINER_STATUS = SFD_ERROR | 0x0001
     SFD_WAITED_TOO_LONG = SFD_ERROR | 0x0002
 
-    def __init__(self, container_id, async_state=None):
-        AsyncAction.__init__(self, async_state)
+    def __init__(self, container_id, async_state=None, endpoint=None):
+        AsyncAction.__init__(self, async_state, endpoint)
 
         self.container_id = container_id
 
         self.fetch_failure_detail = None
 
         self._wait_times_in_ms = [250] * 4 * 10 + [1000] * 50 + [2000] * 30
+        self._event_stream = None
+        self._is_fetching = False
         self._callback = None
 
     def fetch(self, callback):
         assert self._callback is None
         self._callback = callback
 
+        if container_status_mode == CONTAINER_STATUS_MODE_EVENTS:
+            self._watch()
+        elif container_status_mode == CONTAINER_STATUS_MODE_WAIT:
+            self._wait()
+        else:
+            self._fetch()
+
+    def _watch(self):
+        self._event_stream = event_stream(self.endpoint)
+        self._event_stream.register(self.container_id, self._on_event)
+
+        # the container may have exited before registering for
+        # the container's events so check the container's status
         self._fetch()
 
+    def _stop_watching(self):
+        if self._event_stream is not None:
+            self._event_stream.unregister(self.container_id, self._on_event)
+            self._event_stream = None
+
+    def _on_event(self, event):
+        if event is None:
+            self._event_stream = None
+            fmt = 'lost events stream while waiting for container %s - falling back to polling'
+            _logger.warning(fmt, self.container_id)
+            if not self._is_fetching:
+                self._fetch()
+            return
+
+        if event['action'] not in [EventStream.EVENT_ACTION_DIE, EventStream.EVENT_ACTION_DESTROY]:
+            return
+
+        # Docker Remote API versions before 1.22 don't include the
+        # exit code in die events so fall back to fetching the
+        # container's status
+        exit_code = event['attributes'].get('exitCode', None)
+        if exit_code is None:
+            self._stop_watching()
+            if not self._is_fetching:
+                self._fetch()
+            return
+
+        self._call_callback(type(self).SFD_OK, int(exit_code))
+
+    def _wait(self):
+        # like following a container's logs, waiting holds a connection
+        # open until the container exits so the request mustn't time out -
+        # a timeout would fall back to polling (which gives up long before
+        # task_max_timeout) and count toward tripping the docker host's
+        # circuit breaker
+        request = HTTPRequest(
+            '/containers/%s/wait' % self.container_id,
+            endpoint=self.endpoint,
+            method='POST',
+            allow_nonstandard_methods=True,
+            request_timeout=0)
+        self.bulkhead_fetch(BULKHEAD_STATUS, request, self._on_wait_http_client_fetch_done)
+
+    def _on_wait_http_client_fetch_done(self, response):
+        self.write_http_client_response_to_log(response)
+
+        if response.code != httplib.OK:
+            fmt = 'waiting for container %s failed (%d) - falling back to polling'
+            _logger.warning(fmt, self.container_id, response.code)
+            self._fetch()
+            return
+
+        response_body = json.loads(response.body)
+        self._call_callback(type(self).SFD_OK, response_body['StatusCode'])
+
     def _fetch(self):
+        self._is_fetching = True
         request = HTTPRequest(
             '/containers/%s/json' % self.container_id,
+            endpoint=self.endpoint,
             method='GET')
-        http_client = tornado.httpclient.AsyncHTTPClient()
-        http_client.fetch(
-            request,
-            callback=self._on_http_client_fetch_done)
+        self.bulkhead_fetch(BULKHEAD_STATUS, request, self._on_http_client_fetch_done)
 
     def _on_http_client_fetch_done(self, response):
+        self._is_fetching = False
+
         self.write_http_client_response_to_log(response)
 
+        if self._callback is None:
+            # an event reported the container's exit while
+            # the container's status was being fetched
+            return
+
         if response.code != httplib.OK:
             self._call_callback(type(self).SFD_ERROR_FETCHING_CONTAINER_STATUS)
             return
@@ -385,6 +1363,10 @@ class AsyncContainerStatus(AsyncAction):
             self._call_callback(type(self).SFD_OK, state['ExitCode'])
             return
 
+        if self._event_stream is not None:
+            # the container's die event will report the container's exit
+            return
+
         if not self._wait_times_in_ms:
             self._call_callback(type(self).SFD_WAITED_TOO_LONG)
             return
@@ -396,12 +1378,88 @@ class AsyncContainerStatus(AsyncAction):
     def _call_callback(self, fetch_failure_detail, exit_code=None):
         assert self._callback is not None
         assert self.fetch_failure_detail is None
+        self._stop_watching()
         self.fetch_failure_detail = fetch_failure_detail
+        metrics.metrics.count_failure_detail(type(self), 'SFD', self.fetch_failure_detail)
         is_ok = not bool(self.fetch_failure_detail & type(self).SFD_ERROR)
         self._callback(is_ok, exit_code, self)
         self._callback = None
 
 
+class StreamDemuxer(object):
+    """When a container isn't using a TTY the Docker Remote API
+    multiplexes a container's stdout and stderr into a single stream.
+    Each frame in the multiplexed stream starts with an 8-byte header
+
+        [STREAM_TYPE, 0, 0, 0, SIZE1, SIZE2, SIZE3, SIZE4]
+
+    where STREAM_TYPE is 0 (stdin), 1 (stdout) or 2 (stderr) and
+    SIZE1-4 are the size of the frame's payload as a big endian
+    unsigned 32-bit integer.
+
+    See https://docs.docker.com/engine/api/v1.24/#attach-to-a-container
+
+    Chunks of the multiplexed stream are passed to feed() as they
+    arrive and feed() splits the chunks into frames. Frames don't
+    need to align with chunks. If ```frame_callback``` is supplied
+    it's called with each frame's stream type and payload otherwise
+    payloads are accumulated and available from ```stdout``` and
+    ```stderr```.
+    """
+
+    STDIN = 0
+    STDOUT = 1
+    STDERR = 2
+
+    _header_format = '>BxxxL'
+
+    _header_size = struct.calcsize(_header_format)
+
+    def __init__(self, frame_callback=None):
+        object.__init__(self)
+
+        self.frame_callback = frame_callback
+
+        self._buffer = ''
+        self._payloads = {
+            type(self).STDIN: [],
+            type(self).STDOUT: [],
+            type(self).STDERR: [],
+        }
+
+    @property
+    def stdout(self):
+        return ''.join(self._payloads[type(self).STDOUT])
+
+    @property
+    def stderr(self):
+        return ''.join(self._payloads[type(self).STDERR])
+
+    @property
+    def is_at_frame_boundary(self):
+        """False if the stream ended part way through a frame."""
+        return not self._buffer
+
+    def feed(self, chunk):
+        self._buffer += chunk
+
+        offset = 0
+        header_size = type(self)._header_size
+        while header_size <= len(self._buffer) - offset:
+            (stream_type, size) = struct.unpack_from(type(self)._header_format, self._buffer, offset)
+            if len(self._buffer) - offset - header_size < size:
+                break
+            payload = self._buffer[offset + header_size:offset + header_size + size]
+            offset += header_size + size
+
+            if self.frame_callback:
+                self.frame_callback(stream_type, payload)
+            else:
+                self._payloads.setdefault(stream_type, []).append(payload)
+
+        self._buffer = self._buffer[offset:]
+
+
 class AsyncContainerLogs(AsyncAction):
     """Async'ly fetch a container's stdout and stderr.
 
@@ -409,9 +1467,14 @@ class AsyncContainerLogs(AsyncAction):
 
         https://docs.docker.com/engine/reference/api/docker_remote_api_v1.18/#get-container-logs
 
-    The implementation of this method is more complex that it should be
-    because I was too lazy to figure out how to interpret the 8-byte header
-    in the response.
+    stdout and stderr are fetched with a single request and
+    the response is demultiplexed using StreamDemuxer.
+
+    If ```follow``` is True the logs are streamed until the container
+    exits. If ```frame_callback``` is supplied it's called with each
+    frame as the frame arrives (see StreamDemuxer) and the payloads
+    aren't accumulated so stdout and stderr are passed to
+    the callback as None.
 
     content type = application/octet-stream
     see https://github.com/docker/docker/issues/8223
@@ -424,35 +1487,40 @@ class AsyncContainerLogs(AsyncAction):
     FFD_CONTAINER_NOT_FOUND = FFD_SOFT_ERROR | 0x0001
     FFD_ERROR_FETCHING_CONTAINER_LOGS = FFD_ERROR | 0x0002
 
-    def __init__(self, container_id, async_state=None):
-        AsyncAction.__init__(self, async_state)
+    def __init__(self, container_id, async_state=None, follow=False, frame_callback=None, endpoint=None):
+        AsyncAction.__init__(self, async_state, endpoint)
 
         self.container_id = container_id
+        self.follow = follow
+        self.frame_callback = frame_callback
 
         self.fetch_failure_detail = None
 
+        self._demuxer = None
         self._callback = None
-        self._stdout = None
-        self._stderr = None
 
     def fetch(self, callback):
         assert self._callback is None
         self._callback = callback
 
-        self._fetch_logs(True, False)
-        self._fetch_logs(False, True)
+        self._demuxer = StreamDemuxer(self.frame_callback)
 
-    def _fetch_logs(self, stdout, stderr):
-        path = '/containers/%s/logs?stdout=%d&stderr=%d&timestamps=0&tail=all' % (
+        path = '/containers/%s/logs?stdout=1&stderr=1&timestamps=0&tail=all&follow=%d' % (
             self.container_id,
-            1 if stdout else 0,
-            1 if stderr else 0,
-        )
-        request = HTTPRequest(path, method='GET')
-        http_client = tornado.httpclient.AsyncHTTPClient()
-        http_client.fetch(
-            request,
-            callback=self._on_http_client_fetch_done)
+            self.follow)
+        # following a container's logs holds a connection open until the
+        # container exits so the request mustn't time out - the task's own
+        # timeout kills the container which ends the request
+        kwargs = {'request_timeout': 0} if self.follow else {}
+        request = HTTPRequest(
+            path,
+            endpoint=self.endpoint,
+            method='GET',
+            streaming_callback=self._demuxer.feed,
+            **kwargs)
+        # like /containers/{id}/wait following a container's logs is a status request
+        bulkhead = BULKHEAD_STATUS if self.follow else BULKHEAD_LOGS
+        self.bulkhead_fetch(bulkhead, request, self._on_http_client_fetch_done)
 
     def _on_http_client_fetch_done(self, response):
         self.write_http_client_response_to_log(response)
@@ -465,21 +1533,23 @@ class AsyncContainerLogs(AsyncAction):
             self._call_callback(type(self).FFD_ERROR_FETCHING_CONTAINER_LOGS)
             return
 
-        self._call_callback(
-            type(self).FFD_OK,
-            response.body[8:] if 'stdout=1' in response.effective_url else None,
-            response.body[8:] if 'stderr=1' in response.effective_url else None)
+        if not self._demuxer.is_at_frame_boundary:
+            _logger.warning('logs for container %s ended part way through a frame', self.container_id)
 
-    def _call_callback(self, fetch_failure_detail, stdout=None, stderr=None):
-        if self._callback is None:
+        if self.frame_callback:
+            self._call_callback(type(self).FFD_OK)
             return
 
-        self._stdout = stdout if stdout is not None else self._stdout
-        self._stderr = stderr if stderr is not None else self._stderr
+        self._call_callback(
+            type(self).FFD_OK,
+            self._demuxer.stdout,
+            self._demuxer.stderr)
 
+    def _call_callback(self, fetch_failure_detail, stdout=None, stderr=None):
+        assert self._callback is not None
+        assert self.fetch_failure_detail is None
         self.fetch_failure_detail = fetch_failure_detail
+        metrics.metrics.count_failure_detail(type(self), 'FFD', self.fetch_failure_detail)
         is_ok = not bool(self.fetch_failure_detail & type(self).FFD_ERROR)
-        is_soft_error = bool(self.fetch_failure_detail & type(self).FFD_SOFT_ERROR)
-        if not is_ok or is_soft_error or (self._stdout is not None and self._stderr is not None):
-            self._callback(is_ok, self._stdout, self._stderr, self)
-            self._callback = None
+        self._callback(is_ok, stdout, stderr, self)
+        self._callback = None
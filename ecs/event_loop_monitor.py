@@ -0,0 +1,125 @@
+"""This module contains the event loop monitor which measures how late
+the service's single tornado IOLoop runs callbacks (the event loop's lag)
+and detects callbacks which block the event loop - a large base64 encode,
+json dump or schema validation delays every in-flight task.
+"""
+
+import collections
+import logging
+import math
+import traceback
+
+import tornado.ioloop
+
+_logger = logging.getLogger(__name__)
+
+# time (in milliseconds) between measurements of the event loop's
+# lag - 0 disables the event loop monitor
+event_loop_monitor_interval = 500
+
+# time (in milliseconds) an iteration of the event loop can run before
+# the stack of the callback blocking the event loop is logged - 0 disables
+# slow callback detection
+event_loop_slow_callback_threshold = 100
+
+# comprehensive health checks report the event loop as unhealthy
+# when the 99th percentile of the event loop's lag exceeds this
+# time (in milliseconds)
+event_loop_lag_threshold = 250
+
+# percentiles of the event loop's lag reported by the event loop monitor
+PERCENTILES = (50, 90, 99)
+
+
+class EventLoopMonitor(object):
+    """Every ```event_loop_monitor_interval``` ms a timer is scheduled on
+    the event loop and the difference between when the timer was due and
+    when it actually ran is recorded as the event loop's lag. Lag
+    percentiles are calculated over the most recent measurements.
+
+    Slow callbacks are detected using tornado's blocking signal threshold
+    (see ```IOLoop.set_blocking_signal_threshold()```) - when an iteration
+    of the event loop runs for more than ```event_loop_slow_callback_threshold```
+    ms a SIGALRM interrupts the blocking callback and its stack is logged.
+    """
+
+    # number of lag measurements used to calculate percentiles -
+    # the last minute with the default interval
+    _number_lags = 120
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.number_slow_callbacks = 0
+        self.lags = collections.deque(maxlen=type(self)._number_lags)
+
+        self._io_loop = None
+        self._timeout_handle = None
+        self._due_at = None
+        self._is_detecting_slow_callbacks = False
+
+    @property
+    def is_started(self):
+        return self._io_loop is not None
+
+    @property
+    def is_healthy(self):
+        return self.percentile(99) <= event_loop_lag_threshold / 1000.0
+
+    def percentile(self, percentile):
+        """The ```percentile``` percentile (using the nearest rank method)
+        of the event loop's recent lag measurements in seconds - 0.0 if
+        the lag hasn't been measured.
+        """
+        if not self.lags:
+            return 0.0
+        lags = sorted(self.lags)
+        rank = int(math.ceil(percentile / 100.0 * len(lags)))
+        return lags[max(0, rank - 1)]
+
+    def percentiles(self):
+        """Returns a list of (percentile, lag) tuples for each of ```PERCENTILES```."""
+        return [(percentile, self.percentile(percentile)) for percentile in PERCENTILES]
+
+    def start(self):
+        if self._io_loop or event_loop_monitor_interval <= 0:
+            return
+
+        self._io_loop = tornado.ioloop.IOLoop.current()
+
+        if 0 < event_loop_slow_callback_threshold:
+            self._io_loop.set_blocking_signal_threshold(
+                event_loop_slow_callback_threshold / 1000.0,
+                self._on_slow_callback)
+            self._is_detecting_slow_callbacks = True
+
+        self._schedule()
+
+    def stop(self):
+        if not self._io_loop:
+            return
+
+        self._io_loop.remove_timeout(self._timeout_handle)
+
+        if self._is_detecting_slow_callbacks:
+            self._io_loop.set_blocking_signal_threshold(None, None)
+            self._is_detecting_slow_callbacks = False
+
+        self._io_loop = None
+        self._timeout_handle = None
+
+    def _schedule(self):
+        self._due_at = self._io_loop.time() + event_loop_monitor_interval / 1000.0
+        self._timeout_handle = self._io_loop.add_timeout(self._due_at, self._on_timeout)
+
+    def _on_timeout(self):
+        self.lags.append(max(0.0, self._io_loop.time() - self._due_at))
+        self._schedule()
+
+    def _on_slow_callback(self, signal_number, frame):
+        self.number_slow_callbacks += 1
+        fmt = 'event loop blocked for more than %d ms in\n%s'
+        _logger.warning(fmt, event_loop_slow_callback_threshold, ''.join(traceback.format_stack(frame)))
+
+
+event_loop_monitor = EventLoopMonitor()
@@ -16,3 +16,15 @@ def _load_jsonschema(schema_name):
 create_tasks_request = _load_jsonschema('create_tasks_request')
 
 create_tasks_response = _load_jsonschema('create_tasks_response')
+
+# each task in a batch is validated against the create tasks request schema
+create_batch_tasks_request = _load_jsonschema('create_batch_tasks_request')
+create_batch_tasks_request['items'] = create_tasks_request
+
+create_tasks_async_response = _load_jsonschema('create_tasks_async_response')
+
+get_task_response = _load_jsonschema('get_task_response')
+
+# each message sent on the tasks websocket wraps a create tasks request
+websocket_task_request = _load_jsonschema('websocket_task_request')
+websocket_task_request['properties']['task'] = create_tasks_request
@@ -1,3 +1,4 @@
+import json
 import logging
 import optparse
 import time
@@ -8,11 +9,20 @@ import tornado.httpserver
 import tornado.web
 
 import ecs
+from ecs.request_handlers import BatchTasksRequestHandler
 from ecs.request_handlers import HealthRequestHandler
+from ecs.request_handlers import MetricsRequestHandler
 from ecs.request_handlers import NoOpRequestHandler
+from ecs.request_handlers import TaskRequestHandler
 from ecs.request_handlers import TasksRequestHandler
+from ecs.request_handlers import TasksWebSocketHandler
 from ecs.request_handlers import VersionRequestHandler
+from ecs import async_actions
 from ecs import async_docker_remote_api
+from ecs import event_loop_monitor
+from ecs import metrics
+from ecs import task_scheduler
+from ecs import task_store
 
 _logger = logging.getLogger(__name__)
 
@@ -37,6 +47,20 @@ class _CommandLineParser(optparse.OptionParser):
             help=help)
 
 
+class Application(tornado.web.Application):
+    """Adds recording each http request's latency (see ```metrics```)
+    to tornado's logging of each http request.
+    """
+
+    def log_request(self, handler):
+        tornado.web.Application.log_request(self, handler)
+
+        metrics.metrics.observe_request(
+            getattr(handler, 'url_spec', None) or 'unknown',
+            handler.request.method,
+            handler.request.request_time())
+
+
 class Main(object):
     """This class implements the ecs mainline. Below is an example of
     how this mainline is expected to be used.
@@ -100,10 +124,25 @@ class Main(object):
         #
         # configure docker remote API
         #
-        async_docker_remote_api.docker_remote_api_endpoint = tor_async_util.Config.instance.get(
+        docker_remote_api_endpoints = tor_async_util.Config.instance.get(
             self.config_section,
             'docker_remote_api',
             'http://172.17.42.1:2375')
+        docker_remote_api_endpoints = [
+            endpoint.strip() for endpoint in docker_remote_api_endpoints.split(',') if endpoint.strip()
+        ]
+        async_docker_remote_api.docker_remote_api_endpoints = docker_remote_api_endpoints
+        async_docker_remote_api.docker_remote_api_endpoint = docker_remote_api_endpoints[0]
+
+        for endpoint in docker_remote_api_endpoints:
+            is_unix_socket_endpoint = async_docker_remote_api.is_unix_socket_endpoint(endpoint)
+            if is_unix_socket_endpoint and not async_docker_remote_api.is_unix_socket_supported():
+                msg = (
+                    'libcurl does not appear to support unix domain sockets '
+                    '(requires libcurl >= 7.40.0) so requests to the Docker '
+                    'Remote API on \'%s\' will fail'
+                )
+                _logger.warning(msg, endpoint)
 
         async_docker_remote_api.connect_timeout = tor_async_util.Config.instance.get_int(
             self.config_section,
@@ -115,6 +154,174 @@ class Main(object):
             'docker_remote_api_request_timeout',
             5 * 60 * 1000)
 
+        for bulkhead in async_docker_remote_api.BULKHEADS:
+            async_docker_remote_api.bulkhead_max_concurrency[bulkhead] = tor_async_util.Config.instance.get_int(
+                self.config_section,
+                'bulkhead_%s_max_concurrency' % bulkhead,
+                async_docker_remote_api.bulkhead_max_concurrency[bulkhead])
+
+        async_docker_remote_api.bulkhead_max_queue_depth = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'bulkhead_max_queue_depth',
+            async_docker_remote_api.bulkhead_max_queue_depth)
+
+        container_status_mode = tor_async_util.Config.instance.get(
+            self.config_section,
+            'docker_remote_api_container_status_mode',
+            async_docker_remote_api.CONTAINER_STATUS_MODE_WAIT)
+        if container_status_mode not in async_docker_remote_api.CONTAINER_STATUS_MODES:
+            msg = 'unknown container status mode \'%s\' - using \'%s\''
+            _logger.warning(msg, container_status_mode, async_docker_remote_api.CONTAINER_STATUS_MODE_WAIT)
+            container_status_mode = async_docker_remote_api.CONTAINER_STATUS_MODE_WAIT
+        async_docker_remote_api.container_status_mode = container_status_mode
+
+        async_docker_remote_api.image_cache_ttl = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'image_cache_ttl',
+            5 * 60 * 1000)
+
+        async_docker_remote_api.docker_host_load_bound = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'docker_host_load_bound',
+            async_docker_remote_api.docker_host_load_bound)
+
+        async_docker_remote_api.docker_host_failure_threshold = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'docker_host_failure_threshold',
+            async_docker_remote_api.docker_host_failure_threshold)
+
+        async_docker_remote_api.docker_host_probe_interval = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'docker_host_probe_interval',
+            async_docker_remote_api.docker_host_probe_interval)
+
+        #
+        # configure tasks ...
+        #
+        pull_policy = tor_async_util.Config.instance.get(
+            self.config_section,
+            'pull_policy',
+            async_actions.PULL_POLICY_ALWAYS)
+        if pull_policy not in async_actions.PULL_POLICIES:
+            msg = 'unknown pull policy \'%s\' - using \'%s\''
+            _logger.warning(msg, pull_policy, async_actions.PULL_POLICY_ALWAYS)
+            pull_policy = async_actions.PULL_POLICY_ALWAYS
+        async_actions.pull_policy = pull_policy
+
+        async_actions.task_max_timeout = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'task_max_timeout',
+            async_actions.task_max_timeout)
+
+        async_actions.container_reaper_max_concurrency = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'container_reaper_max_concurrency',
+            async_actions.container_reaper_max_concurrency)
+
+        async_actions.container_reaper_max_attempts = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'container_reaper_max_attempts',
+            async_actions.container_reaper_max_attempts)
+
+        async_actions.container_reaper_retry_delay = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'container_reaper_retry_delay',
+            async_actions.container_reaper_retry_delay)
+
+        async_actions.container_sweeper_interval = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'container_sweeper_interval',
+            async_actions.container_sweeper_interval)
+
+        async_actions.container_sweeper_min_age = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'container_sweeper_min_age',
+            async_actions.container_sweeper_min_age)
+
+        async_actions.container_sweeper_max_age = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'container_sweeper_max_age',
+            async_actions.container_sweeper_max_age)
+
+        async_actions.container_sweeper_batch_size = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'container_sweeper_batch_size',
+            async_actions.container_sweeper_batch_size)
+
+        async_actions.health_check_refresh_interval = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'health_check_refresh_interval',
+            async_actions.health_check_refresh_interval)
+
+        event_loop_monitor.event_loop_monitor_interval = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'event_loop_monitor_interval',
+            event_loop_monitor.event_loop_monitor_interval)
+
+        event_loop_monitor.event_loop_slow_callback_threshold = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'event_loop_slow_callback_threshold',
+            event_loop_monitor.event_loop_slow_callback_threshold)
+
+        event_loop_monitor.event_loop_lag_threshold = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'event_loop_lag_threshold',
+            event_loop_monitor.event_loop_lag_threshold)
+
+        async_actions.task_template_pool_size = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'task_template_pool_size',
+            async_actions.task_template_pool_size)
+
+        async_actions.task_template_refill_retry_delay = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'task_template_refill_retry_delay',
+            async_actions.task_template_refill_retry_delay)
+
+        self._configure_task_templates()
+
+        task_store.task_store_ttl = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'task_store_ttl',
+            task_store.task_store_ttl)
+
+        task_store.task_store_max_bytes = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'task_store_max_bytes',
+            task_store.task_store_max_bytes)
+
+        task_store.task_store_max_wait = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'task_store_max_wait',
+            task_store.task_store_max_wait)
+
+        task_scheduler.task_scheduler_max_concurrency = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'task_scheduler_max_concurrency',
+            task_scheduler.task_scheduler_max_concurrency)
+
+        task_scheduler.task_scheduler_max_queue_depth = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'task_scheduler_max_queue_depth',
+            task_scheduler.task_scheduler_max_queue_depth)
+
+        self._configure_task_scheduler_weights()
+
+        task_scheduler.task_scheduler_default_weight = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'task_scheduler_default_weight',
+            task_scheduler.task_scheduler_default_weight)
+
+        task_scheduler.task_scheduler_caller_header = tor_async_util.Config.instance.get(
+            self.config_section,
+            'task_scheduler_caller_header',
+            task_scheduler.task_scheduler_caller_header)
+
+        task_scheduler.task_scheduler_caller_ttl = tor_async_util.Config.instance.get_int(
+            self.config_section,
+            'task_scheduler_caller_ttl',
+            task_scheduler.task_scheduler_caller_ttl)
+
         #
         # configure tornado ...
         #
@@ -148,6 +355,56 @@ class Main(object):
         #
         tor_async_util.install_sigint_handler()
 
+    def _configure_task_templates(self):
+        """The ```task_templates``` option is a comma separated list of
+        task template names. Each task template is defined in its own
+        config section called ```<config section>:template:<name>```.
+        """
+        async_actions.task_templates.clear()
+
+        names = tor_async_util.Config.instance.get(self.config_section, 'task_templates', '')
+        for name in [name.strip() for name in names.split(',') if name.strip()]:
+            section = '%s:template:%s' % (self.config_section, name)
+
+            docker_image = tor_async_util.Config.instance.get(section, 'docker_image', None)
+            try:
+                cmd = json.loads(tor_async_util.Config.instance.get(section, 'cmd', 'null'))
+            except ValueError:
+                cmd = None
+            if not docker_image or not cmd:
+                msg = 'task template \'%s\' requires docker_image and cmd in section \'%s\' - ignoring template'
+                _logger.warning(msg, name, section)
+                continue
+
+            async_actions.task_templates[name] = async_actions.TaskTemplate(
+                name,
+                docker_image,
+                cmd,
+                tor_async_util.Config.instance.get(section, 'email', None),
+                tor_async_util.Config.instance.get(section, 'username', None),
+                tor_async_util.Config.instance.get(section, 'password', None),
+                tor_async_util.Config.instance.get_int(section, 'pool_size', None))
+
+    def _configure_task_scheduler_weights(self):
+        """The ```task_scheduler_weights``` option is a comma separated list
+        of ```<caller>:<weight>``` pairs where weight is a positive integer.
+        """
+        task_scheduler.task_scheduler_weights = {}
+
+        weights = tor_async_util.Config.instance.get(self.config_section, 'task_scheduler_weights', '')
+        for caller_and_weight in [pair.strip() for pair in weights.split(',') if pair.strip()]:
+            (caller, _, weight) = caller_and_weight.rpartition(':')
+            try:
+                weight = int(weight)
+            except ValueError:
+                weight = 0
+            if not caller.strip() or weight <= 0:
+                msg = 'task scheduler weight \'%s\' isn\'t <caller>:<positive integer> - ignoring weight'
+                _logger.warning(msg, caller_and_weight)
+                continue
+
+            task_scheduler.task_scheduler_weights[caller.strip()] = weight
+
     def listen(self):
         """Start Tornado listening for inbound requests.
 
@@ -159,6 +416,18 @@ class Main(object):
                 TasksRequestHandler.url_spec,
                 TasksRequestHandler
             ),
+            (
+                BatchTasksRequestHandler.url_spec,
+                BatchTasksRequestHandler
+            ),
+            (
+                TasksWebSocketHandler.url_spec,
+                TasksWebSocketHandler
+            ),
+            (
+                TaskRequestHandler.url_spec,
+                TaskRequestHandler
+            ),
             (
                 VersionRequestHandler.url_spec,
                 VersionRequestHandler
@@ -171,13 +440,17 @@ class Main(object):
                 HealthRequestHandler.url_spec,
                 HealthRequestHandler
             ),
+            (
+                MetricsRequestHandler.url_spec,
+                MetricsRequestHandler
+            ),
         ]
 
         settings = {
             'default_handler_class': tor_async_util.DefaultRequestHandler,
         }
 
-        app = tornado.web.Application(handlers=handlers, **settings)
+        app = Application(handlers=handlers, **settings)
 
         #
         # log a startup message - note this is done before
@@ -201,10 +474,44 @@ class Main(object):
             'address': self.address,
             'port': self.port,
             'logging_level': logging.getLevelName(logging.getLogger().getEffectiveLevel()),
-            'docker_remote_api': async_docker_remote_api.docker_remote_api_endpoint,
+            'docker_remote_api': ', '.join(async_docker_remote_api.docker_remote_api_endpoints),
         }
         _logger.info(fmt.format(**args))
 
+        #
+        # each docker host's Docker Remote API events stream is used to
+        # detect container exits and to invalidate the image presence cache
+        #
+        is_events_mode = async_docker_remote_api.container_status_mode == \
+            async_docker_remote_api.CONTAINER_STATUS_MODE_EVENTS
+        if is_events_mode or async_actions.pull_policy != async_actions.PULL_POLICY_ALWAYS:
+            for endpoint in async_docker_remote_api.docker_remote_api_endpoints:
+                async_docker_remote_api.event_stream(endpoint).start()
+
+        #
+        # periodically delete containers orphaned by previous ecs
+        # processes or by failures the container reaper gave up on
+        #
+        async_actions.container_sweeper.start()
+
+        #
+        # keep the Docker Remote API's health fresh in the background
+        # so comprehensive health checks are cheap
+        #
+        async_actions.health_check_cache.start()
+
+        #
+        # measure the event loop's lag and log the stacks of
+        # callbacks which block the event loop
+        #
+        event_loop_monitor.event_loop_monitor.start()
+
+        #
+        # start filling task templates' container pools
+        #
+        for task_template in async_actions.task_templates.values():
+            task_template.start()
+
         #
         # start listening for and processing requests ...
         #
@@ -0,0 +1,193 @@
+"""This module contains the service's metrics - latency histograms
+and counters - which are reported, along with gauges, by the /_metrics
+endpoint in Prometheus' text exposition format.
+"""
+
+import bisect
+
+# content type of Prometheus' text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# upper bounds (in seconds) of the buckets of every latency histogram
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+)
+
+# phases of running a task - see AsyncEndToEndContainerRunner
+PHASE_PULL = 'pull'
+PHASE_CREATE = 'create'
+PHASE_START = 'start'
+PHASE_WAIT = 'wait'
+PHASE_LOGS = 'logs'
+PHASE_DELETE = 'delete'
+
+PHASES = [
+    PHASE_PULL,
+    PHASE_CREATE,
+    PHASE_START,
+    PHASE_WAIT,
+    PHASE_LOGS,
+    PHASE_DELETE,
+]
+
+
+class Histogram(object):
+    """A histogram with fixed buckets (```LATENCY_BUCKETS``` by default).
+    The bucket counts are kept in an array allocated when the histogram
+    is created so observing a sample only increments numbers.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        object.__init__(self)
+
+        self.buckets = buckets
+
+        # the last count is for samples larger than the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+
+        cumulative_count = 0
+        for (bucket, count) in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative_count += count
+            bucket_labels = dict(labels, le=str(bucket))
+            lines.append('%s_bucket%s %d' % (name, _render_labels(bucket_labels), cumulative_count))
+
+        lines.append('%s_sum%s %s' % (name, _render_labels(labels), repr(self.sum)))
+        lines.append('%s_count%s %d' % (name, _render_labels(labels), self.count))
+
+        return lines
+
+
+class Metrics(object):
+    """Latency histograms for each phase of running a task and for
+    each http endpoint along with counters of every failure detail
+    produced by the service's async actions.
+    """
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.phase_durations = {phase: Histogram() for phase in PHASES}
+
+        # histograms keyed by (url spec, method)
+        self.request_durations = {}
+
+        # counts keyed by (async action class, failure detail prefix, failure detail)
+        self.failure_details = {}
+
+    def observe_phase(self, phase, duration):
+        """Record a task spending ```duration``` seconds in ```phase```."""
+        self.phase_durations[phase].observe(duration)
+
+    def observe_request(self, url_spec, method, duration):
+        """Record an http request to the endpoint described by ```url_spec```
+        taking ```duration``` seconds.
+        """
+        key = (url_spec, method)
+        histogram = self.request_durations.get(key, None)
+        if histogram is None:
+            histogram = Histogram()
+            self.request_durations[key] = histogram
+        histogram.observe(duration)
+
+    def count_failure_detail(self, async_action_class, prefix, failure_detail):
+        """Record an instance of ```async_action_class``` finishing with
+        ```failure_detail``` - ```prefix``` is the prefix of the names of
+        ```async_action_class```'s failure detail constants (ex CFD).
+        """
+        key = (async_action_class, prefix, failure_detail)
+        self.failure_details[key] = self.failure_details.get(key, 0) + 1
+
+    def render(self, gauges=None, histograms=None):
+        """Render all metrics plus ```gauges``` (a list of (name, help,
+        samples) tuples where samples is a list of (labels, value)
+        tuples) and ```histograms``` (a list of (name, help, samples)
+        tuples where samples is a list of (labels, Histogram) tuples)
+        in Prometheus' text exposition format.
+        """
+        lines = []
+
+        name = 'ecs_task_phase_duration_seconds'
+        lines.append('# HELP %s Time spent in each phase of running a task.' % name)
+        lines.append('# TYPE %s histogram' % name)
+        for phase in PHASES:
+            lines.extend(self.phase_durations[phase].render(name, {'phase': phase}))
+
+        name = 'ecs_http_request_duration_seconds'
+        lines.append('# HELP %s Time taken to respond to http requests.' % name)
+        lines.append('# TYPE %s histogram' % name)
+        for ((url_spec, method), histogram) in sorted(self.request_durations.items()):
+            lines.extend(histogram.render(name, {'endpoint': url_spec, 'method': method}))
+
+        name = 'ecs_failure_details_total'
+        lines.append('# HELP %s Number of async actions finishing with each failure detail.' % name)
+        lines.append('# TYPE %s counter' % name)
+        samples = []
+        for ((async_action_class, prefix, failure_detail), count) in self.failure_details.items():
+            labels = {
+                'action': async_action_class.__name__,
+                'detail': _failure_detail_name(async_action_class, prefix, failure_detail),
+            }
+            samples.append((_render_labels(labels), count))
+        for (labels, count) in sorted(samples):
+            lines.append('%s%s %d' % (name, labels, count))
+
+        for (name, help, samples) in histograms or []:
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s histogram' % name)
+            for (labels, histogram) in samples:
+                lines.extend(histogram.render(name, labels))
+
+        for (name, help, samples) in gauges or []:
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s gauge' % name)
+            for (labels, value) in samples:
+                lines.append('%s%s %s' % (name, _render_labels(labels), value))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _failure_detail_name(async_action_class, prefix, failure_detail):
+    """Returns the name of ```async_action_class```'s constant whose
+    name starts with ```prefix``` and whose value is ```failure_detail```
+    or ```failure_detail``` in hex if there's no such constant.
+    """
+    for name in sorted(dir(async_action_class)):
+        if name.startswith(prefix + '_') and getattr(async_action_class, name) == failure_detail:
+            return name
+    return '0x%04x' % failure_detail
+
+
+def _render_labels(labels):
+    if not labels:
+        return ''
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{%s}' % ','.join(['%s="%s"' % (name, escape(labels[name])) for name in sorted(labels)])
+
+
+metrics = Metrics()
@@ -3,18 +3,157 @@ ephemeral container service.
 """
 
 import base64
+import functools
 import httplib
+import json
 import logging
+import time
 
+import jsonschema
 import tornado.web
+import tornado.websocket
 import tor_async_util
 
 import ecs
 import jsonschemas
 import async_actions
+import async_docker_remote_api
+import event_loop_monitor
+import metrics
+import task_scheduler
+import task_store
 
 _logger = logging.getLogger(__name__)
 
+# names used for a container's streams when a task's output is streamed
+_stream_names = {
+    async_docker_remote_api.StreamDemuxer.STDOUT: 'stdout',
+    async_docker_remote_api.StreamDemuxer.STDERR: 'stderr',
+}
+
+
+def _is_task_template_found(request_body):
+    """Returns False if ```request_body``` (a create tasks request)
+    references a task template which doesn't exist.
+    """
+    if 'template' not in request_body:
+        return True
+    return request_body['template'] in async_actions.task_templates
+
+
+def _create_container_runner(request_body, frame_callback=None, progress_callback=None, async_state=None):
+    """Create a container runner for ```request_body``` (a create tasks
+    request) - any task template referenced by ```request_body``` is
+    assumed to exist (see _is_task_template_found()).
+    """
+    if 'template' in request_body:
+        task_template = async_actions.task_templates[request_body['template']]
+        return async_actions.AsyncEndToEndContainerRunner(
+            task_template.docker_image,
+            task_template.cmd,
+            task_template.email,
+            task_template.username,
+            task_template.password,
+            request_body.get('pull_policy', None),
+            task_template,
+            frame_callback=frame_callback,
+            progress_callback=progress_callback,
+            timeout=request_body.get('timeout_ms', None),
+            async_state=async_state)
+
+    creds = request_body.get('creds', {})
+    return async_actions.AsyncEndToEndContainerRunner(
+        request_body['docker_image'],
+        request_body['cmd'],
+        creds.get('email', None),
+        creds.get('username', None),
+        creds.get('password', None),
+        request_body.get('pull_policy', None),
+        frame_callback=frame_callback,
+        progress_callback=progress_callback,
+        timeout=request_body.get('timeout_ms', None),
+        async_state=async_state)
+
+
+def _get_caller(request):
+    """Identify the caller making ```request``` for the task scheduler -
+    see ```task_scheduler.task_scheduler_caller_header```. Returns None
+    if the caller can't be identified.
+    """
+    if task_scheduler.task_scheduler_caller_header:
+        caller = request.headers.get(task_scheduler.task_scheduler_caller_header, None)
+        if caller:
+            return caller
+
+    auth_hdr_val = request.headers.get('Authorization', None)
+    if not auth_hdr_val:
+        return None
+
+    auth_hdr_val = auth_hdr_val.strip().split(None, 1)
+    if len(auth_hdr_val) != 2 or auth_hdr_val[0].lower() != 'basic':
+        return None
+
+    try:
+        creds = base64.b64decode(auth_hdr_val[1])
+    except TypeError:
+        return None
+
+    return creds.split(':', 1)[0] or None
+
+
+def _can_meet_deadline(request_body):
+    """Returns False if the task scheduler predicts ```request_body```
+    (a create tasks request) can't finish within its deadline.
+    """
+    return task_scheduler.task_scheduler.can_meet_deadline(
+        request_body.get('priority', None),
+        request_body.get('deadline', None))
+
+
+def _submit(request, request_body, acr, callback):
+    """Submit ```acr``` to the task scheduler using the caller making
+    ```request``` and ```request_body```'s priority and deadline.
+    """
+    return task_scheduler.task_scheduler.submit(
+        acr,
+        callback,
+        _get_caller(request),
+        request_body.get('priority', None),
+        request_body.get('deadline', None))
+
+
+def _server_timing(acr, submitted_at, encoding_started_at):
+    """Returns the value of a Server-Timing header describing the time
+    (in ms) ```acr``` (an AsyncEndToEndContainerRunner submitted at
+    ```submitted_at```) spent waiting in the task scheduler's queue, in
+    each phase of running the task and encoding the response (which
+    started at ```encoding_started_at```) - the cid metric's description
+    is ```acr```'s cid so the timings can be matched with the service's logs.
+    """
+    durations = []
+    if acr.started_at is not None:
+        durations.append(('queue', acr.started_at - submitted_at))
+    durations.extend([
+        (phase, acr.phase_durations[phase])
+        for phase in metrics.PHASES
+        if phase in acr.phase_durations
+    ])
+    durations.append(('encode', time.time() - encoding_started_at))
+
+    server_timing = ['%s;dur=%.3f' % (name, max(0.0, duration) * 1000.0) for (name, duration) in durations]
+    server_timing.append('cid;desc="%s"' % acr.cid)
+    return ', '.join(server_timing)
+
+
+def _write_too_busy_response(request_handler, debug_details):
+    """Respond to a request for tasks the task scheduler can't accept
+    with a 503 (Service Unavailable) and a Retry-After header.
+    """
+    request_handler.add_debug_details(debug_details)
+    request_handler.set_header('Retry-After', str(task_scheduler.task_scheduler.retry_after))
+    request_handler.write_error(httplib.SERVICE_UNAVAILABLE)
+    request_handler.finish()
+
 
 class TasksRequestHandler(tor_async_util.RequestHandler):
 
@@ -25,33 +164,127 @@ class TasksRequestHandler(tor_async_util.RequestHandler):
     PDD_ERROR_CREATING_RAW_CRAWL = 0x0002
     PDD_IMAGE_NOT_FOUND = 0x0003
     PDD_BAD_RESPONSE_BODY = 0x0004
+    PDD_TEMPLATE_NOT_FOUND = 0x0005
+    PDD_BAD_QUERY_STRING = 0x0006
+    PDD_TOO_BUSY = 0x0007
+    PDD_DEADLINE_CANNOT_BE_MET = 0x0008
+
+    _is_streaming = False
+    _is_connection_closed = False
+    _submitted_at = None
 
     @tornado.web.asynchronous
     def post(self):
-        """This method implements the POST action on the /ecs endpoint."""
+        """This method implements the POST action on the /ecs endpoint.
+        If the async query string parameter is true the task is run in
+        the background - a 202 (Accepted) response with the task's ID is
+        returned immediately and the task's result is retrieved using
+        TaskRequestHandler. If the stream query string parameter is true
+        the task's stdout and stderr are streamed back as newline delimited
+        JSON while the task runs and the task's exit code is the last line.
+        """
         request_body = self.get_json_request_body(schema=jsonschemas.create_tasks_request)
         if request_body is None:
             self.write_bad_request_response(type(self).PDD_BAD_REQUEST_BODY)
             self.finish()
             return
 
-        creds = request_body.get('creds', {})
-        acr = async_actions.AsyncEndToEndContainerRunner(
-            request_body['docker_image'],
-            request_body['cmd'],
-            creds.get('email', None),
-            creds.get('username', None),
-            creds.get('password', None))
-        acr.create(self._on_acr_create_done)
+        is_async = self.get_argument('async', 'false').lower() == 'true'
+        is_stream = self.get_argument('stream', 'false').lower() == 'true'
+        if is_async and is_stream:
+            self.write_bad_request_response(type(self).PDD_BAD_QUERY_STRING)
+            self.finish()
+            return
+
+        if not _is_task_template_found(request_body):
+            self.add_debug_details(self.PDD_TEMPLATE_NOT_FOUND)
+            self.write_error(httplib.NOT_FOUND)
+            self.finish()
+            return
+
+        if not task_scheduler.task_scheduler.can_submit():
+            _write_too_busy_response(self, type(self).PDD_TOO_BUSY)
+            return
+
+        if not _can_meet_deadline(request_body):
+            _write_too_busy_response(self, type(self).PDD_DEADLINE_CANNOT_BE_MET)
+            return
+
+        if is_stream:
+            acr = _create_container_runner(request_body, frame_callback=self._on_frame)
+            if not _submit(self.request, request_body, acr, self._on_streaming_acr_create_done):
+                self._write_rejected_response()
+            return
+
+        acr = _create_container_runner(request_body)
+
+        if is_async:
+            self._create_async(request_body, acr)
+            return
+
+        self._submitted_at = time.time()
+        if not _submit(self.request, request_body, acr, self._on_acr_create_done):
+            self._write_rejected_response()
+
+    def on_connection_close(self):
+        self._is_connection_closed = True
+
+    def _write_rejected_response(self):
+        # the task scheduler can reject a task which passed the too busy
+        # and deadline checks - for example, when time passing between
+        # the checks and submitting the task pushes it past its deadline
+        if task_scheduler.task_scheduler.can_submit():
+            _write_too_busy_response(self, type(self).PDD_DEADLINE_CANNOT_BE_MET)
+        else:
+            _write_too_busy_response(self, type(self).PDD_TOO_BUSY)
+
+    def _create_async(self, request_body, acr):
+        task_store.task_store.add(acr.cid)
+        if not _submit(self.request, request_body, acr, _on_async_acr_create_done):
+            # the client's never told the task's id so there's nothing to
+            # poll for - keep the task out of the store
+            task_store.task_store.remove(acr.cid)
+            self._write_rejected_response()
+            return
+
+        location = '%s://%s%s/%s' % (
+            self.request.protocol,
+            self.request.host,
+            self.request.path.rstrip('/'),
+            acr.cid,
+        )
+
+        body = {
+            'id': acr.cid,
+            'links': {
+                'self': {
+                    'href': location,
+                },
+            },
+        }
+
+        if not self.write_and_verify(body, jsonschemas.create_tasks_async_response):
+            self.add_debug_details(self.PDD_BAD_RESPONSE_BODY)
+            self.write_error(httplib.INTERNAL_SERVER_ERROR)
+            self.finish()
+            return
+
+        self.set_header('Location', location)
+        self.set_status(httplib.ACCEPTED)
+        self.finish()
 
     def _on_acr_create_done(self, is_ok, is_image_found, exit_code, stdout, stderr, acr):
+        encoding_started_at = time.time()
+
         if not is_ok:
+            self.set_header('Server-Timing', _server_timing(acr, self._submitted_at, encoding_started_at))
             self.add_debug_details(self.PDD_ERROR_CREATING_RAW_CRAWL)
             self.write_error(httplib.INTERNAL_SERVER_ERROR)
             self.finish()
             return
 
         if not is_image_found:
+            self.set_header('Server-Timing', _server_timing(acr, self._submitted_at, encoding_started_at))
             self.add_debug_details(self.PDD_IMAGE_NOT_FOUND)
             self.write_error(httplib.NOT_FOUND)
             self.finish()
@@ -59,9 +292,11 @@ class TasksRequestHandler(tor_async_util.RequestHandler):
 
         body = {
             'exitCode': exit_code,
-            'stdout': base64.b64encode(stdout),
-            'stderr': base64.b64encode(stderr),
+            'stdout': base64.b64encode(stdout or ''),
+            'stderr': base64.b64encode(stderr or ''),
         }
+        if acr.is_timed_out:
+            body['timedOut'] = True
 
         if not self.write_and_verify(body, jsonschemas.create_tasks_response):
             self.add_debug_details(self.PDD_BAD_RESPONSE_BODY)
@@ -69,9 +304,398 @@ class TasksRequestHandler(tor_async_util.RequestHandler):
             self.finish()
             return
 
+        self.set_header('Server-Timing', _server_timing(acr, self._submitted_at, encoding_started_at))
         self.set_status(httplib.CREATED)
         self.finish()
 
+    def _start_streaming(self):
+        # the response's status and headers are sent with the first line
+        # so failures before that point are reported using the usual
+        # error responses and failures after it in the last line
+        self._is_streaming = True
+        self.set_status(httplib.OK)
+        self.set_header('Content-Type', 'application/x-ndjson')
+        # ask nginx not to buffer the response
+        self.set_header('X-Accel-Buffering', 'no')
+
+    def _write_line(self, line):
+        if not self._is_streaming:
+            self._start_streaming()
+        self.write(json.dumps(line) + '\n')
+
+    def _on_frame(self, stream_type, payload):
+        if self._is_connection_closed:
+            return
+
+        stream_name = _stream_names.get(stream_type, None)
+        if stream_name is None:
+            return
+
+        line = {
+            'stream': stream_name,
+            'data': base64.b64encode(payload),
+        }
+        self._write_line(line)
+        self.flush()
+
+    def _on_streaming_acr_create_done(self, is_ok, is_image_found, exit_code, stdout, stderr, acr):
+        if self._is_connection_closed:
+            return
+
+        if not self._is_streaming:
+            if not is_ok:
+                self.add_debug_details(self.PDD_ERROR_CREATING_RAW_CRAWL)
+                self.write_error(httplib.INTERNAL_SERVER_ERROR)
+                self.finish()
+                return
+
+            if not is_image_found:
+                self.add_debug_details(self.PDD_IMAGE_NOT_FOUND)
+                self.write_error(httplib.NOT_FOUND)
+                self.finish()
+                return
+
+        if not is_ok:
+            line = {
+                'state': task_store.Task.STATE_FAILED,
+            }
+        else:
+            line = {
+                'state': task_store.Task.STATE_FINISHED,
+                'exitCode': exit_code,
+            }
+            if acr.is_timed_out:
+                line['timedOut'] = True
+        self._write_line(line)
+        self.finish()
+
+
+class BatchTasksRequestHandler(tor_async_util.RequestHandler):
+    """Runs a batch of tasks concurrently and streams each task's
+    result back as a single line of newline delimited JSON (NDJSON)
+    as soon as the task finishes. Concurrent pulls of the same image
+    by tasks in the batch are coalesced by AsyncImagePull.
+    """
+
+    url_spec = r'/%s/tasks/_batch/?' % ecs.__api_version__
+
+    # PDD = Post Debug Details
+    PDD_BAD_REQUEST_BODY = 0x0001
+    PDD_TEMPLATE_NOT_FOUND = 0x0002
+    PDD_TOO_BUSY = 0x0003
+    PDD_DEADLINE_CANNOT_BE_MET = 0x0004
+
+    _number_outstanding = 0
+    _is_connection_closed = False
+
+    @tornado.web.asynchronous
+    def post(self):
+        """This method implements the POST action on the /tasks/_batch endpoint."""
+        request_body = self.get_json_request_body(schema=jsonschemas.create_batch_tasks_request)
+        if request_body is None:
+            self.write_bad_request_response(type(self).PDD_BAD_REQUEST_BODY)
+            self.finish()
+            return
+
+        if not all([_is_task_template_found(task) for task in request_body]):
+            self.add_debug_details(type(self).PDD_TEMPLATE_NOT_FOUND)
+            self.write_error(httplib.NOT_FOUND)
+            self.finish()
+            return
+
+        # either all of the batch's tasks are accepted or none of them are
+        if not task_scheduler.task_scheduler.can_submit(len(request_body)):
+            _write_too_busy_response(self, type(self).PDD_TOO_BUSY)
+            return
+
+        if not all([_can_meet_deadline(task) for task in request_body]):
+            _write_too_busy_response(self, type(self).PDD_DEADLINE_CANNOT_BE_MET)
+            return
+
+        self.set_status(httplib.OK)
+        self.set_header('Content-Type', 'application/x-ndjson')
+
+        # send the response headers before any task has finished
+        self.flush()
+
+        acrs = [_create_container_runner(task, async_state=index) for (index, task) in enumerate(request_body)]
+        self._number_outstanding = len(acrs)
+        for (task, acr) in zip(request_body, acrs):
+            # each task's deadline was checked above but the batch's
+            # earlier tasks can push a later task past its deadline
+            if not _submit(self.request, task, acr, self._on_acr_create_done):
+                self._write_line({
+                    'index': acr.async_state,
+                    'id': acr.cid,
+                    'state': task_store.Task.STATE_REJECTED,
+                })
+
+    def on_connection_close(self):
+        self._is_connection_closed = True
+
+    def _on_acr_create_done(self, is_ok, is_image_found, exit_code, stdout, stderr, acr):
+        line = {
+            'index': acr.async_state,
+            'id': acr.cid,
+        }
+        if not is_ok:
+            line['state'] = task_store.Task.STATE_FAILED
+        elif not is_image_found:
+            line['state'] = task_store.Task.STATE_IMAGE_NOT_FOUND
+        else:
+            line['state'] = task_store.Task.STATE_FINISHED
+            line['exitCode'] = exit_code
+            line['stdout'] = base64.b64encode(stdout or '')
+            line['stderr'] = base64.b64encode(stderr or '')
+            if acr.is_timed_out:
+                line['timedOut'] = True
+
+        self._write_line(line)
+
+    def _write_line(self, line):
+        self._number_outstanding -= 1
+
+        if self._is_connection_closed:
+            return
+
+        self.write(json.dumps(line) + '\n')
+
+        if self._number_outstanding:
+            self.flush()
+            return
+
+        self.finish()
+
+
+class TasksWebSocketHandler(tornado.websocket.WebSocketHandler):
+    """A single websocket connection can be used to run many tasks
+    concurrently. Each message sent by the client is a JSON document
+    containing a create tasks request (```task```) and an optional
+    client supplied reference (```ref```). The service replies with
+    an interleaved stream of JSON event messages - ```accepted```,
+    ```pulled```, ```started```, ```output```, ```exited``` and
+    finally ```result``` - each identifying the task by its ID and,
+    if one was supplied, the client's reference.
+    """
+
+    url_spec = r'/%s/tasks/ws/?' % ecs.__api_version__
+
+    EVENT_ACCEPTED = 'accepted'
+    EVENT_OUTPUT = 'output'
+    EVENT_RESULT = 'result'
+    EVENT_ERROR = 'error'
+
+    _is_closed = False
+
+    def on_message(self, message):
+        try:
+            request = json.loads(message)
+            jsonschema.validate(request, jsonschemas.websocket_task_request)
+        except Exception as ex:
+            _logger.debug('Error parsing/validating websocket message - %s', ex)
+            self._write_error_message('bad request')
+            return
+
+        ref = request.get('ref', None)
+        task = request['task']
+
+        if not _is_task_template_found(task):
+            self._write_error_message('template not found', ref)
+            return
+
+        acr = _create_container_runner(
+            task,
+            progress_callback=self._on_progress,
+            async_state=ref)
+        acr.frame_callback = functools.partial(self._on_frame, acr)
+
+        if not task_scheduler.task_scheduler.can_submit():
+            self._write_error_message('too busy', ref, retryAfter=task_scheduler.task_scheduler.retry_after)
+            return
+
+        if not _can_meet_deadline(task):
+            self._write_error_message(
+                'deadline cannot be met',
+                ref,
+                retryAfter=task_scheduler.task_scheduler.retry_after)
+            return
+
+        self._write_event_message(type(self).EVENT_ACCEPTED, acr)
+
+        # the task scheduler can still reject the task (see the batch
+        # handler) - the client's already been told the task was accepted
+        # so the rejection is the task's result
+        if not _submit(self.request, task, acr, self._on_acr_create_done):
+            self._write_event_message(
+                type(self).EVENT_RESULT,
+                acr,
+                state=task_store.Task.STATE_REJECTED,
+                retryAfter=task_scheduler.task_scheduler.retry_after)
+
+    def on_close(self):
+        self._is_closed = True
+
+    def _on_progress(self, progress, acr):
+        if progress == async_actions.AsyncEndToEndContainerRunner.PROGRESS_EXITED:
+            self._write_event_message(progress, acr, exitCode=acr.exit_code)
+            return
+
+        self._write_event_message(progress, acr)
+
+    def _on_frame(self, acr, stream_type, payload):
+        stream_name = _stream_names.get(stream_type, None)
+        if stream_name is None:
+            return
+
+        self._write_event_message(
+            type(self).EVENT_OUTPUT,
+            acr,
+            stream=stream_name,
+            data=base64.b64encode(payload))
+
+    def _on_acr_create_done(self, is_ok, is_image_found, exit_code, stdout, stderr, acr):
+        if not is_ok:
+            self._write_event_message(type(self).EVENT_RESULT, acr, state=task_store.Task.STATE_FAILED)
+            return
+
+        if not is_image_found:
+            self._write_event_message(type(self).EVENT_RESULT, acr, state=task_store.Task.STATE_IMAGE_NOT_FOUND)
+            return
+
+        kwargs = {'timedOut': True} if acr.is_timed_out else {}
+        self._write_event_message(
+            type(self).EVENT_RESULT,
+            acr,
+            state=task_store.Task.STATE_FINISHED,
+            exitCode=exit_code,
+            **kwargs)
+
+    def _write_event_message(self, event, acr, **kwargs):
+        message = {
+            'event': event,
+            'id': acr.cid,
+        }
+        if acr.async_state is not None:
+            message['ref'] = acr.async_state
+        message.update(kwargs)
+        self._write_message(message)
+
+    def _write_error_message(self, reason, ref=None, **kwargs):
+        message = {
+            'event': type(self).EVENT_ERROR,
+            'reason': reason,
+        }
+        if ref is not None:
+            message['ref'] = ref
+        message.update(kwargs)
+        self._write_message(message)
+
+    def _write_message(self, message):
+        # tasks keep running after the connection closes
+        # but there's no longer anyone to tell about them
+        if self._is_closed:
+            return
+
+        try:
+            self.write_message(json.dumps(message))
+        except tornado.websocket.WebSocketClosedError:
+            self._is_closed = True
+
+
+def _on_async_acr_create_done(is_ok, is_image_found, exit_code, stdout, stderr, acr):
+    """Called when a task submitted with POST /tasks?async=true finishes."""
+    if not is_ok:
+        task_store.task_store.finish(acr.cid, task_store.Task.STATE_FAILED)
+        return
+
+    if not is_image_found:
+        task_store.task_store.finish(acr.cid, task_store.Task.STATE_IMAGE_NOT_FOUND)
+        return
+
+    task_store.task_store.finish(
+        acr.cid,
+        task_store.Task.STATE_FINISHED,
+        exit_code,
+        stdout,
+        stderr,
+        acr.is_timed_out)
+
+
+class TaskRequestHandler(tor_async_util.RequestHandler):
+
+    url_spec = r'/%s/tasks/(?P<task_id>[^/]+)/?' % ecs.__api_version__
+
+    # GDD = Get Debug Details
+    GDD_TASK_NOT_FOUND = 0x0001
+    GDD_BAD_WAIT = 0x0002
+    GDD_BAD_RESPONSE_BODY = 0x0003
+
+    _cancel_wait = None
+
+    @tornado.web.asynchronous
+    def get(self, task_id):
+        """This method implements the GET action on the /tasks/{id} endpoint.
+        The optional wait query string parameter is the max time (in
+        milliseconds) to long poll waiting for a running task to finish.
+        """
+        task = task_store.task_store.get(task_id)
+        if task is None:
+            self.add_debug_details(type(self).GDD_TASK_NOT_FOUND)
+            self.write_error(httplib.NOT_FOUND)
+            self.finish()
+            return
+
+        wait = self.get_argument('wait', '0')
+        if not wait.isdigit():
+            self.write_bad_request_response(type(self).GDD_BAD_WAIT)
+            self.finish()
+            return
+
+        if int(wait) <= 0:
+            self._write_task(task)
+            return
+
+        self._cancel_wait = task_store.task_store.wait(task, self._write_task, int(wait))
+
+    def on_connection_close(self):
+        if self._cancel_wait:
+            self._cancel_wait()
+            self._cancel_wait = None
+
+    def _write_task(self, task):
+        self._cancel_wait = None
+
+        location = '%s://%s%s' % (
+            self.request.protocol,
+            self.request.host,
+            self.request.path,
+        )
+
+        body = {
+            'id': task.task_id,
+            'state': task.state,
+            'links': {
+                'self': {
+                    'href': location,
+                },
+            },
+        }
+        if task.state == task_store.Task.STATE_FINISHED:
+            body['exitCode'] = task.exit_code
+            body['stdout'] = base64.b64encode(task.stdout or '')
+            body['stderr'] = base64.b64encode(task.stderr or '')
+            if task.is_timed_out:
+                body['timedOut'] = True
+
+        if not self.write_and_verify(body, jsonschemas.get_task_response):
+            self.add_debug_details(type(self).GDD_BAD_RESPONSE_BODY)
+            self.write_error(httplib.INTERNAL_SERVER_ERROR)
+            self.finish()
+            return
+
+        self.set_status(httplib.OK)
+        self.finish()
+
 
 class VersionRequestHandler(tor_async_util.RequestHandler):
 
@@ -98,3 +722,96 @@ class HealthRequestHandler(tor_async_util.RequestHandler):
     @tornado.web.asynchronous
     def get(self):
         tor_async_util.generate_health_check_response(self, async_actions.AsyncHealthChecker)
+
+
+class MetricsRequestHandler(tor_async_util.RequestHandler):
+
+    url_spec = r'/%s/_metrics' % ecs.__api_version__
+
+    @tornado.web.asynchronous
+    def get(self):
+        docker_hosts = async_docker_remote_api.docker_hosts()
+        bulkheads = [
+            (docker_host, docker_host.bulkheads[name])
+            for docker_host in docker_hosts
+            for name in async_docker_remote_api.BULKHEADS
+        ]
+        callers = sorted(task_scheduler.task_scheduler.callers.values(), key=lambda caller: caller.name)
+        gauges = [
+            (
+                'ecs_tasks_running',
+                'Number of tasks running.',
+                [({}, task_scheduler.task_scheduler.number_running)],
+            ),
+            (
+                'ecs_tasks_waiting',
+                'Number of tasks waiting to run.',
+                [({}, task_scheduler.task_scheduler.queue_depth)],
+            ),
+            (
+                'ecs_async_tasks_running',
+                'Number of tasks submitted asynchronously which are running.',
+                [({}, task_store.task_store.number_running)],
+            ),
+            (
+                'ecs_docker_host_tasks_running',
+                'Number of tasks running on each docker host.',
+                [({'endpoint': docker_host.endpoint}, docker_host.number_tasks) for docker_host in docker_hosts],
+            ),
+            (
+                'ecs_docker_host_healthy',
+                'Is each docker host\'s circuit breaker closed (1) or not (0).',
+                [({'endpoint': docker_host.endpoint}, int(docker_host.is_healthy)) for docker_host in docker_hosts],
+            ),
+            (
+                'ecs_bulkhead_requests_in_progress',
+                'Number of Docker Remote API requests in progress in each bulkhead.',
+                [
+                    ({'endpoint': docker_host.endpoint, 'bulkhead': bulkhead.name}, bulkhead.number_in_progress)
+                    for (docker_host, bulkhead) in bulkheads
+                ],
+            ),
+            (
+                'ecs_bulkhead_queue_depth',
+                'Number of Docker Remote API requests waiting in each bulkhead.',
+                [
+                    ({'endpoint': docker_host.endpoint, 'bulkhead': bulkhead.name}, bulkhead.queue_depth)
+                    for (docker_host, bulkhead) in bulkheads
+                ],
+            ),
+            (
+                'ecs_containers_reaping',
+                'Number of containers waiting to be or being deleted.',
+                [({}, async_actions.container_reaper.queue_depth + async_actions.container_reaper.number_in_progress)],
+            ),
+            (
+                'ecs_caller_tasks_waiting',
+                'Number of tasks waiting to run for each caller.',
+                [({'caller': caller.name}, caller.queue_depth) for caller in callers],
+            ),
+            (
+                'ecs_event_loop_lag_seconds',
+                'Percentiles of how late the event loop ran timers over the last minute.',
+                [
+                    ({'quantile': str(percentile / 100.0)}, lag)
+                    for (percentile, lag) in event_loop_monitor.event_loop_monitor.percentiles()
+                ],
+            ),
+            (
+                'ecs_event_loop_slow_callbacks',
+                'Number of times a callback blocked the event loop for longer than the slow callback threshold.',
+                [({}, event_loop_monitor.event_loop_monitor.number_slow_callbacks)],
+            ),
+        ]
+
+        histograms = [
+            (
+                'ecs_caller_task_wait_seconds',
+                'Time each caller\'s tasks waited to run.',
+                [({'caller': caller.name}, caller.wait_times) for caller in callers],
+            ),
+        ]
+
+        self.set_header('Content-Type', metrics.CONTENT_TYPE)
+        self.write(metrics.metrics.render(gauges, histograms))
+        self.finish()
@@ -0,0 +1,330 @@
+"""This module contains the task scheduler which admits tasks
+(AsyncEndToEndContainerRunners) so that the number of tasks running
+on a node at any point in time is bounded and tasks waiting to run
+are run in weighted fair order across the callers submitting them.
+"""
+
+import collections
+import functools
+import heapq
+import logging
+import math
+import time
+
+import metrics
+
+_logger = logging.getLogger(__name__)
+
+# max number of tasks running concurrently
+task_scheduler_max_concurrency = 100
+
+# max number of tasks waiting to run - tasks submitted when the
+# wait queue is full are rejected
+task_scheduler_max_queue_depth = 1000
+
+# waiting tasks are run in weighted fair order across callers (see
+# TaskScheduler). a caller's weight is found in task_scheduler_weights
+# (keyed by caller) and task_scheduler_default_weight is used for
+# callers not in task_scheduler_weights
+task_scheduler_weights = {}
+
+task_scheduler_default_weight = 1
+
+# tasks are run in priority order - interactive tasks before normal
+# tasks and normal tasks before batch tasks
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_NORMAL = 'normal'
+PRIORITY_BATCH = 'batch'
+
+PRIORITIES = [
+    PRIORITY_INTERACTIVE,
+    PRIORITY_NORMAL,
+    PRIORITY_BATCH,
+]
+
+# callers are identified by the username of a request's basic auth
+# credentials unless task_scheduler_caller_header is set and the
+# request includes the header in which case the header's value is
+# used (for example, a header set by a proxy in front of the service)
+task_scheduler_caller_header = None
+
+# time (in milliseconds) after a caller's last task was submitted or
+# dispatched before the caller, if it has no tasks waiting, is forgotten
+# along with its stats so callers don't accumulate without bound
+task_scheduler_caller_ttl = 10 * 60 * 1000
+
+
+class Caller(object):
+    """A caller submitting tasks to the task scheduler."""
+
+    def __init__(self, name):
+        object.__init__(self)
+
+        self.name = name
+
+        self.queue_depth = 0
+        self.number_submitted = 0
+        self.number_rejected = 0
+        self.number_dispatched = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.wait_times = metrics.Histogram()
+
+        self.finish_tag = 0.0
+        self.last_active_at = time.time()
+
+    @property
+    def weight(self):
+        return task_scheduler_weights.get(self.name, task_scheduler_default_weight)
+
+
+class TaskScheduler(object):
+    """Runs at most ```task_scheduler_max_concurrency``` tasks concurrently.
+    Tasks submitted when the max number of tasks are running wait in
+    a queue of at most ```task_scheduler_max_queue_depth``` tasks.
+    Tasks submitted when the queue is full are rejected immediately
+    so overload turns into fast rejections rather than all tasks
+    slowing down together.
+
+    Waiting tasks are run in priority order (see PRIORITIES). Within a
+    priority, tasks with a deadline are run earliest deadline first and
+    before tasks without a deadline. Tasks whose deadline can't be met,
+    given the tasks waiting ahead of them and the observed time between
+    task completions, are rejected immediately rather than being run
+    only for their result to be thrown away. Only the time a task waits
+    to start is predicted - how long a task runs depends on the task
+    (a batch backfill runs far longer than an interactive scrape) so a
+    task which can start right away is never rejected for its deadline.
+
+    Otherwise waiting tasks are run in weighted fair order across callers
+    using self-clocked fair queueing - each task is tagged with a virtual
+    finish time of
+
+        max(virtual time, caller's previous task's finish tag) + 1 / caller's weight
+
+    and the waiting task with the smallest tag is run next. The virtual
+    time is the tag of the task most recently run. A caller with twice
+    the weight of another gets twice as many tasks run when both have
+    tasks waiting, one caller's burst of tasks can't starve other callers
+    and a single caller's tasks are run in FIFO order.
+
+    The time between task completions is tracked using an exponentially
+    weighted moving average so a rejected task's creator can be told how
+    long it'll take to drain the queue (see ```retry_after```) and so the
+    time until a task starts can be predicted.
+    The time between task completions only measures throughput while
+    the scheduler is saturated (every slot busy or tasks waiting) so it's
+    only sampled when both completions happen while the scheduler has
+    been continuously saturated - otherwise idle time would inflate it.
+    """
+
+    # weight given to the most recent observation by the
+    # exponentially weighted moving averages
+    _alpha = 0.1
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.number_running = 0
+        self.number_submitted = 0
+        self.number_rejected = 0
+        self.number_deadlines_rejected = 0
+        self.number_completed = 0
+
+        # callers ordered by when they were last active (see _get_caller())
+        self.callers = collections.OrderedDict()
+
+        self._queue = []
+        self._sequence_number = 0
+        self._virtual_time = 0.0
+        self._last_completed_at = None
+        self._saturated_since = None
+        self._time_between_completions = None
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    @property
+    def retry_after(self):
+        """The number of seconds a rejected task's creator should
+        wait before resubmitting the task - always at least 1.
+        """
+        if self._time_between_completions is None:
+            return 1
+        return max(1, int(math.ceil((self.queue_depth + 1) * self._time_between_completions)))
+
+    def can_submit(self, number_tasks=1):
+        """Returns True if ```number_tasks``` tasks can be
+        submitted without any of them being rejected.
+        """
+        number_slots = max(0, task_scheduler_max_concurrency - self.number_running)
+        number_queued = max(0, number_tasks - number_slots)
+        return self.queue_depth + number_queued <= task_scheduler_max_queue_depth
+
+    def can_meet_deadline(self, priority=None, deadline=None):
+        """Returns True if a task with ```priority``` which must finish
+        within ```deadline``` ms of being submitted is predicted to
+        start within its deadline. Tasks without a deadline can
+        always meet their deadline.
+        """
+        if deadline is None:
+            return True
+        return self._predicted_wait_time(self._key(priority, time.time() + deadline / 1000.0)) <= deadline / 1000.0
+
+    def submit(self, acr, callback, caller=None, priority=None, deadline=None):
+        """Run ```acr``` (an AsyncEndToEndContainerRunner) submitted by
+        ```caller``` as soon as the number of running tasks, ```priority```,
+        ```deadline``` (in ms) and fair queueing allow and call ```callback```
+        when ```acr``` finishes. Returns False if the task was rejected -
+        ```callback``` is never called for rejected tasks.
+        """
+        caller = self._get_caller(caller)
+
+        if not self.can_submit():
+            self.number_rejected += 1
+            caller.number_rejected += 1
+            fmt = '%s - rejected task - %d tasks running and %d tasks waiting'
+            _logger.warning(fmt, acr.cid, self.number_running, self.queue_depth)
+            return False
+
+        now = time.time()
+        if deadline is not None:
+            deadline = now + deadline / 1000.0
+        key = self._key(priority, deadline)
+
+        if deadline is not None:
+            predicted_wait_time = self._predicted_wait_time(key)
+            if now + predicted_wait_time > deadline:
+                self.number_rejected += 1
+                self.number_deadlines_rejected += 1
+                caller.number_rejected += 1
+                fmt = '%s - rejected task - predicted to start in %.3f s which misses its deadline of %.3f s'
+                _logger.warning(fmt, acr.cid, predicted_wait_time, deadline - now)
+                return False
+
+        self.number_submitted += 1
+        caller.number_submitted += 1
+
+        caller.finish_tag = max(self._virtual_time, caller.finish_tag) + 1.0 / caller.weight
+        caller.queue_depth += 1
+        heapq.heappush(
+            self._queue,
+            (key + (caller.finish_tag, self._next_sequence_number()), acr, callback, caller, now))
+
+        self._dispatch()
+        self._observe_saturation()
+        return True
+
+    def _key(self, priority, deadline):
+        """The first part of the key which orders waiting tasks - waiting
+        tasks are ordered by priority, then deadline, then fair queueing
+        finish tag and then submission order.
+        """
+        return (
+            PRIORITIES.index(priority or PRIORITY_NORMAL),
+            deadline if deadline is not None else float('inf'),
+        )
+
+    def _next_sequence_number(self):
+        self._sequence_number += 1
+        return self._sequence_number
+
+    def _predicted_wait_time(self, key):
+        """Predicted time (in seconds) until a task with ```key``` which
+        is submitted now will start.
+        """
+        if self.number_running < task_scheduler_max_concurrency and not self._queue:
+            return 0.0
+
+        # a task has to wait for each waiting task ahead of it to start
+        # and then for one more running task to finish
+        number_ahead = len([queued for queued in self._queue if queued[0][:2] <= key])
+        return (number_ahead + 1) * (self._time_between_completions or 0.0)
+
+    def _get_caller(self, name):
+        self._forget_idle_callers()
+
+        name = name or ''
+        caller = self.callers.pop(name, None)
+        if caller is None:
+            caller = Caller(name)
+        else:
+            caller.last_active_at = time.time()
+        self.callers[name] = caller
+        return caller
+
+    def _forget_idle_callers(self):
+        """Forget callers without waiting tasks which haven't been active
+        for ```task_scheduler_caller_ttl``` ms. A caller without waiting
+        tasks has a finish tag no later than the virtual time so the
+        caller's next task is tagged the same as if it were remembered.
+        """
+        idle_before = time.time() - task_scheduler_caller_ttl / 1000.0
+        for caller in self.callers.values():
+            if idle_before < caller.last_active_at:
+                break
+            if not caller.queue_depth:
+                del self.callers[caller.name]
+
+    def _dispatch(self):
+        while self._queue and self.number_running < task_scheduler_max_concurrency:
+            (key, acr, callback, caller, submitted_at) = heapq.heappop(self._queue)
+            (priority, deadline, finish_tag, sequence_number) = key
+            self._virtual_time = max(self._virtual_time, finish_tag)
+
+            now = time.time()
+            wait_time = now - submitted_at
+            caller.queue_depth -= 1
+            caller.number_dispatched += 1
+            caller.total_wait_time += wait_time
+            caller.max_wait_time = max(caller.max_wait_time, wait_time)
+            caller.wait_times.observe(wait_time)
+            caller.last_active_at = now
+            self.callers[caller.name] = self.callers.pop(caller.name)
+
+            self.number_running += 1
+            acr.create(functools.partial(self._on_acr_create_done, callback))
+
+    def _on_acr_create_done(self, callback, is_ok, is_image_found, exit_code, stdout, stderr, acr):
+        self.number_running -= 1
+        self.number_completed += 1
+
+        self._observe_completion()
+
+        try:
+            callback(is_ok, is_image_found, exit_code, stdout, stderr, acr)
+        finally:
+            self._dispatch()
+            self._observe_saturation()
+
+    @property
+    def _is_saturated(self):
+        return bool(self._queue) or task_scheduler_max_concurrency <= self.number_running
+
+    def _observe_saturation(self):
+        if not self._is_saturated:
+            self._saturated_since = None
+        elif self._saturated_since is None:
+            self._saturated_since = time.time()
+
+    def _observe_completion(self):
+        now = time.time()
+        is_saturated_since_last_completion = \
+            self._saturated_since is not None and \
+            self._last_completed_at is not None and \
+            self._saturated_since <= self._last_completed_at
+        if is_saturated_since_last_completion:
+            self._time_between_completions = self._ewma(
+                self._time_between_completions,
+                now - self._last_completed_at)
+        self._last_completed_at = now
+
+    def _ewma(self, average, observation):
+        if average is None:
+            return observation
+        alpha = type(self)._alpha
+        return alpha * observation + (1 - alpha) * average
+
+
+task_scheduler = TaskScheduler()
@@ -0,0 +1,168 @@
+"""This module contains a bounded, in-memory store of tasks submitted
+asynchronously (POST /tasks?async=true) so the results of those tasks
+can be retrieved later (GET /tasks/{id}).
+"""
+
+import collections
+import datetime
+import logging
+import time
+
+import tornado.ioloop
+
+_logger = logging.getLogger(__name__)
+
+# time (in milliseconds) a task's result is retained after the task finishes
+task_store_ttl = 10 * 60 * 1000
+
+# max number of bytes of stdout and stderr retained for finished tasks -
+# when exceeded the results of the oldest finished tasks are evicted
+task_store_max_bytes = 100 * 1024 * 1024
+
+# max time (in milliseconds) a GET /tasks/{id} request can long poll
+# waiting for a task to finish
+task_store_max_wait = 30 * 1000
+
+
+class Task(object):
+    """A task which was submitted asynchronously."""
+
+    STATE_RUNNING = 'running'
+    STATE_FINISHED = 'finished'
+    STATE_FAILED = 'failed'
+    STATE_IMAGE_NOT_FOUND = 'image-not-found'
+    STATE_REJECTED = 'rejected'
+
+    def __init__(self, task_id):
+        object.__init__(self)
+
+        self.task_id = task_id
+        self.state = type(self).STATE_RUNNING
+        self.exit_code = None
+        self.stdout = None
+        self.stderr = None
+        self.is_timed_out = False
+        self.finished_at = None
+
+        self._waiters = []
+
+    @property
+    def is_running(self):
+        return self.state == type(self).STATE_RUNNING
+
+    @property
+    def number_bytes(self):
+        return len(self.stdout or '') + len(self.stderr or '')
+
+
+class TaskStore(object):
+    """Tasks are added to the store when they're submitted and
+    finished when the task's container runner calls back. Finished
+    tasks are evicted ```task_store_ttl``` ms after they finish or,
+    oldest first, when the stdout and stderr of all finished tasks
+    exceed ```task_store_max_bytes```. Running tasks are never evicted
+    but a task which is never run (for example, because the task scheduler
+    rejected it) is removed.
+    """
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.number_bytes = 0
+        self.number_evictions = 0
+
+        self._running = {}
+        self._finished = collections.OrderedDict()
+
+    @property
+    def number_running(self):
+        return len(self._running)
+
+    @property
+    def number_finished(self):
+        return len(self._finished)
+
+    def add(self, task_id):
+        task = Task(task_id)
+        self._running[task_id] = task
+        return task
+
+    def get(self, task_id):
+        self._evict_expired()
+        return self._running.get(task_id, None) or self._finished.get(task_id, None)
+
+    def remove(self, task_id):
+        self._running.pop(task_id, None)
+
+    def finish(self, task_id, state, exit_code=None, stdout=None, stderr=None, is_timed_out=False):
+        task = self._running.pop(task_id, None)
+        if task is None:
+            return
+
+        task.state = state
+        task.exit_code = exit_code
+        task.stdout = stdout
+        task.stderr = stderr
+        task.is_timed_out = is_timed_out
+        task.finished_at = time.time()
+
+        self._finished[task_id] = task
+        self.number_bytes += task.number_bytes
+
+        self._evict_expired()
+        while self._finished and task_store_max_bytes < self.number_bytes:
+            (evicted_task_id, evicted_task) = self._finished.popitem(last=False)
+            self._evict(evicted_task, 'byte budget exceeded')
+
+        (waiters, task._waiters) = (task._waiters, [])
+        for waiter in waiters:
+            waiter(task)
+
+    def wait(self, task, callback, timeout):
+        """Calls ```callback``` with ```task``` when ```task``` finishes or
+        after ```timeout``` ms (capped at ```task_store_max_wait```) - whichever
+        comes first. Returns a function which cancels the wait.
+        """
+        if not task.is_running:
+            callback(task)
+            return lambda: None
+
+        io_loop = tornado.ioloop.IOLoop.current()
+
+        def on_timeout():
+            cancel()
+            callback(task)
+
+        def on_finished(task):
+            io_loop.remove_timeout(timeout_handle)
+            callback(task)
+
+        def cancel():
+            if on_finished in task._waiters:
+                task._waiters.remove(on_finished)
+            io_loop.remove_timeout(timeout_handle)
+
+        timeout_handle = io_loop.add_timeout(
+            datetime.timedelta(0, min(timeout, task_store_max_wait) / 1000.0, 0),
+            on_timeout)
+        task._waiters.append(on_finished)
+
+        return cancel
+
+    def _evict_expired(self):
+        expired_before = time.time() - task_store_ttl / 1000.0
+        while self._finished:
+            task = next(self._finished.itervalues())
+            if expired_before < task.finished_at:
+                break
+            self._finished.popitem(last=False)
+            self._evict(task, 'ttl expired')
+
+    def _evict(self, task, reason):
+        self.number_bytes -= task.number_bytes
+        self.number_evictions += 1
+        fmt = 'evicted task %s from task store - %s'
+        _logger.info(fmt, task.task_id, reason)
+
+
+task_store = TaskStore()
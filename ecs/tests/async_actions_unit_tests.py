@@ -2,14 +2,22 @@
 validate the ..async_actions module.
 """
 
+import time
 import unittest
 import uuid
 
 import mock
 
+from .. import async_actions
 from ..async_actions import AsyncEndToEndContainerRunner
 from ..async_actions import AsyncHealthChecker
+from ..async_actions import ContainerReaper
+from ..async_actions import ContainerSweeper
+from ..async_actions import HealthCheckCache
+from ..async_actions import TaskTemplate
 from .. import async_docker_remote_api   # noqa
+from .. import event_loop_monitor   # noqa
+from .. import metrics   # noqa
 
 
 class Patcher(object):
@@ -88,9 +96,10 @@ class AsyncContainerCreatePatcher(Patcher):
     async_docker_remote_api.AsyncContainerCreate.create().
     """
 
-    def __init__(self, is_ok, container_id=None):
+    def __init__(self, is_ok, container_id=None, create_failure_detail=None):
 
         def create_patch(acc, callback):
+            acc.create_failure_detail = create_failure_detail
             callback(is_ok, container_id, acc)
 
         patcher = mock.patch(
@@ -154,16 +163,70 @@ class AsyncContainerLogsPatcher(Patcher):
         Patcher.__init__(self, patcher)
 
 
-class AsyncContainerDeletePatcher(Patcher):
+class DeferredAsyncContainerCreatePatcher(Patcher):
     """This context manager provides an easy way to install a
-    patch allowing the caller to determine the behavior of
-    async_docker_remote_api.AsyncContainerDelete.fetch().
+    patch which records calls to async_docker_remote_api.AsyncContainerCreate.create()
+    without calling the callback. The caller determines when and
+    how creates complete using respond().
     """
 
-    def __init__(self, is_ok):
+    def __init__(self):
+        self.accs = []
+        self._callbacks = {}
+
+        def create_patch(acc, callback):
+            self.accs.append(acc)
+            self._callbacks[acc] = callback
+
+        patcher = mock.patch(
+            __name__ + '.async_docker_remote_api.AsyncContainerCreate.create',
+            create_patch)
+
+        Patcher.__init__(self, patcher)
+
+    @property
+    def number_in_progress(self):
+        return len(self._callbacks)
+
+    def respond(self, acc, is_ok, container_id=None, create_failure_detail=None):
+        acc.create_failure_detail = create_failure_detail
+        self._callbacks.pop(acc)(is_ok, container_id, acc)
+
+    def respond_to_all(self, is_ok, create_failure_detail=None):
+        for acc in list(self._callbacks.keys()):
+            self.respond(acc, is_ok, uuid.uuid4().hex if is_ok else None, create_failure_detail)
+
+
+class ContainerReaperPatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch which replaces async_actions.container_reaper with
+    a mock.
+    """
+
+    def __init__(self):
+        self.container_reaper = mock.Mock()
+
+        patcher = mock.patch(
+            __name__ + '.async_actions.container_reaper',
+            self.container_reaper)
+
+        Patcher.__init__(self, patcher)
+
+
+class DeferredAsyncContainerDeletePatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch which records calls to async_docker_remote_api.AsyncContainerDelete.delete()
+    without calling the callback. The caller determines when and
+    how deletes complete using respond().
+    """
+
+    def __init__(self):
+        self.acds = []
+        self._callbacks = {}
 
         def delete_patch(acd, callback):
-            callback(is_ok, acd)
+            self.acds.append(acd)
+            self._callbacks[acd] = callback
 
         patcher = mock.patch(
             __name__ + '.async_docker_remote_api.AsyncContainerDelete.delete',
@@ -171,6 +234,403 @@ class AsyncContainerDeletePatcher(Patcher):
 
         Patcher.__init__(self, patcher)
 
+    @property
+    def number_in_progress(self):
+        return len(self._callbacks)
+
+    def respond(self, acd, is_ok, delete_failure_detail=None):
+        acd.delete_failure_detail = delete_failure_detail
+        self._callbacks.pop(acd)(is_ok, acd)
+
+
+class AsyncContainerListPatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch allowing the caller to determine the behavior of
+    async_docker_remote_api.AsyncContainerList.list().
+    """
+
+    def __init__(self, is_ok, containers=None):
+
+        def list_patch(acl, callback):
+            callback(is_ok, containers, acl)
+
+        patcher = mock.patch(
+            __name__ + '.async_docker_remote_api.AsyncContainerList.list',
+            list_patch)
+
+        Patcher.__init__(self, patcher)
+
+
+class ContainerReaperTestCase(unittest.TestCase):
+
+    def test_ctr(self):
+        cr = ContainerReaper()
+        self.assertEqual(cr.queue_depth, 0)
+        self.assertEqual(cr.number_in_progress, 0)
+        self.assertEqual(cr.number_deleted, 0)
+        self.assertEqual(cr.number_retries, 0)
+        self.assertEqual(cr.number_failures, 0)
+
+    def test_delete_duration(self):
+        with mock.patch(__name__ + '.metrics.metrics', metrics.Metrics()) as patched_metrics:
+            with DeferredAsyncContainerDeletePatcher() as patcher:
+                cr = ContainerReaper()
+                cr.reap(uuid.uuid4().hex)
+                self.assertEqual(patched_metrics.phase_durations[metrics.PHASE_DELETE].count, 0)
+                patcher.respond(patcher.acds[0], True)
+                self.assertEqual(patched_metrics.phase_durations[metrics.PHASE_DELETE].count, 1)
+
+    def test_max_concurrency(self):
+        with mock.patch(__name__ + '.async_actions.container_reaper_max_concurrency', 2):
+            with DeferredAsyncContainerDeletePatcher() as patcher:
+                cr = ContainerReaper()
+                container_ids = [uuid.uuid4().hex for i in range(5)]
+                for container_id in container_ids:
+                    cr.reap(container_id)
+
+                self.assertEqual(cr.number_in_progress, 2)
+                self.assertEqual(cr.queue_depth, 3)
+                self.assertEqual(patcher.number_in_progress, 2)
+
+                patcher.respond(patcher.acds[0], True)
+
+                self.assertEqual(cr.number_in_progress, 2)
+                self.assertEqual(cr.queue_depth, 2)
+                self.assertEqual(cr.number_deleted, 1)
+
+                while patcher.number_in_progress:
+                    patcher.respond(patcher.acds[-patcher.number_in_progress], True)
+
+                self.assertEqual(cr.number_in_progress, 0)
+                self.assertEqual(cr.queue_depth, 0)
+                self.assertEqual(cr.number_deleted, 5)
+                self.assertEqual(
+                    [acd.container_id for acd in patcher.acds],
+                    container_ids)
+
+    def test_retry_and_give_up(self):
+        container_id = uuid.uuid4().hex
+        with mock.patch(__name__ + '.async_actions.container_reaper_max_attempts', 3):
+            with DeferredAsyncContainerDeletePatcher() as patcher:
+                with mock.patch('tornado.ioloop.IOLoop.add_timeout') as add_timeout:
+                    cr = ContainerReaper()
+                    cr.reap(container_id)
+
+                    for attempt in range(1, 4):
+                        self.assertEqual(len(patcher.acds), attempt)
+                        self.assertEqual(patcher.acds[-1].container_id, container_id)
+                        patcher.respond(patcher.acds[-1], False)
+                        if attempt < 3:
+                            (deadline, retry, container_id_arg, force_arg, endpoint_arg, attempt_arg) = \
+                                add_timeout.call_args[0]
+                            retry(container_id_arg, force_arg, endpoint_arg, attempt_arg)
+
+                    self.assertEqual(len(patcher.acds), 3)
+                    self.assertEqual(cr.number_retries, 2)
+                    self.assertEqual(cr.number_failures, 1)
+                    self.assertEqual(cr.number_deleted, 0)
+                    self.assertEqual(cr.number_in_progress, 0)
+                    self.assertEqual(cr.queue_depth, 0)
+
+    def test_container_not_found_is_deleted(self):
+        container_id = uuid.uuid4().hex
+        with DeferredAsyncContainerDeletePatcher() as patcher:
+            with mock.patch('tornado.ioloop.IOLoop.add_timeout') as add_timeout:
+                cr = ContainerReaper()
+                cr.reap(container_id)
+
+                acd = patcher.acds[0]
+                patcher.respond(acd, True, type(acd).DFD_CONTAINER_NOT_FOUND)
+
+                self.assertFalse(add_timeout.called)
+                self.assertEqual(len(patcher.acds), 1)
+                self.assertEqual(cr.number_deleted, 1)
+                self.assertEqual(cr.number_retries, 0)
+                self.assertEqual(cr.number_failures, 0)
+                self.assertFalse(cr.is_reaping(container_id))
+
+    def test_reap_is_idempotent(self):
+        container_id = uuid.uuid4().hex
+        with DeferredAsyncContainerDeletePatcher() as patcher:
+            cr = ContainerReaper()
+            self.assertFalse(cr.is_reaping(container_id))
+            cr.reap(container_id, force=True)
+            self.assertTrue(cr.is_reaping(container_id))
+            cr.reap(container_id)
+
+            self.assertEqual(len(patcher.acds), 1)
+            self.assertTrue(patcher.acds[0].force)
+
+            patcher.respond(patcher.acds[0], True)
+            self.assertFalse(cr.is_reaping(container_id))
+
+            cr.reap(container_id)
+            self.assertEqual(len(patcher.acds), 2)
+            self.assertFalse(patcher.acds[1].force)
+
+
+class ContainerSweeperTestCase(unittest.TestCase):
+
+    def _container(self, age, state):
+        now = time.time()
+        return {
+            'Id': uuid.uuid4().hex,
+            'State': state,
+            'Labels': {
+                async_docker_remote_api.LABEL_INSTANCE: uuid.uuid4().hex,
+                async_docker_remote_api.LABEL_CREATED: str(int(now - age / 1000.0)),
+            },
+        }
+
+    def test_ctr(self):
+        cs = ContainerSweeper()
+        self.assertEqual(cs.number_sweeps, 0)
+        self.assertEqual(cs.number_swept, 0)
+        self.assertEqual(cs.number_failures, 0)
+
+    def test_error_listing_containers(self):
+        with AsyncContainerListPatcher(is_ok=False):
+            with ContainerReaperPatcher() as container_reaper_patcher:
+                cs = ContainerSweeper()
+                cs.sweep()
+                self.assertEqual(cs.number_sweeps, 1)
+                self.assertEqual(cs.number_failures, 1)
+                self.assertFalse(container_reaper_patcher.container_reaper.reap.called)
+
+    def test_sweep(self):
+        min_age = 5 * 60 * 1000
+        max_age = 60 * 60 * 1000
+
+        young_exited = self._container(min_age / 2, 'exited')
+        old_exited = self._container(min_age * 2, 'exited')
+        old_running = self._container(min_age * 2, 'running')
+        ancient_running = self._container(max_age * 2, 'running')
+        pre_1_23_exited = self._container(min_age * 2, None)
+        pre_1_23_exited['Status'] = 'Exited (0) 10 minutes ago'
+        no_created_label = {'Id': uuid.uuid4().hex, 'State': 'exited', 'Labels': {}}
+
+        containers = [
+            young_exited,
+            old_exited,
+            old_running,
+            ancient_running,
+            pre_1_23_exited,
+            no_created_label,
+        ]
+
+        with mock.patch(__name__ + '.async_actions.container_sweeper_min_age', min_age):
+            with mock.patch(__name__ + '.async_actions.container_sweeper_max_age', max_age):
+                with AsyncContainerListPatcher(is_ok=True, containers=containers):
+                    with ContainerReaperPatcher() as container_reaper_patcher:
+                        container_reaper = container_reaper_patcher.container_reaper
+                        container_reaper.is_reaping.return_value = False
+
+                        cs = ContainerSweeper()
+                        cs.sweep()
+
+                        endpoint = async_docker_remote_api.docker_remote_api_endpoint
+                        self.assertEqual(
+                            container_reaper.reap.call_args_list,
+                            [
+                                mock.call(old_exited['Id'], force=True, endpoint=endpoint),
+                                mock.call(ancient_running['Id'], force=True, endpoint=endpoint),
+                                mock.call(pre_1_23_exited['Id'], force=True, endpoint=endpoint),
+                            ])
+                        self.assertEqual(cs.number_sweeps, 1)
+                        self.assertEqual(cs.number_swept, 3)
+                        self.assertEqual(cs.number_failures, 0)
+
+    def test_sweep_skips_pooled_containers(self):
+        container = self._container(60 * 60 * 1000, 'created')
+        with mock.patch(__name__ + '.async_actions.is_pooled_container', return_value=True):
+            with AsyncContainerListPatcher(is_ok=True, containers=[container]):
+                with ContainerReaperPatcher() as container_reaper_patcher:
+                    container_reaper = container_reaper_patcher.container_reaper
+                    container_reaper.is_reaping.return_value = False
+
+                    cs = ContainerSweeper()
+                    cs.sweep()
+
+                    self.assertFalse(container_reaper.reap.called)
+
+    def test_sweep_other_instances_pooled_containers(self):
+        min_age = 5 * 60 * 1000
+        max_age = 60 * 60 * 1000
+
+        young_pooled = self._container(min_age * 2, 'created')
+        young_pooled['Labels'][async_docker_remote_api.LABEL_TASK_TEMPLATE] = uuid.uuid4().hex
+        old_pooled = self._container(max_age * 2, 'created')
+        old_pooled['Labels'][async_docker_remote_api.LABEL_TASK_TEMPLATE] = uuid.uuid4().hex
+        never_started = self._container(min_age * 2, 'created')
+
+        containers = [
+            young_pooled,
+            old_pooled,
+            never_started,
+        ]
+
+        with mock.patch(__name__ + '.async_actions.container_sweeper_min_age', min_age):
+            with mock.patch(__name__ + '.async_actions.container_sweeper_max_age', max_age):
+                with AsyncContainerListPatcher(is_ok=True, containers=containers):
+                    with ContainerReaperPatcher() as container_reaper_patcher:
+                        container_reaper = container_reaper_patcher.container_reaper
+                        container_reaper.is_reaping.return_value = False
+
+                        cs = ContainerSweeper()
+                        cs.sweep()
+
+                        endpoint = async_docker_remote_api.docker_remote_api_endpoint
+                        self.assertEqual(
+                            container_reaper.reap.call_args_list,
+                            [
+                                mock.call(old_pooled['Id'], force=True, endpoint=endpoint),
+                                mock.call(never_started['Id'], force=True, endpoint=endpoint),
+                            ])
+
+    def test_sweep_skips_running_containers(self):
+        # age is measured from when a container was created so a long
+        # running task's container looks like an abandoned container
+        container = self._container(2 * 60 * 60 * 1000, 'running')
+        with mock.patch(__name__ + '.async_actions._running_container_ids', set([container['Id']])):
+            with AsyncContainerListPatcher(is_ok=True, containers=[container]):
+                with ContainerReaperPatcher() as container_reaper_patcher:
+                    container_reaper = container_reaper_patcher.container_reaper
+                    container_reaper.is_reaping.return_value = False
+
+                    cs = ContainerSweeper()
+                    cs.sweep()
+
+                    self.assertFalse(container_reaper.reap.called)
+
+    def test_sweep_batch_size_and_already_reaping(self):
+        containers = [self._container(60 * 60 * 1000, 'exited') for i in range(5)]
+
+        with mock.patch(__name__ + '.async_actions.container_sweeper_batch_size', 2):
+            with AsyncContainerListPatcher(is_ok=True, containers=containers):
+                with ContainerReaperPatcher() as container_reaper_patcher:
+                    container_reaper = container_reaper_patcher.container_reaper
+                    container_reaper.is_reaping.side_effect = \
+                        lambda container_id: container_id == containers[0]['Id']
+
+                    cs = ContainerSweeper()
+                    cs.sweep()
+
+                    endpoint = async_docker_remote_api.docker_remote_api_endpoint
+                    self.assertEqual(
+                        container_reaper.reap.call_args_list,
+                        [
+                            mock.call(containers[1]['Id'], force=True, endpoint=endpoint),
+                            mock.call(containers[2]['Id'], force=True, endpoint=endpoint),
+                        ])
+
+
+class TaskTemplateTestCase(unittest.TestCase):
+
+    def test_ctr(self):
+        name = uuid.uuid4().hex
+        docker_image = uuid.uuid4().hex
+        cmd = [uuid.uuid4().hex]
+
+        with mock.patch(__name__ + '.async_actions.task_template_pool_size', 3):
+            tt = TaskTemplate(name, docker_image, cmd)
+
+        self.assertTrue(tt.name is name)
+        self.assertTrue(tt.docker_image is docker_image)
+        self.assertTrue(tt.cmd is cmd)
+        self.assertIsNone(tt.email)
+        self.assertIsNone(tt.username)
+        self.assertIsNone(tt.password)
+        self.assertEqual(tt.pool_size, 3)
+        self.assertEqual(tt.number_available, 0)
+        self.assertEqual(tt.number_taken, 0)
+        self.assertEqual(tt.number_misses, 0)
+
+    def test_take_from_empty_pool(self):
+        with DeferredAsyncContainerCreatePatcher() as patcher:
+            tt = TaskTemplate(uuid.uuid4().hex, uuid.uuid4().hex, [uuid.uuid4().hex], pool_size=2)
+            self.assertIsNone(tt.take())
+            self.assertEqual(tt.number_misses, 1)
+            # pool isn't filled until started
+            self.assertEqual(patcher.number_in_progress, 0)
+
+    def test_fill_and_take(self):
+        with DeferredAsyncContainerCreatePatcher() as patcher:
+            tt = TaskTemplate(uuid.uuid4().hex, uuid.uuid4().hex, [uuid.uuid4().hex], pool_size=2)
+            tt.start()
+            self.assertEqual(patcher.number_in_progress, 2)
+            self.assertEqual(patcher.accs[0].docker_image, tt.docker_image)
+            self.assertEqual(patcher.accs[0].cmd, tt.cmd)
+            self.assertEqual(patcher.accs[0].task_template, tt.name)
+
+            container_ids = [uuid.uuid4().hex for i in range(2)]
+            patcher.respond(patcher.accs[0], True, container_ids[0])
+            patcher.respond(patcher.accs[1], True, container_ids[1])
+            self.assertEqual(tt.number_available, 2)
+            self.assertTrue(tt.is_pooled(container_ids[0]))
+            self.assertEqual(patcher.number_in_progress, 0)
+
+            self.assertEqual(tt.take(), container_ids[0])
+            self.assertFalse(tt.is_pooled(container_ids[0]))
+            self.assertEqual(tt.number_taken, 1)
+            self.assertEqual(tt.number_available, 1)
+
+            # taking a container triggers creating a replacement
+            self.assertEqual(patcher.number_in_progress, 1)
+
+    def test_image_not_found_pulls_image(self):
+        with DeferredAsyncContainerCreatePatcher() as patcher:
+            with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+                tt = TaskTemplate(uuid.uuid4().hex, uuid.uuid4().hex, [uuid.uuid4().hex], pool_size=2)
+                tt.start()
+                patcher.respond_to_all(
+                    False,
+                    async_docker_remote_api.AsyncContainerCreate.CFD_IMAGE_NOT_FOUND)
+                self.assertEqual(len(patcher.accs), 4)
+                self.assertEqual(patcher.number_in_progress, 2)
+
+    def test_image_not_found_after_pull_retries(self):
+        with DeferredAsyncContainerCreatePatcher() as patcher:
+            with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+                with mock.patch('tornado.ioloop.IOLoop.add_timeout') as add_timeout:
+                    tt = TaskTemplate(uuid.uuid4().hex, uuid.uuid4().hex, [uuid.uuid4().hex], pool_size=2)
+                    tt.start()
+                    patcher.respond_to_all(
+                        False,
+                        async_docker_remote_api.AsyncContainerCreate.CFD_IMAGE_NOT_FOUND)
+                    self.assertEqual(len(patcher.accs), 4)
+
+                    # image still not found after a successful pull
+                    patcher.respond_to_all(
+                        False,
+                        async_docker_remote_api.AsyncContainerCreate.CFD_IMAGE_NOT_FOUND)
+                    self.assertEqual(add_timeout.call_count, 1)
+                    self.assertEqual(len(patcher.accs), 4)
+                    self.assertEqual(patcher.number_in_progress, 0)
+
+                    (deadline, retry) = add_timeout.call_args[0]
+                    retry()
+                    self.assertEqual(len(patcher.accs), 6)
+                    self.assertEqual(patcher.number_in_progress, 2)
+
+    def test_create_error_retries(self):
+        with DeferredAsyncContainerCreatePatcher() as patcher:
+            with mock.patch('tornado.ioloop.IOLoop.add_timeout') as add_timeout:
+                tt = TaskTemplate(uuid.uuid4().hex, uuid.uuid4().hex, [uuid.uuid4().hex], pool_size=2)
+                tt.start()
+                patcher.respond_to_all(
+                    False,
+                    async_docker_remote_api.AsyncContainerCreate.CFD_ERROR_CREATING_CONTAINER)
+                self.assertEqual(add_timeout.call_count, 1)
+                self.assertEqual(patcher.number_in_progress, 0)
+
+                # no creates while waiting to retry
+                self.assertIsNone(tt.take())
+                self.assertEqual(patcher.number_in_progress, 0)
+
+                (deadline, retry) = add_timeout.call_args[0]
+                retry()
+                self.assertEqual(patcher.number_in_progress, 2)
+
 
 class AsyncEndToEndContainerRunnerTestCase(unittest.TestCase):
 
@@ -193,15 +653,31 @@ class AsyncEndToEndContainerRunnerTestCase(unittest.TestCase):
         self.assertTrue(aetecr.email is email)
         self.assertTrue(aetecr.username is username)
         self.assertTrue(aetecr.password is password)
+        self.assertEqual(aetecr.timeout, async_actions.task_max_timeout)
+        self.assertFalse(aetecr.is_timed_out)
 
         self.assertIsNone(aetecr.async_state)
 
+    def test_timeout_clamped(self):
+        with mock.patch(__name__ + '.async_actions.task_max_timeout', 5000):
+            aetecr = AsyncEndToEndContainerRunner('ubuntu:latest', ['echo'], None, None, None, timeout=10000)
+            self.assertEqual(aetecr.timeout, 5000)
+
+        with mock.patch(__name__ + '.async_actions.task_max_timeout', 0):
+            aetecr = AsyncEndToEndContainerRunner('ubuntu:latest', ['echo'], None, None, None)
+            self.assertEqual(aetecr.timeout, 0)
+
     def test_ctr_with_async_state(self):
         docker_image = uuid.uuid4().hex
         cmd = uuid.uuid4().hex
         email = uuid.uuid4().hex
         username = uuid.uuid4().hex
         password = uuid.uuid4().hex
+        pull_policy = uuid.uuid4().hex
+        task_template = mock.Mock()
+        frame_callback = mock.Mock()
+        progress_callback = mock.Mock()
+        timeout = 1000
         async_state = uuid.uuid4().hex
 
         aetecr = AsyncEndToEndContainerRunner(
@@ -210,6 +686,11 @@ class AsyncEndToEndContainerRunnerTestCase(unittest.TestCase):
             email,
             username,
             password,
+            pull_policy,
+            task_template,
+            frame_callback,
+            progress_callback,
+            timeout,
             async_state)
 
         self.assertTrue(aetecr.docker_image is docker_image)
@@ -217,6 +698,11 @@ class AsyncEndToEndContainerRunnerTestCase(unittest.TestCase):
         self.assertTrue(aetecr.email is email)
         self.assertTrue(aetecr.username is username)
         self.assertTrue(aetecr.password is password)
+        self.assertTrue(aetecr.pull_policy is pull_policy)
+        self.assertTrue(aetecr.task_template is task_template)
+        self.assertTrue(aetecr.frame_callback is frame_callback)
+        self.assertTrue(aetecr.progress_callback is progress_callback)
+        self.assertEqual(aetecr.timeout, timeout)
         self.assertTrue(aetecr.async_state is async_state)
 
     def test_error_pulling_image(self):
@@ -283,34 +769,38 @@ class AsyncEndToEndContainerRunnerTestCase(unittest.TestCase):
                     aetecr.create_failure_detail,
                     type(aetecr).CFD_ERROR_CREATING_CONTAINER)
 
-    def test_error_starting_container(self):
-        with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
-            with AsyncContainerCreatePatcher(is_ok=True, container_id=uuid.uuid4().hex):
-                with AsyncContainerStartPatcher(is_ok=False):
-                    callback = mock.Mock()
+    def test_runs_on_docker_host_for_image(self):
+        endpoints = ['http://127.0.0.1:2375', 'http://127.0.0.2:2375']
+        with mock.patch(__name__ + '.async_docker_remote_api.docker_remote_api_endpoints', endpoints):
+            with mock.patch(__name__ + '.async_docker_remote_api._docker_hosts', {}):
+                docker_image = uuid.uuid4().hex
+                docker_host = async_docker_remote_api.docker_host_for_image(docker_image)
+
+                def pull_patch(aip, callback):
+                    self.assertEqual(aip.endpoint, docker_host.endpoint)
+                    self.assertEqual(docker_host.number_tasks, 1)
+                    callback(False, None, aip)
+
+                with mock.patch(__name__ + '.async_docker_remote_api.AsyncImagePull.pull', pull_patch):
                     aetecr = AsyncEndToEndContainerRunner(
-                        docker_image=uuid.uuid4().hex,
+                        docker_image=docker_image,
                         cmd=uuid.uuid4().hex,
-                        email=uuid.uuid4().hex,
-                        username=uuid.uuid4().hex,
-                        password=uuid.uuid4().hex)
-                    aetecr.create(callback)
-                    callback.assert_called_once_with(
-                        False,
-                        None,
-                        None,
-                        None,
-                        None,
-                        aetecr)
+                        email=None,
+                        username=None,
+                        password=None)
+                    self.assertIsNone(aetecr.endpoint)
+                    aetecr.create(mock.Mock())
+                    self.assertEqual(aetecr.endpoint, docker_host.endpoint)
                     self.assertEqual(
-                        aetecr.create_failure_detail,
-                        type(aetecr).CFD_ERROR_STARTING_CONTAINER)
+                        [host.number_tasks for host in async_docker_remote_api.docker_hosts()],
+                        [0, 0])
 
-    def test_error_getting_container_status(self):
+    def test_error_starting_container(self):
+        container_id = uuid.uuid4().hex
         with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
-            with AsyncContainerCreatePatcher(is_ok=True, container_id=uuid.uuid4().hex):
-                with AsyncContainerStartPatcher(is_ok=True):
-                    with AsyncContainerStatusPatcher(is_ok=False):
+            with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
+                with AsyncContainerStartPatcher(is_ok=False):
+                    with ContainerReaperPatcher() as container_reaper_patcher:
                         callback = mock.Mock()
                         aetecr = AsyncEndToEndContainerRunner(
                             docker_image=uuid.uuid4().hex,
@@ -328,14 +818,18 @@ class AsyncEndToEndContainerRunnerTestCase(unittest.TestCase):
                             aetecr)
                         self.assertEqual(
                             aetecr.create_failure_detail,
-                            type(aetecr).CFD_WAITING_FOR_CONTAINER_TO_EXIT)
+                            type(aetecr).CFD_ERROR_STARTING_CONTAINER)
+                        container_reaper = container_reaper_patcher.container_reaper
+                        container_reaper.reap.assert_called_once_with(
+                            container_id, False, async_docker_remote_api.docker_remote_api_endpoint)
 
-    def test_error_getting_container_logs(self):
+    def test_error_getting_container_status(self):
+        container_id = uuid.uuid4().hex
         with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
-            with AsyncContainerCreatePatcher(is_ok=True, container_id=uuid.uuid4().hex):
+            with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
                 with AsyncContainerStartPatcher(is_ok=True):
-                    with AsyncContainerStatusPatcher(is_ok=True, exit_code=0):
-                        with AsyncContainerLogsPatcher(is_ok=False):
+                    with AsyncContainerStatusPatcher(is_ok=False):
+                        with ContainerReaperPatcher() as container_reaper_patcher:
                             callback = mock.Mock()
                             aetecr = AsyncEndToEndContainerRunner(
                                 docker_image=uuid.uuid4().hex,
@@ -353,15 +847,19 @@ class AsyncEndToEndContainerRunnerTestCase(unittest.TestCase):
                                 aetecr)
                             self.assertEqual(
                                 aetecr.create_failure_detail,
-                                type(aetecr).CFD_ERROR_FETCHING_CONTAINER_LOGS)
+                                type(aetecr).CFD_WAITING_FOR_CONTAINER_TO_EXIT)
+                            container_reaper = container_reaper_patcher.container_reaper
+                        container_reaper.reap.assert_called_once_with(
+                            container_id, True, async_docker_remote_api.docker_remote_api_endpoint)
 
-    def test_error_deleting_container(self):
+    def test_error_getting_container_logs(self):
+        container_id = uuid.uuid4().hex
         with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
-            with AsyncContainerCreatePatcher(is_ok=True, container_id=uuid.uuid4().hex):
+            with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
                 with AsyncContainerStartPatcher(is_ok=True):
                     with AsyncContainerStatusPatcher(is_ok=True, exit_code=0):
-                        with AsyncContainerLogsPatcher(is_ok=True, stdout='', stderr=''):
-                            with AsyncContainerDeletePatcher(is_ok=False):
+                        with AsyncContainerLogsPatcher(is_ok=False):
+                            with ContainerReaperPatcher() as container_reaper_patcher:
                                 callback = mock.Mock()
                                 aetecr = AsyncEndToEndContainerRunner(
                                     docker_image=uuid.uuid4().hex,
@@ -379,19 +877,28 @@ class AsyncEndToEndContainerRunnerTestCase(unittest.TestCase):
                                     aetecr)
                                 self.assertEqual(
                                     aetecr.create_failure_detail,
-                                    type(aetecr).CFD_ERROR_DELETING_CONTAINER)
+                                    type(aetecr).CFD_ERROR_FETCHING_CONTAINER_LOGS)
+                                container_reaper = container_reaper_patcher.container_reaper
+                        container_reaper.reap.assert_called_once_with(
+                            container_id, False, async_docker_remote_api.docker_remote_api_endpoint)
 
     def test_happy_path(self):
         exit_code = 0
         stdout = uuid.uuid4().hex
         stderr = uuid.uuid4().hex
+        container_id = uuid.uuid4().hex
         with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
-            with AsyncContainerCreatePatcher(is_ok=True, container_id=uuid.uuid4().hex):
+            with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
                 with AsyncContainerStartPatcher(is_ok=True):
                     with AsyncContainerStatusPatcher(is_ok=True, exit_code=exit_code):
                         with AsyncContainerLogsPatcher(is_ok=True, stdout=stdout, stderr=stderr):
-                            with AsyncContainerDeletePatcher(is_ok=True):
-                                callback = mock.Mock()
+                            with ContainerReaperPatcher() as container_reaper_patcher:
+                                container_reaper = container_reaper_patcher.container_reaper
+
+                                def callback(*args, **kwargs):
+                                    self.assertFalse(container_reaper.reap.called)
+
+                                callback = mock.Mock(side_effect=callback)
                                 aetecr = AsyncEndToEndContainerRunner(
                                     docker_image=uuid.uuid4().hex,
                                     cmd=uuid.uuid4().hex,
@@ -409,6 +916,565 @@ class AsyncEndToEndContainerRunnerTestCase(unittest.TestCase):
                                 self.assertEqual(
                                     aetecr.create_failure_detail,
                                     type(aetecr).CFD_OK)
+                                container_reaper.reap.assert_called_once_with(
+                                    container_id, False, async_docker_remote_api.docker_remote_api_endpoint)
+
+    def test_progress_callback(self):
+        container_id = uuid.uuid4().hex
+        progress_callback = mock.Mock()
+        with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+            with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
+                with AsyncContainerStartPatcher(is_ok=True):
+                    with AsyncContainerStatusPatcher(is_ok=True, exit_code=2):
+                        with AsyncContainerLogsPatcher(is_ok=True, stdout='', stderr=''):
+                            with ContainerReaperPatcher():
+                                callback = mock.Mock()
+                                aetecr = AsyncEndToEndContainerRunner(
+                                    docker_image=uuid.uuid4().hex,
+                                    cmd=[uuid.uuid4().hex],
+                                    email=None,
+                                    username=None,
+                                    password=None,
+                                    progress_callback=progress_callback)
+                                self.assertIsNone(aetecr.exit_code)
+                                aetecr.create(callback)
+                                callback.assert_called_once_with(True, True, 2, '', '', aetecr)
+                                self.assertEqual(
+                                    progress_callback.call_args_list,
+                                    [
+                                        mock.call(type(aetecr).PROGRESS_PULLED, aetecr),
+                                        mock.call(type(aetecr).PROGRESS_STARTED, aetecr),
+                                        mock.call(type(aetecr).PROGRESS_EXITED, aetecr),
+                                    ])
+                                self.assertEqual(aetecr.exit_code, 2)
+
+    def test_metrics(self):
+        with mock.patch(__name__ + '.metrics.metrics', metrics.Metrics()) as patched_metrics:
+            with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+                with AsyncContainerCreatePatcher(is_ok=True, container_id=uuid.uuid4().hex):
+                    with AsyncContainerStartPatcher(is_ok=True):
+                        with AsyncContainerStatusPatcher(is_ok=True, exit_code=0):
+                            with AsyncContainerLogsPatcher(is_ok=True, stdout='', stderr=''):
+                                with ContainerReaperPatcher():
+                                    aetecr = AsyncEndToEndContainerRunner(
+                                        docker_image=uuid.uuid4().hex,
+                                        cmd=[uuid.uuid4().hex],
+                                        email=None,
+                                        username=None,
+                                        password=None)
+                                    aetecr.create(mock.Mock())
+
+            phase_counts = {
+                phase: histogram.count
+                for (phase, histogram) in patched_metrics.phase_durations.items()
+            }
+            expected_phase_counts = {
+                metrics.PHASE_PULL: 1,
+                metrics.PHASE_CREATE: 1,
+                metrics.PHASE_START: 1,
+                metrics.PHASE_WAIT: 1,
+                metrics.PHASE_LOGS: 1,
+                metrics.PHASE_DELETE: 0,
+            }
+            self.assertEqual(phase_counts, expected_phase_counts)
+
+            self.assertIsNotNone(aetecr.started_at)
+            self.assertEqual(
+                sorted(aetecr.phase_durations.keys()),
+                sorted([phase for (phase, count) in expected_phase_counts.items() if count]))
+            for (phase, duration) in aetecr.phase_durations.items():
+                self.assertEqual(duration, patched_metrics.phase_durations[phase].sum)
+
+            key = (AsyncEndToEndContainerRunner, 'CFD', AsyncEndToEndContainerRunner.CFD_OK)
+            self.assertEqual(patched_metrics.failure_details, {key: 1})
+
+    def test_streaming_happy_path(self):
+        container_id = uuid.uuid4().hex
+        frame_callback = mock.Mock()
+        acls = []
+
+        def fetch_patch(acl, callback):
+            acls.append(acl)
+            acl.frame_callback(async_docker_remote_api.StreamDemuxer.STDOUT, 'out')
+            callback(True, None, None, acl)
+
+        with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+            with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
+                with AsyncContainerStartPatcher(is_ok=True):
+                    with AsyncContainerStatusPatcher(is_ok=True, exit_code=1):
+                        with mock.patch(__name__ + '.async_docker_remote_api.AsyncContainerLogs.fetch', fetch_patch):
+                            with ContainerReaperPatcher() as container_reaper_patcher:
+                                callback = mock.Mock()
+                                aetecr = AsyncEndToEndContainerRunner(
+                                    docker_image=uuid.uuid4().hex,
+                                    cmd=[uuid.uuid4().hex],
+                                    email=None,
+                                    username=None,
+                                    password=None,
+                                    frame_callback=frame_callback)
+                                aetecr.create(callback)
+                                self.assertEqual(len(acls), 1)
+                                self.assertTrue(acls[0].follow)
+                                frame_callback.assert_called_once_with(
+                                    async_docker_remote_api.StreamDemuxer.STDOUT,
+                                    'out')
+                                callback.assert_called_once_with(True, True, 1, None, None, aetecr)
+                                self.assertEqual(
+                                    aetecr.create_failure_detail,
+                                    type(aetecr).CFD_OK)
+                                container_reaper = container_reaper_patcher.container_reaper
+                                container_reaper.reap.assert_called_once_with(
+                                    container_id, False, async_docker_remote_api.docker_remote_api_endpoint)
+
+    def test_streaming_error_following_logs(self):
+        container_id = uuid.uuid4().hex
+        with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+            with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
+                with AsyncContainerStartPatcher(is_ok=True):
+                    with AsyncContainerLogsPatcher(is_ok=False):
+                        with mock.patch(__name__ + '.async_docker_remote_api.AsyncContainerStatus.fetch') as fetch:
+                            with ContainerReaperPatcher() as container_reaper_patcher:
+                                callback = mock.Mock()
+                                aetecr = AsyncEndToEndContainerRunner(
+                                    docker_image=uuid.uuid4().hex,
+                                    cmd=[uuid.uuid4().hex],
+                                    email=None,
+                                    username=None,
+                                    password=None,
+                                    frame_callback=mock.Mock())
+                                aetecr.create(callback)
+                                callback.assert_called_once_with(False, None, None, None, None, aetecr)
+                                self.assertEqual(
+                                    aetecr.create_failure_detail,
+                                    type(aetecr).CFD_ERROR_FETCHING_CONTAINER_LOGS)
+                                self.assertFalse(fetch.called)
+                                container_reaper = container_reaper_patcher.container_reaper
+                                container_reaper.reap.assert_called_once_with(
+                                    container_id, True, async_docker_remote_api.docker_remote_api_endpoint)
+
+    def test_timeout_kills_container(self):
+        container_id = uuid.uuid4().hex
+        acss = []
+
+        def status_fetch_patch(acs, callback):
+            acss.append(callback)
+
+        def kill_patch(ack, callback):
+            self.assertEqual(ack.container_id, container_id)
+            # killing the container ends the wait for the container to exit
+            acss.pop(0)(True, 137, None)
+            callback(True, ack)
+
+        with mock.patch('tornado.ioloop.IOLoop.current') as current:
+            io_loop = current.return_value
+            with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+                with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
+                    with AsyncContainerStartPatcher(is_ok=True):
+                        with mock.patch(
+                                __name__ + '.async_docker_remote_api.AsyncContainerStatus.fetch',
+                                status_fetch_patch):
+                            with mock.patch(__name__ + '.async_docker_remote_api.AsyncContainerKill.kill', kill_patch):
+                                with AsyncContainerLogsPatcher(is_ok=True, stdout='partial', stderr=''):
+                                    with ContainerReaperPatcher():
+                                        callback = mock.Mock()
+                                        aetecr = AsyncEndToEndContainerRunner(
+                                            docker_image=uuid.uuid4().hex,
+                                            cmd=[uuid.uuid4().hex],
+                                            email=None,
+                                            username=None,
+                                            password=None,
+                                            timeout=1500)
+                                        aetecr.create(callback)
+                                        self.assertFalse(callback.called)
+
+                                        (deadline, on_timeout) = io_loop.add_timeout.call_args[0]
+                                        self.assertEqual(deadline.total_seconds(), 1.5)
+
+                                        on_timeout()
+                                        callback.assert_called_once_with(True, True, 137, 'partial', '', aetecr)
+                                        self.assertTrue(aetecr.is_timed_out)
+
+    def test_timeout_kill_fails(self):
+        container_id = uuid.uuid4().hex
+        acss = []
+
+        def status_fetch_patch(acs, callback):
+            acss.append((acs, callback))
+
+        def kill_patch(ack, callback):
+            callback(False, ack)
+
+        with mock.patch('tornado.ioloop.IOLoop.current') as current:
+            io_loop = current.return_value
+            with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+                with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
+                    with AsyncContainerStartPatcher(is_ok=True):
+                        with mock.patch(
+                                __name__ + '.async_docker_remote_api.AsyncContainerStatus.fetch',
+                                status_fetch_patch):
+                            with mock.patch(__name__ + '.async_docker_remote_api.AsyncContainerKill.kill', kill_patch):
+                                with ContainerReaperPatcher() as container_reaper_patcher:
+                                    callback = mock.Mock()
+                                    aetecr = AsyncEndToEndContainerRunner(
+                                        docker_image=uuid.uuid4().hex,
+                                        cmd=[uuid.uuid4().hex],
+                                        email=None,
+                                        username=None,
+                                        password=None,
+                                        timeout=1500)
+                                    aetecr.create(callback)
+
+                                    (deadline, on_timeout) = io_loop.add_timeout.call_args[0]
+                                    on_timeout()
+
+                                    # the task finishes without waiting for the container to exit
+                                    callback.assert_called_once_with(False, None, None, None, None, aetecr)
+                                    self.assertEqual(
+                                        aetecr.create_failure_detail,
+                                        type(aetecr).CFD_ERROR_KILLING_CONTAINER)
+                                    self.assertTrue(aetecr.is_timed_out)
+                                    container_reaper = container_reaper_patcher.container_reaper
+                                    container_reaper.reap.assert_called_once_with(
+                                        container_id, True, async_docker_remote_api.docker_remote_api_endpoint)
+
+                                    # force deleting the container ends the wait which is ignored
+                                    (acs, acs_callback) = acss.pop(0)
+                                    acs_callback(False, None, acs)
+                                    self.assertEqual(callback.call_count, 1)
+                                    self.assertEqual(container_reaper.reap.call_count, 1)
+
+    def test_timeout_cancelled_when_container_exits(self):
+        with mock.patch('tornado.ioloop.IOLoop.current') as current:
+            io_loop = current.return_value
+            with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+                with AsyncContainerCreatePatcher(is_ok=True, container_id=uuid.uuid4().hex):
+                    with AsyncContainerStartPatcher(is_ok=True):
+                        with AsyncContainerStatusPatcher(is_ok=True, exit_code=0):
+                            with AsyncContainerLogsPatcher(is_ok=True, stdout='', stderr=''):
+                                with ContainerReaperPatcher():
+                                    callback = mock.Mock()
+                                    aetecr = AsyncEndToEndContainerRunner(
+                                        docker_image=uuid.uuid4().hex,
+                                        cmd=[uuid.uuid4().hex],
+                                        email=None,
+                                        username=None,
+                                        password=None)
+                                    aetecr.create(callback)
+                                    callback.assert_called_once_with(True, True, 0, '', '', aetecr)
+                                    self.assertFalse(aetecr.is_timed_out)
+                                    io_loop.remove_timeout.assert_called_once_with(io_loop.add_timeout.return_value)
+
+    def test_task_template_with_pooled_container(self):
+        container_id = uuid.uuid4().hex
+        task_template = mock.Mock()
+        task_template.take.return_value = container_id
+        with mock.patch(__name__ + '.async_docker_remote_api.AsyncImagePull.pull') as pull:
+            with mock.patch(__name__ + '.async_docker_remote_api.AsyncContainerCreate.create') as create:
+                with AsyncContainerStartPatcher(is_ok=True):
+                    with AsyncContainerStatusPatcher(is_ok=True, exit_code=0):
+                        with AsyncContainerLogsPatcher(is_ok=True, stdout='', stderr=''):
+                            with ContainerReaperPatcher() as container_reaper_patcher:
+                                callback = mock.Mock()
+                                aetecr = AsyncEndToEndContainerRunner(
+                                    docker_image=uuid.uuid4().hex,
+                                    cmd=[uuid.uuid4().hex],
+                                    email=None,
+                                    username=None,
+                                    password=None,
+                                    task_template=task_template)
+                                aetecr.create(callback)
+                                callback.assert_called_once_with(True, True, 0, '', '', aetecr)
+                                self.assertFalse(pull.called)
+                                self.assertFalse(create.called)
+                                container_reaper = container_reaper_patcher.container_reaper
+                                container_reaper.reap.assert_called_once_with(
+                                    container_id, False, async_docker_remote_api.docker_remote_api_endpoint)
+
+    def test_running_container_tracked_until_reaped(self):
+        container_id = uuid.uuid4().hex
+        is_running = []
+
+        def start_patch(acs, callback):
+            is_running.append(async_actions.is_running_container(acs.container_id))
+            callback(True, acs)
+
+        with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+            with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
+                with mock.patch(__name__ + '.async_docker_remote_api.AsyncContainerStart.start', start_patch):
+                    with AsyncContainerStatusPatcher(is_ok=True, exit_code=0):
+                        with AsyncContainerLogsPatcher(is_ok=True, stdout='', stderr=''):
+                            with ContainerReaperPatcher():
+                                callback = mock.Mock()
+                                aetecr = AsyncEndToEndContainerRunner(
+                                    docker_image=uuid.uuid4().hex,
+                                    cmd=[uuid.uuid4().hex],
+                                    email=None,
+                                    username=None,
+                                    password=None)
+                                aetecr.create(callback)
+                                callback.assert_called_once_with(True, True, 0, '', '', aetecr)
+                                self.assertEqual(is_running, [True])
+                                self.assertFalse(async_actions.is_running_container(container_id))
+
+    def test_task_template_with_empty_pool(self):
+        container_id = uuid.uuid4().hex
+        task_template = mock.Mock()
+        task_template.take.return_value = None
+        with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+            with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
+                with AsyncContainerStartPatcher(is_ok=False):
+                    with ContainerReaperPatcher():
+                        callback = mock.Mock()
+                        aetecr = AsyncEndToEndContainerRunner(
+                            docker_image=uuid.uuid4().hex,
+                            cmd=[uuid.uuid4().hex],
+                            email=None,
+                            username=None,
+                            password=None,
+                            task_template=task_template)
+                        aetecr.create(callback)
+                        callback.assert_called_once_with(False, None, None, None, None, aetecr)
+                        self.assertEqual(
+                            aetecr.create_failure_detail,
+                            type(aetecr).CFD_ERROR_STARTING_CONTAINER)
+
+    def test_task_template_pooled_container_fails_to_start(self):
+        pooled_container_id = uuid.uuid4().hex
+        container_id = uuid.uuid4().hex
+        task_template = mock.Mock()
+        task_template.take.return_value = pooled_container_id
+        started_container_ids = []
+
+        def start_patch(acs, callback):
+            started_container_ids.append(acs.container_id)
+            callback(acs.container_id == container_id, acs)
+
+        with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+            with AsyncContainerCreatePatcher(is_ok=True, container_id=container_id):
+                with mock.patch(__name__ + '.async_docker_remote_api.AsyncContainerStart.start', start_patch):
+                    with AsyncContainerStatusPatcher(is_ok=True, exit_code=0):
+                        with AsyncContainerLogsPatcher(is_ok=True, stdout='', stderr=''):
+                            with ContainerReaperPatcher() as container_reaper_patcher:
+                                callback = mock.Mock()
+                                aetecr = AsyncEndToEndContainerRunner(
+                                    docker_image=uuid.uuid4().hex,
+                                    cmd=[uuid.uuid4().hex],
+                                    email=None,
+                                    username=None,
+                                    password=None,
+                                    task_template=task_template)
+                                aetecr.create(callback)
+                                callback.assert_called_once_with(True, True, 0, '', '', aetecr)
+                                self.assertEqual(started_container_ids, [pooled_container_id, container_id])
+                                container_reaper = container_reaper_patcher.container_reaper
+                                endpoint = async_docker_remote_api.docker_remote_api_endpoint
+                                self.assertEqual(
+                                    container_reaper.reap.call_args_list,
+                                    [
+                                        mock.call(pooled_container_id, False, endpoint),
+                                        mock.call(container_id, False, endpoint),
+                                    ])
+
+    def test_pull_policy_if_not_present_and_image_present(self):
+        docker_image = uuid.uuid4().hex
+        async_docker_remote_api.mark_image_present(docker_image)
+
+        with AsyncImagePullPatcher(is_ok=False, is_image_found=None):
+            with AsyncContainerCreatePatcher(is_ok=False):
+                callback = mock.Mock()
+                aetecr = AsyncEndToEndContainerRunner(
+                    docker_image=docker_image,
+                    cmd=uuid.uuid4().hex,
+                    email=None,
+                    username=None,
+                    password=None,
+                    pull_policy=async_actions.PULL_POLICY_IF_NOT_PRESENT)
+                aetecr.create(callback)
+                self.assertEqual(
+                    aetecr.create_failure_detail,
+                    type(aetecr).CFD_ERROR_CREATING_CONTAINER)
+
+    def test_pull_policy_if_not_present_and_image_not_present(self):
+        with AsyncImagePullPatcher(is_ok=False, is_image_found=None):
+            callback = mock.Mock()
+            aetecr = AsyncEndToEndContainerRunner(
+                docker_image=uuid.uuid4().hex,
+                cmd=uuid.uuid4().hex,
+                email=None,
+                username=None,
+                password=None,
+                pull_policy=async_actions.PULL_POLICY_IF_NOT_PRESENT)
+            aetecr.create(callback)
+            self.assertEqual(
+                aetecr.create_failure_detail,
+                type(aetecr).CFD_ERROR_PULLING_IMAGE)
+
+    def test_pull_policy_if_not_present_and_image_no_longer_present(self):
+        docker_image = uuid.uuid4().hex
+        async_docker_remote_api.mark_image_present(docker_image)
+
+        with AsyncImagePullPatcher(is_ok=True, is_image_found=False):
+            create_failure_detail = async_docker_remote_api.AsyncContainerCreate.CFD_IMAGE_NOT_FOUND
+            with AsyncContainerCreatePatcher(is_ok=False, create_failure_detail=create_failure_detail):
+                callback = mock.Mock()
+                aetecr = AsyncEndToEndContainerRunner(
+                    docker_image=docker_image,
+                    cmd=uuid.uuid4().hex,
+                    email=None,
+                    username=None,
+                    password=None,
+                    pull_policy=async_actions.PULL_POLICY_IF_NOT_PRESENT)
+                aetecr.create(callback)
+                callback.assert_called_once_with(
+                    True,
+                    False,
+                    None,
+                    None,
+                    None,
+                    aetecr)
+                self.assertFalse(async_docker_remote_api.is_image_present(docker_image))
+
+    def test_pull_policy_never_and_image_not_found(self):
+        with AsyncImagePullPatcher(is_ok=True, is_image_found=True):
+            create_failure_detail = async_docker_remote_api.AsyncContainerCreate.CFD_IMAGE_NOT_FOUND
+            with AsyncContainerCreatePatcher(is_ok=False, create_failure_detail=create_failure_detail):
+                callback = mock.Mock()
+                aetecr = AsyncEndToEndContainerRunner(
+                    docker_image=uuid.uuid4().hex,
+                    cmd=uuid.uuid4().hex,
+                    email=None,
+                    username=None,
+                    password=None,
+                    pull_policy=async_actions.PULL_POLICY_NEVER)
+                aetecr.create(callback)
+                callback.assert_called_once_with(
+                    True,
+                    False,
+                    None,
+                    None,
+                    None,
+                    aetecr)
+                self.assertEqual(
+                    aetecr.create_failure_detail,
+                    type(aetecr).CFD_IMAGE_NOT_FOUND)
+
+
+class DeferredAsyncDockerRemoteAPIHealthCheckerPatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch which records calls to async_docker_remote_api.AsyncHealthChecker.check()
+    without calling back. The caller calls back using respond().
+    """
+
+    def __init__(self):
+        self.callbacks = []
+
+        def check_patch(ahc, callback):
+            self.callbacks.append((ahc, callback))
+
+        patcher = mock.patch(
+            __name__ + '.async_docker_remote_api.AsyncHealthChecker.check',
+            check_patch)
+
+        Patcher.__init__(self, patcher)
+
+    def respond(self, details):
+        (ahc, callback) = self.callbacks.pop(0)
+        callback(details, ahc)
+
+
+class HealthCheckCacheTestCase(unittest.TestCase):
+
+    def test_ctr(self):
+        hcc = HealthCheckCache()
+        self.assertIsNone(hcc.details)
+        self.assertIsNone(hcc.age)
+        self.assertEqual(hcc.number_refreshes, 0)
+        self.assertFalse(hcc.is_started)
+
+    def test_start_and_stop(self):
+        with mock.patch('tornado.ioloop.PeriodicCallback') as periodic_callback:
+            with DeferredAsyncDockerRemoteAPIHealthCheckerPatcher() as patcher:
+                hcc = HealthCheckCache()
+                hcc.start()
+                self.assertTrue(hcc.is_started)
+                periodic_callback.assert_called_once_with(hcc.refresh, async_actions.health_check_refresh_interval)
+                self.assertEqual(len(patcher.callbacks), 1)
+
+                # start is idempotent
+                hcc.start()
+                self.assertEqual(periodic_callback.call_count, 1)
+
+                hcc.stop()
+                self.assertFalse(hcc.is_started)
+                periodic_callback.return_value.stop.assert_called_once_with()
+
+    def test_start_disabled(self):
+        with mock.patch(__name__ + '.async_actions.health_check_refresh_interval', 0):
+            hcc = HealthCheckCache()
+            hcc.start()
+            self.assertFalse(hcc.is_started)
+
+    def test_get_waits_for_first_refresh(self):
+        with DeferredAsyncDockerRemoteAPIHealthCheckerPatcher() as patcher:
+            hcc = HealthCheckCache()
+            callbacks = [mock.Mock(), mock.Mock()]
+            for callback in callbacks:
+                hcc.get(callback)
+
+            # concurrent gets share a single refresh
+            self.assertEqual(len(patcher.callbacks), 1)
+
+            details = {'connectivity': True, 'api version': True}
+            with mock.patch(__name__ + '.async_actions.time.time', return_value=100.0):
+                patcher.respond(details)
+                for callback in callbacks:
+                    callback.assert_called_once_with(details, 0.0)
+            self.assertEqual(hcc.number_refreshes, 1)
+
+    def test_get_cached_details(self):
+        with DeferredAsyncDockerRemoteAPIHealthCheckerPatcher() as patcher:
+            hcc = HealthCheckCache()
+            with mock.patch(__name__ + '.async_actions.time.time', return_value=100.0):
+                hcc.refresh()
+                hcc.refresh()
+                self.assertEqual(len(patcher.callbacks), 1)
+                patcher.respond({'connectivity': False})
+
+            with mock.patch(__name__ + '.async_actions.time.time', return_value=102.5):
+                callback = mock.Mock()
+                hcc.get(callback)
+                callback.assert_called_once_with({'connectivity': False}, 2.5)
+                self.assertEqual(len(patcher.callbacks), 0)
+
+    def test_refresh_times_out_after_refresh_interval(self):
+        with mock.patch(__name__ + '.async_actions.health_check_refresh_interval', 5000):
+            with DeferredAsyncDockerRemoteAPIHealthCheckerPatcher() as patcher:
+                hcc = HealthCheckCache()
+                hcc.refresh()
+                (ahc, callback) = patcher.callbacks[0]
+                self.assertEqual(ahc.request_timeout, 5000)
+
+    def test_get_stale_details(self):
+        with mock.patch(__name__ + '.async_actions.health_check_refresh_interval', 5000):
+            with DeferredAsyncDockerRemoteAPIHealthCheckerPatcher() as patcher:
+                hcc = HealthCheckCache()
+                details = {'connectivity': True, 'api version': True}
+                with mock.patch(__name__ + '.async_actions.time.time', return_value=100.0):
+                    hcc.refresh()
+                    patcher.respond(details)
+
+                # a refresh against a hung docker remote api
+                hcc.refresh()
+
+                with mock.patch(__name__ + '.async_actions.time.time', return_value=115.0):
+                    callback = mock.Mock()
+                    hcc.get(callback)
+                    callback.assert_called_once_with(details, 15.0)
+
+                with mock.patch(__name__ + '.async_actions.time.time', return_value=115.5):
+                    callback = mock.Mock()
+                    hcc.get(callback)
+                    callback.assert_called_once_with({'connectivity': False}, 15.5)
 
 
 class AsyncHealthCheckerTestCase(unittest.TestCase):
@@ -451,3 +1517,59 @@ class AsyncHealthCheckerTestCase(unittest.TestCase):
                 'docker remote api': details,
             }
             callback.assert_called_once_with(expected_response, ahc)
+
+    def test_is_quick_false_with_health_check_cache(self):
+        details = {
+            'connectivity': True,
+            'api version': True,
+        }
+        with DeferredAsyncDockerRemoteAPIHealthCheckerPatcher() as patcher:
+            hcc = HealthCheckCache()
+            hcc._periodic_callback = mock.Mock()
+            with mock.patch(__name__ + '.async_actions.time.time', return_value=100.0):
+                hcc.refresh()
+                patcher.respond(details)
+
+            with mock.patch(__name__ + '.async_actions.health_check_cache', hcc):
+                with mock.patch(__name__ + '.async_actions.time.time', return_value=107.9):
+                    request_handler = mock.Mock()
+                    callback = mock.Mock()
+                    ahc = AsyncHealthChecker(False, request_handler)
+                    ahc.check(callback)
+                    expected_response = {
+                        'docker remote api': details,
+                    }
+                    callback.assert_called_once_with(expected_response, ahc)
+                    request_handler.set_header.assert_called_once_with('Age', '7')
+                    self.assertEqual(len(patcher.callbacks), 0)
+
+    def test_is_quick_false_with_event_loop_monitor(self):
+        details = {
+            'connectivity': True,
+        }
+        elm = event_loop_monitor.EventLoopMonitor()
+        elm._io_loop = mock.Mock()
+        elm.lags.extend([0.001] * 98 + [0.002, 0.3])
+
+        with mock.patch(__name__ + '.event_loop_monitor.event_loop_monitor', elm):
+            with mock.patch(__name__ + '.event_loop_monitor.event_loop_lag_threshold', 250):
+                with AsyncDockerRemoteAPIHealthCheckerPatcher(details):
+                    request_handler = mock.Mock()
+                    callback = mock.Mock()
+                    ahc = AsyncHealthChecker(False, request_handler)
+                    ahc.check(callback)
+                    expected_response = {
+                        'docker remote api': details,
+                        'event loop': True,
+                    }
+                    callback.assert_called_once_with(expected_response, ahc)
+                    request_handler.set_header.assert_called_once_with(
+                        'Server-Timing',
+                        'event-loop-lag-p50;dur=1.000, event-loop-lag-p90;dur=1.000, event-loop-lag-p99;dur=2.000')
+
+                    elm.lags.extend([0.3] * 2)
+                    callback = mock.Mock()
+                    ahc = AsyncHealthChecker(False)
+                    ahc.check(callback)
+                    expected_response['event loop'] = False
+                    callback.assert_called_once_with(expected_response, ahc)
@@ -4,18 +4,49 @@ validate the ..async_docker_remote_api module.
 
 import httplib
 import json
+import os
+import struct
+import tempfile
+import time
 import unittest
+import urllib
 import uuid
 
 import mock
-
+import pycurl
+import tornado.gen
+import tornado.httpclient
+import tornado.httpserver
+import tornado.netutil
+import tornado.testing
+import tornado.web
+
+from .. import async_docker_remote_api
 from ..async_docker_remote_api import AsyncContainerCreate
 from ..async_docker_remote_api import AsyncContainerDelete
+from ..async_docker_remote_api import AsyncContainerKill
+from ..async_docker_remote_api import AsyncContainerList
 from ..async_docker_remote_api import AsyncContainerLogs
 from ..async_docker_remote_api import AsyncContainerStart
 from ..async_docker_remote_api import AsyncContainerStatus
 from ..async_docker_remote_api import AsyncImagePull
 from ..async_docker_remote_api import AsyncHealthChecker
+from ..async_docker_remote_api import Bulkhead
+from ..async_docker_remote_api import DockerHost
+from ..async_docker_remote_api import BULKHEAD_CREATE
+from ..async_docker_remote_api import BULKHEAD_DELETE
+from ..async_docker_remote_api import BULKHEAD_KILL
+from ..async_docker_remote_api import BULKHEAD_LOGS
+from ..async_docker_remote_api import BULKHEAD_PULL
+from ..async_docker_remote_api import BULKHEAD_STATUS
+from ..async_docker_remote_api import EventStream
+from ..async_docker_remote_api import HTTPRequest
+from ..async_docker_remote_api import StreamDemuxer
+from ..async_docker_remote_api import instance_id
+from ..async_docker_remote_api import LABEL_CID
+from ..async_docker_remote_api import LABEL_CREATED
+from ..async_docker_remote_api import LABEL_INSTANCE
+from ..async_docker_remote_api import LABEL_TASK_TEMPLATE
 
 
 class Patcher(object):
@@ -66,6 +97,40 @@ class AsyncHttpClientFetchPatcher(Patcher):
             self._responses = kwargs['responses'][:]
 
 
+class DeferredAsyncHttpClientFetchPatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch which records calls to tornado.httpclient.HTTPRequest.fetch()
+    without responding to them. Responses are generated by the caller
+    using respond() which allows the caller to control the order in
+    which concurrent requests complete.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self._pending = []
+
+        def fetch_patch(ahc, request, callback):
+            self.requests.append(request)
+            self._pending.append((request, callback))
+
+        patcher = mock.patch(
+            'tornado.httpclient.AsyncHTTPClient.fetch',
+            fetch_patch)
+
+        Patcher.__init__(self, patcher)
+
+    def respond(self, response, request=None):
+        """Respond to ```request``` or, if ```request``` is None, the
+        oldest request that has not yet been responded to.
+        """
+        index = 0
+        if request is not None:
+            index = [pending_request for (pending_request, callback) in self._pending].index(request)
+        (request, callback) = self._pending.pop(index)
+        response.effective_url = request.url
+        callback(response)
+
+
 class AsyncActionIOLoopAddTimeoutPatcher(Patcher):
     """This context manager provides an easy way to install a
     patch allowing the caller to determine the behavior of
@@ -73,9 +138,20 @@ class AsyncActionIOLoopAddTimeoutPatcher(Patcher):
     """
 
     def __init__(self):
+        self._pending = []
+        self._is_running = False
 
         def add_timeout_patch(io_loop, deadline, callback, *args, **kwargs):
-            callback(*args, **kwargs)
+            # callbacks are run iteratively rather than recursively
+            # so long chains of timeouts don't exhaust the stack
+            self._pending.append((callback, args, kwargs))
+            if self._is_running:
+                return
+            self._is_running = True
+            while self._pending:
+                (callback, args, kwargs) = self._pending.pop(0)
+                callback(*args, **kwargs)
+            self._is_running = False
 
         patcher = mock.patch(
             'tornado.ioloop.IOLoop.add_timeout',
@@ -84,6 +160,834 @@ class AsyncActionIOLoopAddTimeoutPatcher(Patcher):
         Patcher.__init__(self, patcher)
 
 
+class ContainerStatusModePatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch allowing the caller to determine the value of
+    async_docker_remote_api.container_status_mode.
+    """
+
+    def __init__(self, container_status_mode):
+        patcher = mock.patch(
+            async_docker_remote_api.__name__ + '.container_status_mode',
+            container_status_mode)
+
+        Patcher.__init__(self, patcher)
+
+
+class DockerRemoteAPIEndpointPatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch allowing the caller to determine the value of
+    async_docker_remote_api.docker_remote_api_endpoint.
+    """
+
+    def __init__(self, docker_remote_api_endpoint):
+        patcher = mock.patch(
+            async_docker_remote_api.__name__ + '.docker_remote_api_endpoint',
+            docker_remote_api_endpoint)
+
+        Patcher.__init__(self, patcher)
+
+
+class DockerHostsPatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch allowing the caller to determine the value of
+    async_docker_remote_api.docker_remote_api_endpoints and
+    which ensures new DockerHosts are created by
+    async_docker_remote_api.docker_host().
+    """
+
+    def __init__(self, docker_remote_api_endpoints):
+        self._docker_hosts_patcher = mock.patch(
+            async_docker_remote_api.__name__ + '._docker_hosts',
+            {})
+
+        patcher = mock.patch(
+            async_docker_remote_api.__name__ + '.docker_remote_api_endpoints',
+            docker_remote_api_endpoints)
+
+        Patcher.__init__(self, patcher)
+
+    def __enter__(self):
+        self._docker_hosts_patcher.start()
+        return Patcher.__enter__(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        Patcher.__exit__(self, exc_type, exc_value, traceback)
+        self._docker_hosts_patcher.stop()
+
+
+class EventStreamsPatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch which ensures a new EventStream is created by
+    async_docker_remote_api.event_stream().
+    """
+
+    def __init__(self):
+        patcher = mock.patch(
+            async_docker_remote_api.__name__ + '._event_streams',
+            {})
+
+        Patcher.__init__(self, patcher)
+
+
+class HTTPRequestTestCase(unittest.TestCase):
+
+    def test_tcp_endpoint(self):
+        with DockerRemoteAPIEndpointPatcher('http://127.0.0.1:2375'):
+            request = HTTPRequest('/_ping')
+            self.assertEqual(request.url, 'http://127.0.0.1:2375/_ping')
+            self.assertIsNone(request.unix_socket_path)
+
+            # clears the unix domain socket path of a reused curl handle
+            curl = mock.Mock()
+            request.prepare_curl_callback(curl)
+            curl.unsetopt.assert_called_once_with(pycurl.UNIX_SOCKET_PATH)
+
+    def test_unix_socket_endpoint(self):
+        with DockerRemoteAPIEndpointPatcher('unix:///var/run/docker.sock'):
+            request = HTTPRequest('/_ping')
+            self.assertTrue(request.url.endswith('/_ping'))
+            self.assertEqual(request.unix_socket_path, '/var/run/docker.sock')
+
+            curl = mock.Mock()
+            request.prepare_curl_callback(curl)
+            curl.setopt.assert_called_once_with(pycurl.UNIX_SOCKET_PATH, '/var/run/docker.sock')
+
+    def test_explicit_endpoint(self):
+        with DockerRemoteAPIEndpointPatcher('http://127.0.0.1:2375'):
+            request = HTTPRequest('/_ping', endpoint='unix:///var/run/docker.sock')
+            self.assertEqual(request.unix_socket_path, '/var/run/docker.sock')
+
+            request = HTTPRequest('/_ping', endpoint='http://127.0.0.2:2375')
+            self.assertEqual(request.url, 'http://127.0.0.2:2375/_ping')
+
+    def test_is_unix_socket_endpoint(self):
+        self.assertTrue(async_docker_remote_api.is_unix_socket_endpoint('unix:///var/run/docker.sock'))
+        self.assertFalse(async_docker_remote_api.is_unix_socket_endpoint('http://127.0.0.1:2375'))
+
+
+class _EchoNameRequestHandler(tornado.web.RequestHandler):
+
+    def initialize(self, name):
+        self.name = name
+
+    def get(self):
+        self.write(self.name)
+
+
+class MixedTransportsTestCase(tornado.testing.AsyncTestCase):
+    """Requests alternating between a tcp endpoint and a unix domain
+    socket endpoint using a single curl handle must each reach the
+    right server.
+    """
+
+    def setUp(self):
+        tornado.testing.AsyncTestCase.setUp(self)
+
+        self._http_client_configuration = tornado.httpclient.AsyncHTTPClient._save_configuration()
+        tornado.httpclient.AsyncHTTPClient.configure(
+            'tornado.curl_httpclient.CurlAsyncHTTPClient',
+            max_clients=1)
+
+        self._servers = []
+
+        (tcp_socket, port) = tornado.testing.bind_unused_port()
+        self._listen(tcp_socket, 'tcp')
+        self.tcp_endpoint = 'http://127.0.0.1:%d' % port
+
+        self.unix_socket_path = os.path.join(tempfile.mkdtemp(), 'docker.sock')
+        self._listen(tornado.netutil.bind_unix_socket(self.unix_socket_path), 'unix')
+        self.unix_socket_endpoint = 'unix://%s' % self.unix_socket_path
+
+    def tearDown(self):
+        for server in self._servers:
+            server.stop()
+        os.remove(self.unix_socket_path)
+        os.rmdir(os.path.dirname(self.unix_socket_path))
+
+        tornado.httpclient.AsyncHTTPClient._restore_configuration(self._http_client_configuration)
+
+        tornado.testing.AsyncTestCase.tearDown(self)
+
+    def _listen(self, socket, name):
+        app = tornado.web.Application([(r'/_ping', _EchoNameRequestHandler, {'name': name})])
+        server = tornado.httpserver.HTTPServer(app, io_loop=self.io_loop)
+        server.add_sockets([socket])
+        self._servers.append(server)
+
+    @tornado.testing.gen_test
+    def test_tcp_unix_socket_tcp(self):
+        if not async_docker_remote_api.is_unix_socket_supported():
+            raise unittest.SkipTest('libcurl does not support unix domain sockets')
+
+        with mock.patch(async_docker_remote_api.__name__ + '._unix_socket_http_clients', {}):
+            names = []
+            for endpoint in [self.tcp_endpoint, self.unix_socket_endpoint, self.tcp_endpoint]:
+                request = HTTPRequest('/_ping', endpoint=endpoint)
+                response = yield async_docker_remote_api.http_client(request).fetch(request)
+                names.append(response.body)
+
+            self.assertEqual(names, ['tcp', 'unix', 'tcp'])
+
+
+class BulkheadTestCase(unittest.TestCase):
+
+    def _response(self, code=httplib.OK):
+        return mock.Mock(
+            code=code,
+            body=None,
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='GET'))
+
+    def test_ctr(self):
+        bulkhead = Bulkhead(BULKHEAD_PULL)
+        self.assertEqual(bulkhead.name, BULKHEAD_PULL)
+        self.assertEqual(bulkhead.number_in_progress, 0)
+        self.assertEqual(bulkhead.queue_depth, 0)
+        self.assertEqual(bulkhead.number_requests, 0)
+        self.assertEqual(bulkhead.number_queued, 0)
+        self.assertEqual(bulkhead.number_rejected, 0)
+
+    def test_max_concurrency_and_queueing(self):
+        with mock.patch.dict(async_docker_remote_api.bulkhead_max_concurrency, {BULKHEAD_PULL: 2}):
+            with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                bulkhead = Bulkhead(BULKHEAD_PULL)
+                callbacks = [mock.Mock() for i in range(4)]
+                for callback in callbacks:
+                    bulkhead.fetch(HTTPRequest('/_ping'), callback)
+
+                self.assertEqual(len(patcher.requests), 2)
+                self.assertEqual(bulkhead.number_in_progress, 2)
+                self.assertEqual(bulkhead.queue_depth, 2)
+                self.assertEqual(bulkhead.number_queued, 2)
+                self.assertEqual(bulkhead.max_observed_queue_depth, 2)
+
+                response = self._response()
+                patcher.respond(response)
+                callbacks[0].assert_called_once_with(response)
+                self.assertEqual(len(patcher.requests), 3)
+                self.assertEqual(bulkhead.number_in_progress, 2)
+                self.assertEqual(bulkhead.queue_depth, 1)
+
+                for i in range(3):
+                    patcher.respond(self._response())
+
+                self.assertEqual(bulkhead.number_in_progress, 0)
+                self.assertEqual(bulkhead.queue_depth, 0)
+                for callback in callbacks:
+                    self.assertEqual(callback.call_count, 1)
+
+    def test_queue_full(self):
+        with mock.patch.dict(async_docker_remote_api.bulkhead_max_concurrency, {BULKHEAD_PULL: 1}):
+            with mock.patch(async_docker_remote_api.__name__ + '.bulkhead_max_queue_depth', 1):
+                with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                    bulkhead = Bulkhead(BULKHEAD_PULL)
+                    bulkhead.fetch(HTTPRequest('/_ping'), mock.Mock())
+                    bulkhead.fetch(HTTPRequest('/_ping'), mock.Mock())
+
+                    callback = mock.Mock()
+                    bulkhead.fetch(HTTPRequest('/_ping'), callback)
+
+                    self.assertEqual(len(patcher.requests), 1)
+                    self.assertEqual(bulkhead.number_rejected, 1)
+                    self.assertEqual(callback.call_count, 1)
+                    self.assertEqual(callback.call_args[0][0].code, 599)
+
+
+class DockerHostTestCase(unittest.TestCase):
+
+    def _response(self, code=httplib.OK):
+        return mock.Mock(
+            code=code,
+            body=None,
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='GET'))
+
+    def test_ctr(self):
+        endpoint = uuid.uuid4().hex
+        docker_host = DockerHost(endpoint)
+        self.assertTrue(docker_host.endpoint is endpoint)
+        self.assertEqual(docker_host.number_tasks, 0)
+        self.assertEqual(docker_host.state, DockerHost.STATE_CLOSED)
+        self.assertTrue(docker_host.is_healthy)
+        self.assertEqual(docker_host.number_consecutive_failures, 0)
+        self.assertEqual(docker_host.number_trips, 0)
+        self.assertEqual(docker_host.number_fast_failures, 0)
+        self.assertEqual(sorted(docker_host.bulkheads.keys()), sorted(async_docker_remote_api.BULKHEADS))
+
+    def test_docker_host_per_endpoint(self):
+        with DockerHostsPatcher(['http://127.0.0.1:2375', 'http://127.0.0.2:2375']):
+            docker_hosts = async_docker_remote_api.docker_hosts()
+            self.assertEqual(
+                [docker_host.endpoint for docker_host in docker_hosts],
+                ['http://127.0.0.1:2375', 'http://127.0.0.2:2375'])
+            self.assertTrue(docker_hosts[1] is async_docker_remote_api.docker_host('http://127.0.0.2:2375'))
+
+    def test_least_loaded_docker_host(self):
+        with DockerHostsPatcher(['http://127.0.0.1:2375', 'http://127.0.0.2:2375', 'http://127.0.0.3:2375']):
+            docker_hosts = async_docker_remote_api.docker_hosts()
+            self.assertTrue(async_docker_remote_api.least_loaded_docker_host() is docker_hosts[0])
+
+            docker_hosts[0].number_tasks = 2
+            docker_hosts[1].number_tasks = 1
+            docker_hosts[2].number_tasks = 1
+            self.assertTrue(async_docker_remote_api.least_loaded_docker_host() is docker_hosts[1])
+
+            docker_hosts[1].state = DockerHost.STATE_OPEN
+            self.assertTrue(async_docker_remote_api.least_loaded_docker_host() is docker_hosts[2])
+
+            # all docker hosts unhealthy
+            docker_hosts[0].state = DockerHost.STATE_OPEN
+            docker_hosts[2].state = DockerHost.STATE_OPEN
+            self.assertTrue(async_docker_remote_api.least_loaded_docker_host() is docker_hosts[1])
+
+    def test_docker_host_for_image_with_one_docker_host(self):
+        with DockerHostsPatcher(['http://127.0.0.1:2375']):
+            docker_host = async_docker_remote_api.docker_host_for_image(uuid.uuid4().hex)
+            self.assertEqual(docker_host.endpoint, 'http://127.0.0.1:2375')
+
+    def test_docker_host_for_image_is_consistent(self):
+        endpoints = ['http://127.0.0.%d:2375' % i for i in range(1, 4)]
+        docker_images = [uuid.uuid4().hex for i in range(100)]
+
+        with DockerHostsPatcher(endpoints):
+            placements = {
+                docker_image: async_docker_remote_api.docker_host_for_image(docker_image).endpoint
+                for docker_image in docker_images
+            }
+            self.assertEqual(sorted(set(placements.values())), endpoints)
+
+            for docker_image in docker_images:
+                docker_host = async_docker_remote_api.docker_host_for_image(docker_image)
+                self.assertEqual(docker_host.endpoint, placements[docker_image])
+
+        # adding a docker host only moves docker images to the new docker host
+        new_endpoint = 'http://127.0.0.4:2375'
+        with DockerHostsPatcher(endpoints + [new_endpoint]):
+            for docker_image in docker_images:
+                docker_host = async_docker_remote_api.docker_host_for_image(docker_image)
+                self.assertIn(docker_host.endpoint, [placements[docker_image], new_endpoint])
+
+    def test_docker_host_for_image_bounded_load(self):
+        endpoints = ['http://127.0.0.%d:2375' % i for i in range(1, 4)]
+        docker_image = u'\u00e9' + uuid.uuid4().hex
+
+        with mock.patch(__name__ + '.async_docker_remote_api.docker_host_load_bound', 150):
+            with DockerHostsPatcher(endpoints):
+                docker_host = async_docker_remote_api.docker_host_for_image(docker_image)
+                for other_docker_host in async_docker_remote_api.docker_hosts():
+                    other_docker_host.number_tasks = 1
+
+                docker_host.number_tasks = 2
+                self.assertTrue(async_docker_remote_api.docker_host_for_image(docker_image) is docker_host)
+
+                # (5 + 1) tasks * 150% / 3 docker hosts = at most 3 tasks per docker host
+                docker_host.number_tasks = 3
+                spill_over_docker_host = async_docker_remote_api.docker_host_for_image(docker_image)
+                self.assertFalse(spill_over_docker_host is docker_host)
+
+                # spill over is consistent too
+                self.assertTrue(async_docker_remote_api.docker_host_for_image(docker_image) is spill_over_docker_host)
+
+                docker_host.number_tasks = 0
+                docker_host.state = DockerHost.STATE_OPEN
+                self.assertTrue(async_docker_remote_api.docker_host_for_image(docker_image) is spill_over_docker_host)
+
+    def test_docker_host_for_image_all_docker_hosts_unhealthy(self):
+        with DockerHostsPatcher(['http://127.0.0.1:2375', 'http://127.0.0.2:2375']):
+            docker_hosts = async_docker_remote_api.docker_hosts()
+            docker_hosts[0].number_tasks = 1
+            for docker_host in docker_hosts:
+                docker_host.state = DockerHost.STATE_OPEN
+            docker_host = async_docker_remote_api.docker_host_for_image(uuid.uuid4().hex)
+            self.assertTrue(docker_host is docker_hosts[1])
+
+    def _trip(self, docker_host, patcher):
+        for i in range(async_docker_remote_api.docker_host_failure_threshold):
+            docker_host.bulkheads[BULKHEAD_PULL].fetch(HTTPRequest('/_ping'), mock.Mock())
+            patcher.respond(self._response(599))
+
+    def test_circuit_breaker_trips_on_consecutive_failures(self):
+        with mock.patch(__name__ + '.async_docker_remote_api.docker_host_failure_threshold', 3):
+            with mock.patch('tornado.ioloop.IOLoop.current') as current:
+                io_loop = current.return_value
+                with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                    docker_host = DockerHost(uuid.uuid4().hex)
+                    bulkhead = docker_host.bulkheads[BULKHEAD_PULL]
+
+                    for code in [599, httplib.INTERNAL_SERVER_ERROR, httplib.NOT_FOUND, 599, 599]:
+                        bulkhead.fetch(HTTPRequest('/_ping'), mock.Mock())
+                        patcher.respond(self._response(code))
+                    self.assertEqual(docker_host.number_consecutive_failures, 2)
+                    self.assertEqual(docker_host.state, DockerHost.STATE_CLOSED)
+
+                    bulkhead.fetch(HTTPRequest('/_ping'), mock.Mock())
+                    patcher.respond(self._response(httplib.SERVICE_UNAVAILABLE))
+                    self.assertEqual(docker_host.state, DockerHost.STATE_OPEN)
+                    self.assertFalse(docker_host.is_healthy)
+                    self.assertEqual(docker_host.number_trips, 1)
+                    self.assertEqual(io_loop.add_timeout.call_count, 1)
+
+                    # requests fail fast while the circuit breaker is open
+                    callback = mock.Mock()
+                    bulkhead.fetch(HTTPRequest('/_ping'), callback)
+                    self.assertEqual(len(patcher.requests), 6)
+                    self.assertEqual(callback.call_count, 1)
+                    self.assertEqual(callback.call_args[0][0].code, 599)
+                    self.assertEqual(docker_host.number_fast_failures, 1)
+                    self.assertEqual(bulkhead.number_in_progress, 0)
+
+    def test_circuit_breaker_fails_queued_requests(self):
+        max_concurrency = dict(async_docker_remote_api.bulkhead_max_concurrency)
+        max_concurrency[BULKHEAD_PULL] = 3
+        with mock.patch(__name__ + '.async_docker_remote_api.bulkhead_max_concurrency', max_concurrency):
+            with mock.patch(__name__ + '.async_docker_remote_api.docker_host_failure_threshold', 3):
+                with mock.patch('tornado.ioloop.IOLoop.current'):
+                    with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                        docker_host = DockerHost(uuid.uuid4().hex)
+                        bulkhead = docker_host.bulkheads[BULKHEAD_PULL]
+
+                        # a hung docker host fills the bulkhead and queues requests
+                        for i in range(3):
+                            bulkhead.fetch(HTTPRequest('/_ping'), mock.Mock())
+                        queued_callbacks = [mock.Mock() for i in range(4)]
+                        for callback in queued_callbacks:
+                            bulkhead.fetch(HTTPRequest('/_ping'), callback)
+                        self.assertEqual(bulkhead.queue_depth, 4)
+
+                        # each failure frees a slot for a queued request until
+                        # the circuit breaker trips and fails the rest
+                        for i in range(3):
+                            patcher.respond(self._response(599))
+                        self.assertEqual(docker_host.state, DockerHost.STATE_OPEN)
+                        self.assertEqual(bulkhead.queue_depth, 0)
+                        self.assertEqual(len(patcher.requests), 5)
+                        for callback in queued_callbacks[:2]:
+                            self.assertFalse(callback.called)
+                        for callback in queued_callbacks[2:]:
+                            self.assertEqual(callback.call_count, 1)
+                            self.assertEqual(callback.call_args[0][0].code, 599)
+                        self.assertEqual(docker_host.number_fast_failures, 2)
+
+    def test_circuit_breaker_fails_fast_when_bulkhead_full(self):
+        max_concurrency = dict(async_docker_remote_api.bulkhead_max_concurrency)
+        max_concurrency[BULKHEAD_PULL] = 1
+        with mock.patch(__name__ + '.async_docker_remote_api.bulkhead_max_concurrency', max_concurrency):
+            with mock.patch('tornado.ioloop.IOLoop.current'):
+                with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                    docker_host = DockerHost(uuid.uuid4().hex)
+                    self._trip(docker_host, patcher)
+
+                    # a hung request holds the bulkhead's only slot
+                    bulkhead = docker_host.bulkheads[BULKHEAD_PULL]
+                    bulkhead.number_in_progress = 1
+
+                    callback = mock.Mock()
+                    bulkhead.fetch(HTTPRequest('/_ping'), callback)
+                    self.assertEqual(bulkhead.queue_depth, 0)
+                    self.assertEqual(callback.call_count, 1)
+                    self.assertEqual(callback.call_args[0][0].code, 599)
+
+    def test_circuit_breaker_ignores_task_caused_errors(self):
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            docker_host = DockerHost(uuid.uuid4().hex)
+            bulkhead = docker_host.bulkheads[BULKHEAD_CREATE]
+
+            # ex starting containers with bad cmds
+            for i in range(2 * async_docker_remote_api.docker_host_failure_threshold):
+                bulkhead.fetch(HTTPRequest('/_ping'), mock.Mock())
+                patcher.respond(self._response(httplib.INTERNAL_SERVER_ERROR))
+
+            self.assertEqual(docker_host.number_consecutive_failures, 0)
+            self.assertEqual(docker_host.state, DockerHost.STATE_CLOSED)
+            self.assertEqual(docker_host.number_trips, 0)
+
+    def test_circuit_breaker_probes(self):
+        with mock.patch('tornado.ioloop.IOLoop.current') as current:
+            io_loop = current.return_value
+            with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                with mock.patch(__name__ + '.async_docker_remote_api.AsyncHealthChecker.check') as check:
+                    docker_host = DockerHost(uuid.uuid4().hex)
+                    self._trip(docker_host, patcher)
+
+                    (delay, probe) = io_loop.add_timeout.call_args[0]
+                    self.assertEqual(
+                        delay.total_seconds(),
+                        async_docker_remote_api.docker_host_probe_interval / 1000.0)
+                    probe()
+                    self.assertEqual(docker_host.state, DockerHost.STATE_HALF_OPEN)
+                    self.assertFalse(docker_host.is_healthy)
+                    self.assertEqual(check.call_count, 1)
+
+                    (on_probe_done, ) = check.call_args[0]
+                    on_probe_done({'connectivity': False}, mock.Mock())
+                    self.assertEqual(docker_host.state, DockerHost.STATE_OPEN)
+                    self.assertEqual(io_loop.add_timeout.call_count, 2)
+
+                    (delay, probe) = io_loop.add_timeout.call_args[0]
+                    probe()
+                    (on_probe_done, ) = check.call_args[0]
+                    on_probe_done({'connectivity': True, 'api version': True}, mock.Mock())
+                    self.assertEqual(docker_host.state, DockerHost.STATE_CLOSED)
+                    self.assertTrue(docker_host.is_healthy)
+                    self.assertEqual(docker_host.number_consecutive_failures, 0)
+                    self.assertEqual(docker_host.number_trips, 1)
+
+    def test_tripped_docker_host_is_ejected(self):
+        with mock.patch('tornado.ioloop.IOLoop.current'):
+            with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                with DockerHostsPatcher(['http://127.0.0.1:2375', 'http://127.0.0.2:2375']):
+                    docker_hosts = async_docker_remote_api.docker_hosts()
+                    docker_hosts[1].number_tasks = 1
+                    self.assertTrue(async_docker_remote_api.least_loaded_docker_host() is docker_hosts[0])
+
+                    self._trip(docker_hosts[0], patcher)
+                    self.assertTrue(async_docker_remote_api.least_loaded_docker_host() is docker_hosts[1])
+                    for i in range(10):
+                        docker_host = async_docker_remote_api.docker_host_for_image(uuid.uuid4().hex)
+                        self.assertTrue(docker_host is docker_hosts[1])
+
+    def test_actions_use_their_docker_host(self):
+        response = mock.Mock(
+            code=httplib.NO_CONTENT,
+            body=None,
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='POST'))
+        with DockerHostsPatcher(['http://127.0.0.1:2375', 'http://127.0.0.2:2375']):
+            with AsyncHttpClientFetchPatcher(response=response):
+                acs = AsyncContainerStart(uuid.uuid4().hex, endpoint='http://127.0.0.2:2375')
+                acs.start(mock.Mock())
+                self.assertTrue(response.effective_url.startswith('http://127.0.0.2:2375/'))
+
+                docker_hosts = async_docker_remote_api.docker_hosts()
+                self.assertEqual(docker_hosts[0].bulkheads[BULKHEAD_CREATE].number_requests, 0)
+                self.assertEqual(docker_hosts[1].bulkheads[BULKHEAD_CREATE].number_requests, 1)
+
+
+class ImageCacheTestCase(unittest.TestCase):
+
+    def test_image_not_present(self):
+        docker_image = uuid.uuid4().hex
+        self.assertFalse(async_docker_remote_api.is_image_present(docker_image))
+
+    def test_image_present(self):
+        docker_image = uuid.uuid4().hex
+        async_docker_remote_api.mark_image_present(docker_image)
+        self.assertTrue(async_docker_remote_api.is_image_present(docker_image))
+
+    def test_image_present_is_keyed_by_creds(self):
+        docker_image = uuid.uuid4().hex
+        email = uuid.uuid4().hex
+        username = uuid.uuid4().hex
+        password = uuid.uuid4().hex
+
+        async_docker_remote_api.mark_image_present(docker_image, email, username, password)
+
+        self.assertTrue(async_docker_remote_api.is_image_present(docker_image, email, username, password))
+        self.assertFalse(async_docker_remote_api.is_image_present(docker_image))
+        self.assertFalse(async_docker_remote_api.is_image_present(docker_image, email, username, uuid.uuid4().hex))
+
+    def test_image_present_is_keyed_by_endpoint(self):
+        docker_image = uuid.uuid4().hex
+        endpoint = uuid.uuid4().hex
+
+        async_docker_remote_api.mark_image_present(docker_image, endpoint=endpoint)
+
+        self.assertTrue(async_docker_remote_api.is_image_present(docker_image, endpoint=endpoint))
+        self.assertFalse(async_docker_remote_api.is_image_present(docker_image))
+
+        async_docker_remote_api.invalidate_image(docker_image)
+        self.assertTrue(async_docker_remote_api.is_image_present(docker_image, endpoint=endpoint))
+
+        async_docker_remote_api.invalidate_image(None, endpoint)
+        self.assertFalse(async_docker_remote_api.is_image_present(docker_image, endpoint=endpoint))
+
+    def test_image_present_expires(self):
+        docker_image = uuid.uuid4().hex
+        async_docker_remote_api.mark_image_present(docker_image)
+
+        expires_at = time.time() + async_docker_remote_api.image_cache_ttl / 1000.0 + 1
+        with mock.patch('time.time', return_value=expires_at):
+            self.assertFalse(async_docker_remote_api.is_image_present(docker_image))
+
+    def test_invalidate_image(self):
+        docker_image = uuid.uuid4().hex
+        email = uuid.uuid4().hex
+        username = uuid.uuid4().hex
+        password = uuid.uuid4().hex
+
+        async_docker_remote_api.mark_image_present(docker_image)
+        async_docker_remote_api.mark_image_present(docker_image, email, username, password)
+
+        async_docker_remote_api.invalidate_image(docker_image)
+
+        self.assertFalse(async_docker_remote_api.is_image_present(docker_image))
+        self.assertFalse(async_docker_remote_api.is_image_present(docker_image, email, username, password))
+
+
+class EventStreamTestCase(unittest.TestCase):
+
+    def test_event_stream_per_endpoint(self):
+        with EventStreamsPatcher():
+            event_stream = async_docker_remote_api.event_stream()
+            self.assertTrue(event_stream is async_docker_remote_api.event_stream())
+
+    def test_start(self):
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            es = EventStream()
+            self.assertFalse(es.is_connected)
+
+            es.start()
+            self.assertTrue(es.is_connected)
+            self.assertEqual(len(patcher.requests), 1)
+            self.assertTrue('/events?' in patcher.requests[0].url)
+
+            es.start()
+            self.assertEqual(len(patcher.requests), 1)
+
+    def test_register_starts_stream(self):
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            es = EventStream()
+            es.register(uuid.uuid4().hex, mock.Mock())
+            self.assertTrue(es.is_connected)
+            self.assertEqual(len(patcher.requests), 1)
+
+    def test_events_dispatched_by_id(self):
+        container_id = uuid.uuid4().hex
+        other_container_id = uuid.uuid4().hex
+
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            es = EventStream()
+            callback = mock.Mock()
+            es.register(container_id, callback)
+
+            events = [
+                {
+                    'Type': 'container',
+                    'Action': 'die',
+                    'Actor': {
+                        'ID': other_container_id,
+                        'Attributes': {
+                            'exitCode': '0',
+                            LABEL_INSTANCE: instance_id,
+                        },
+                    },
+                    'time': 1,
+                },
+                {
+                    'Type': 'container',
+                    'Action': 'die',
+                    'Actor': {
+                        'ID': container_id,
+                        'Attributes': {
+                            'exitCode': '3',
+                            LABEL_INSTANCE: instance_id,
+                        },
+                    },
+                    'time': 2,
+                },
+            ]
+            chunk = ''.join([json.dumps(event) + '\n' for event in events])
+
+            # deliver the events split across chunks
+            streaming_callback = patcher.requests[0].streaming_callback
+            streaming_callback(chunk[:10])
+            streaming_callback(chunk[10:-10])
+            self.assertFalse(callback.called)
+            streaming_callback(chunk[-10:])
+
+            expected_event = {
+                'type': 'container',
+                'action': 'die',
+                'id': container_id,
+                'attributes': {
+                    'exitCode': '3',
+                    LABEL_INSTANCE: instance_id,
+                },
+                'time': 2,
+            }
+            callback.assert_called_once_with(expected_event)
+
+            es.unregister(container_id, callback)
+            streaming_callback(chunk)
+            callback.assert_called_once_with(expected_event)
+
+    def test_events_for_other_instances_discarded(self):
+        container_id = uuid.uuid4().hex
+
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            es = EventStream()
+            callback = mock.Mock()
+            es.register(container_id, callback)
+
+            event = {
+                'Type': 'container',
+                'Action': 'die',
+                'Actor': {
+                    'ID': container_id,
+                    'Attributes': {
+                        'exitCode': '0',
+                        LABEL_INSTANCE: uuid.uuid4().hex,
+                    },
+                },
+                'time': 1,
+            }
+            patcher.requests[0].streaming_callback(json.dumps(event) + '\n')
+
+            self.assertFalse(callback.called)
+
+    def test_pre_1_22_events(self):
+        container_id = uuid.uuid4().hex
+
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            es = EventStream()
+            callback = mock.Mock()
+            es.register(container_id, callback)
+
+            event = {
+                'status': 'die',
+                'id': container_id,
+                'from': uuid.uuid4().hex,
+                'time': 1,
+            }
+            patcher.requests[0].streaming_callback(json.dumps(event) + '\n')
+
+            expected_event = {
+                'type': 'container',
+                'action': 'die',
+                'id': container_id,
+                'attributes': {},
+                'time': 1,
+            }
+            callback.assert_called_once_with(expected_event)
+
+    def test_image_events_invalidate_image_cache(self):
+        other_endpoint = 'http://172.17.0.2:2375'
+        for action in [EventStream.EVENT_ACTION_UNTAG, EventStream.EVENT_ACTION_DELETE]:
+            docker_images = [uuid.uuid4().hex for i in range(2)]
+            for docker_image in docker_images:
+                async_docker_remote_api.mark_image_present(docker_image)
+            async_docker_remote_api.mark_image_present(docker_images[0], endpoint=other_endpoint)
+
+            with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                es = EventStream()
+                es.start()
+
+                # event as sent by the Docker Remote API - the image
+                # is identified by its ID rather than its repo:tag
+                image_id = 'sha256:%s%s' % (uuid.uuid4().hex, uuid.uuid4().hex)
+                event = {
+                    'status': action,
+                    'id': image_id,
+                    'Type': 'image',
+                    'Action': action,
+                    'Actor': {
+                        'ID': image_id,
+                        'Attributes': {
+                            'name': image_id,
+                        },
+                    },
+                    'time': 1,
+                    'timeNano': 1000000000,
+                }
+                patcher.requests[0].streaming_callback(json.dumps(event) + '\n')
+
+                for docker_image in docker_images:
+                    self.assertFalse(async_docker_remote_api.is_image_present(docker_image))
+                self.assertTrue(async_docker_remote_api.is_image_present(docker_images[0], endpoint=other_endpoint))
+
+    def test_lost_stream(self):
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            with mock.patch('tornado.ioloop.IOLoop.add_timeout') as add_timeout:
+                es = EventStream()
+                callback = mock.Mock()
+                es.register(uuid.uuid4().hex, callback)
+
+                patcher.respond(mock.Mock(
+                    code=599,
+                    body=None,
+                    time_info={},
+                    request_time=0.042,
+                    request=mock.Mock(method='GET')))
+
+                callback.assert_called_once_with(None)
+                self.assertFalse(es.is_connected)
+                self.assertTrue(add_timeout.called)
+
+
+def _frame(stream_type, payload):
+    """Generate a frame of a stream multiplexed by the Docker Remote API."""
+    return struct.pack('>BxxxL', stream_type, len(payload)) + payload
+
+
+class StreamDemuxerTestCase(unittest.TestCase):
+
+    def test_ctr(self):
+        sd = StreamDemuxer()
+        self.assertIsNone(sd.frame_callback)
+        self.assertEqual(sd.stdout, '')
+        self.assertEqual(sd.stderr, '')
+        self.assertTrue(sd.is_at_frame_boundary)
+
+    def test_multiple_frames(self):
+        stream = ''.join([
+            _frame(StreamDemuxer.STDOUT, 'dave '),
+            _frame(StreamDemuxer.STDERR, 'bad '),
+            _frame(StreamDemuxer.STDOUT, 'was '),
+            _frame(StreamDemuxer.STDOUT, ''),
+            _frame(StreamDemuxer.STDERR, 'things'),
+            _frame(StreamDemuxer.STDOUT, 'here'),
+        ])
+
+        sd = StreamDemuxer()
+        sd.feed(stream)
+
+        self.assertEqual(sd.stdout, 'dave was here')
+        self.assertEqual(sd.stderr, 'bad things')
+        self.assertTrue(sd.is_at_frame_boundary)
+
+    def test_frames_split_across_chunks(self):
+        stream = ''.join([
+            _frame(StreamDemuxer.STDOUT, 'dave was here'),
+            _frame(StreamDemuxer.STDERR, 'bad things'),
+        ])
+
+        for chunk_size in range(1, len(stream) + 1):
+            sd = StreamDemuxer()
+            for i in range(0, len(stream), chunk_size):
+                sd.feed(stream[i:i + chunk_size])
+
+            self.assertEqual(sd.stdout, 'dave was here')
+            self.assertEqual(sd.stderr, 'bad things')
+            self.assertTrue(sd.is_at_frame_boundary)
+
+    def test_partial_frame(self):
+        sd = StreamDemuxer()
+        sd.feed(_frame(StreamDemuxer.STDOUT, 'dave was here')[:-1])
+        self.assertEqual(sd.stdout, '')
+        self.assertFalse(sd.is_at_frame_boundary)
+
+    def test_frame_callback(self):
+        frame_callback = mock.Mock()
+        sd = StreamDemuxer(frame_callback)
+        sd.feed(_frame(StreamDemuxer.STDOUT, 'dave'))
+        sd.feed(_frame(StreamDemuxer.STDERR, 'was'))
+        self.assertEqual(
+            frame_callback.call_args_list,
+            [
+                mock.call(StreamDemuxer.STDOUT, 'dave'),
+                mock.call(StreamDemuxer.STDERR, 'was'),
+            ])
+        self.assertEqual(sd.stdout, '')
+        self.assertEqual(sd.stderr, '')
+
+
 class AsyncHealthCheckTestCase(unittest.TestCase):
 
     def test_ctr_without_async_state(self):
@@ -95,6 +999,22 @@ class AsyncHealthCheckTestCase(unittest.TestCase):
         ahc = AsyncHealthChecker(async_state)
         self.assertTrue(ahc.async_state is async_state)
 
+    def test_ctr_with_endpoint(self):
+        endpoint = uuid.uuid4().hex
+        ahc = AsyncHealthChecker(endpoint=endpoint)
+        self.assertTrue(ahc.endpoint is endpoint)
+        self.assertIsNone(ahc.async_state)
+        self.assertIsNone(ahc.request_timeout)
+
+    def test_request_timeout(self):
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            AsyncHealthChecker().check(mock.Mock())
+            AsyncHealthChecker(request_timeout=5000).check(mock.Mock())
+            self.assertEqual(
+                patcher.requests[0].request_timeout,
+                async_docker_remote_api.request_timeout / 1000.0)
+            self.assertEqual(patcher.requests[1].request_timeout, 5.0)
+
     def test_connectivity_failure(self):
         response = mock.Mock(
             code=httplib.NOT_FOUND,
@@ -205,6 +1125,16 @@ class AsyncImagePullTestCase(unittest.TestCase):
         self.assertTrue(aip.password is password)
         self.assertTrue(aip.async_state is async_state)
 
+    def test_ctr_with_endpoint(self):
+        docker_image = uuid.uuid4().hex
+        endpoint = uuid.uuid4().hex
+
+        aip = AsyncImagePull(docker_image, endpoint=endpoint)
+
+        self.assertTrue(aip.docker_image is docker_image)
+        self.assertTrue(aip.endpoint is endpoint)
+        self.assertIsNone(aip.async_state)
+
     def test_error_pulling_image(self):
         responses = [
             mock.Mock(
@@ -350,6 +1280,120 @@ class AsyncImagePullTestCase(unittest.TestCase):
             callback.assert_called_once_with(True, True, aip)
             self.assertEqual(aip.pull_failure_detail, type(aip).PFD_OK)
 
+        self.assertTrue(async_docker_remote_api.is_image_present(docker_image))
+
+    def test_concurrent_pulls_are_coalesced(self):
+        docker_image = uuid.uuid4().hex
+
+        image_status_response_body = [
+            {
+                'RepoTags': [
+                    docker_image,
+                ],
+            },
+        ]
+
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            aips_and_callbacks = []
+            for i in range(3):
+                aip = AsyncImagePull(docker_image=docker_image)
+                callback = mock.Mock()
+                aip.pull(callback)
+                aips_and_callbacks.append((aip, callback))
+
+            self.assertEqual(len(patcher.requests), 1)
+
+            patcher.respond(mock.Mock(
+                code=httplib.OK,
+                body=None,
+                time_info={},
+                request_time=0.042,
+                request=mock.Mock(method='POST')))
+
+            self.assertEqual(len(patcher.requests), 2)
+
+            for (aip, callback) in aips_and_callbacks:
+                self.assertFalse(callback.called)
+
+            patcher.respond(mock.Mock(
+                code=httplib.OK,
+                body=json.dumps(image_status_response_body),
+                time_info={},
+                request_time=0.042,
+                request=mock.Mock(method='GET')))
+
+            self.assertEqual(len(patcher.requests), 2)
+
+            for (aip, callback) in aips_and_callbacks:
+                callback.assert_called_once_with(True, True, aip)
+                self.assertEqual(aip.pull_failure_detail, type(aip).PFD_OK)
+
+            aip = AsyncImagePull(docker_image=docker_image)
+            aip.pull(mock.Mock())
+
+            self.assertEqual(len(patcher.requests), 3)
+
+    def test_coalesced_pulls_called_back_when_leader_callback_raises(self):
+        docker_image = uuid.uuid4().hex
+
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            leader = AsyncImagePull(docker_image=docker_image)
+            leader_callback = mock.Mock(side_effect=Exception())
+            leader.pull(leader_callback)
+
+            followers_and_callbacks = []
+            for i in range(2):
+                aip = AsyncImagePull(docker_image=docker_image)
+                callback = mock.Mock()
+                aip.pull(callback)
+                followers_and_callbacks.append((aip, callback))
+
+            self.assertEqual(len(patcher.requests), 1)
+
+            patcher.respond(mock.Mock(
+                code=httplib.OK,
+                body=None,
+                time_info={},
+                request_time=0.042,
+                request=mock.Mock(method='POST')))
+
+            with self.assertRaises(Exception):
+                patcher.respond(mock.Mock(
+                    code=httplib.INTERNAL_SERVER_ERROR,
+                    body=None,
+                    time_info={},
+                    request_time=0.042,
+                    request=mock.Mock(method='GET')))
+
+            leader_callback.assert_called_once_with(False, None, leader)
+
+            for (aip, callback) in followers_and_callbacks:
+                callback.assert_called_once_with(False, None, aip)
+                self.assertEqual(
+                    aip.pull_failure_detail,
+                    leader.pull_failure_detail)
+
+            aip = AsyncImagePull(docker_image=docker_image)
+            aip.pull(mock.Mock())
+
+            self.assertEqual(len(patcher.requests), 3)
+
+    def test_concurrent_pulls_with_different_creds_are_not_coalesced(self):
+        docker_image = uuid.uuid4().hex
+
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            aip = AsyncImagePull(docker_image=docker_image)
+            aip.pull(mock.Mock())
+
+            aip = AsyncImagePull(
+                docker_image=docker_image,
+                email=uuid.uuid4().hex,
+                username=uuid.uuid4().hex,
+                password=uuid.uuid4().hex)
+            aip.pull(mock.Mock())
+
+            self.assertEqual(len(patcher.requests), 2)
+
 
 class AsyncContainerCreateTestCase(unittest.TestCase):
 
@@ -374,7 +1418,21 @@ class AsyncContainerCreateTestCase(unittest.TestCase):
         self.assertTrue(acc.cmd is cmd)
         self.assertTrue(acc.async_state is async_state)
 
-    def test_create_error(self):
+    def test_ctr_with_cid_and_endpoint(self):
+        docker_image = uuid.uuid4().hex
+        cmd = uuid.uuid4().hex
+        cid = uuid.uuid4().hex
+        endpoint = uuid.uuid4().hex
+
+        acc = AsyncContainerCreate(docker_image, cmd, cid=cid, endpoint=endpoint)
+
+        self.assertTrue(acc.docker_image is docker_image)
+        self.assertTrue(acc.cmd is cmd)
+        self.assertTrue(acc.cid is cid)
+        self.assertTrue(acc.endpoint is endpoint)
+        self.assertIsNone(acc.async_state)
+
+    def test_image_not_found(self):
         response = mock.Mock(
             code=httplib.NOT_FOUND,
             body=None,
@@ -391,12 +1449,31 @@ class AsyncContainerCreateTestCase(unittest.TestCase):
             callback.assert_called_once_with(False, None, acc)
             self.assertEqual(
                 acc.create_failure_detail,
-                type(acc).CFD_ERROR_CREATING_CONTAINER)
+                type(acc).CFD_IMAGE_NOT_FOUND)
 
-    def test_happy_path(self):
+    def test_create_error(self):
         response = mock.Mock(
-            code=httplib.CREATED,
-            body=json.dumps({'Id': uuid.uuid4().hex}),
+            code=httplib.INTERNAL_SERVER_ERROR,
+            body=None,
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='GET'))
+        with AsyncHttpClientFetchPatcher(response=response):
+            callback = mock.Mock()
+            acc = AsyncContainerCreate(
+                docker_image=uuid.uuid4().hex,
+                cmd=uuid.uuid4().hex)
+            acc.create(callback)
+            callback.assert_called_once_with(False, None, acc)
+            self.assertEqual(
+                acc.create_failure_detail,
+                type(acc).CFD_ERROR_CREATING_CONTAINER)
+
+    def test_happy_path(self):
+        response = mock.Mock(
+            code=httplib.CREATED,
+            body=json.dumps({'Id': uuid.uuid4().hex}),
             time_info={},
             request_time=0.042,
             effective_url='http://www.bindle.com',
@@ -413,6 +1490,34 @@ class AsyncContainerCreateTestCase(unittest.TestCase):
                 acc)
             self.assertEqual(acc.create_failure_detail, type(acc).CFD_OK)
 
+    def test_container_labels(self):
+        cid = uuid.uuid4().hex
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            acc = AsyncContainerCreate(
+                docker_image=uuid.uuid4().hex,
+                cmd=uuid.uuid4().hex,
+                cid=cid)
+            acc.create(mock.Mock())
+
+            labels = json.loads(patcher.requests[0].body)['Labels']
+            self.assertEqual(labels[LABEL_INSTANCE], instance_id)
+            self.assertEqual(labels[LABEL_CID], cid)
+            self.assertTrue(int(time.time()) - int(labels[LABEL_CREATED]) <= 1)
+            self.assertNotIn(LABEL_TASK_TEMPLATE, labels)
+
+    def test_task_template_label(self):
+        task_template = uuid.uuid4().hex
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            acc = AsyncContainerCreate(
+                docker_image=uuid.uuid4().hex,
+                cmd=uuid.uuid4().hex,
+                task_template=task_template)
+            acc.create(mock.Mock())
+
+            labels = json.loads(patcher.requests[0].body)['Labels']
+            self.assertEqual(labels[LABEL_TASK_TEMPLATE], task_template)
+            self.assertNotIn(LABEL_CID, labels)
+
 
 class AsyncContainerStartTestCase(unittest.TestCase):
 
@@ -434,6 +1539,16 @@ class AsyncContainerStartTestCase(unittest.TestCase):
         self.assertTrue(acs.container_id is container_id)
         self.assertTrue(acs.async_state is async_state)
 
+    def test_ctr_with_endpoint(self):
+        container_id = uuid.uuid4().hex
+        endpoint = uuid.uuid4().hex
+
+        acs = AsyncContainerStart(container_id, endpoint=endpoint)
+
+        self.assertTrue(acs.container_id is container_id)
+        self.assertTrue(acs.endpoint is endpoint)
+        self.assertIsNone(acs.async_state)
+
     def test_start_error(self):
         response = mock.Mock(
             code=httplib.NOT_FOUND,
@@ -467,6 +1582,89 @@ class AsyncContainerStartTestCase(unittest.TestCase):
             self.assertEqual(acs.start_failure_detail, type(acs).SFD_OK)
 
 
+class AsyncContainerKillTestCase(unittest.TestCase):
+
+    def test_ctr_without_async_state(self):
+        container_id = uuid.uuid4().hex
+
+        ack = AsyncContainerKill(container_id)
+
+        self.assertTrue(ack.container_id is container_id)
+        self.assertIsNone(ack.async_state)
+
+    def test_ctr_with_async_state(self):
+        container_id = uuid.uuid4().hex
+        async_state = uuid.uuid4().hex
+
+        ack = AsyncContainerKill(container_id, async_state)
+
+        self.assertTrue(ack.container_id is container_id)
+        self.assertTrue(ack.async_state is async_state)
+
+    def test_ctr_with_endpoint(self):
+        container_id = uuid.uuid4().hex
+        endpoint = uuid.uuid4().hex
+
+        ack = AsyncContainerKill(container_id, endpoint=endpoint)
+
+        self.assertTrue(ack.container_id is container_id)
+        self.assertTrue(ack.endpoint is endpoint)
+        self.assertIsNone(ack.async_state)
+
+    def test_kill_error(self):
+        response = mock.Mock(
+            code=httplib.CONFLICT,
+            body=None,
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='POST'))
+        with AsyncHttpClientFetchPatcher(response=response):
+            callback = mock.Mock()
+            ack = AsyncContainerKill(container_id=uuid.uuid4().hex)
+            ack.kill(callback)
+            callback.assert_called_once_with(False, ack)
+            self.assertEqual(
+                ack.kill_failure_detail,
+                type(ack).KFD_ERROR_KILLING_CONTAINER)
+
+    def test_happy_path(self):
+        response = mock.Mock(
+            code=httplib.NO_CONTENT,
+            body=None,
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='POST'))
+        with AsyncHttpClientFetchPatcher(response=response):
+            callback = mock.Mock()
+            container_id = uuid.uuid4().hex
+            ack = AsyncContainerKill(container_id)
+            ack.kill(callback)
+            callback.assert_called_once_with(True, ack)
+            self.assertEqual(ack.kill_failure_detail, type(ack).KFD_OK)
+            self.assertTrue(response.effective_url.endswith('/containers/%s/kill' % container_id))
+
+    def test_kills_use_their_own_bulkhead(self):
+        response = mock.Mock(
+            code=httplib.NO_CONTENT,
+            body=None,
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='POST'))
+        with AsyncHttpClientFetchPatcher(response=response):
+            bulkheads = async_docker_remote_api.docker_host().bulkheads
+            number_kill_requests = bulkheads[BULKHEAD_KILL].number_requests
+            number_delete_requests = bulkheads[BULKHEAD_DELETE].number_requests
+
+            ack = AsyncContainerKill(uuid.uuid4().hex)
+            ack.kill(mock.Mock())
+
+            self.assertEqual(bulkheads[BULKHEAD_KILL].number_requests, number_kill_requests + 1)
+            self.assertEqual(bulkheads[BULKHEAD_DELETE].number_requests, number_delete_requests)
+
+
 class AsyncContainerDeleteTestCase(unittest.TestCase):
 
     def test_ctr_without_async_state(self):
@@ -486,9 +1684,20 @@ class AsyncContainerDeleteTestCase(unittest.TestCase):
         self.assertTrue(acd.container_id is container_id)
         self.assertTrue(acd.async_state is async_state)
 
+    def test_ctr_with_force_and_endpoint(self):
+        container_id = uuid.uuid4().hex
+        endpoint = uuid.uuid4().hex
+
+        acd = AsyncContainerDelete(container_id, force=True, endpoint=endpoint)
+
+        self.assertTrue(acd.container_id is container_id)
+        self.assertTrue(acd.force)
+        self.assertTrue(acd.endpoint is endpoint)
+        self.assertIsNone(acd.async_state)
+
     def test_delete_error(self):
         response = mock.Mock(
-            code=httplib.NOT_FOUND,
+            code=httplib.INTERNAL_SERVER_ERROR,
             body=None,
             time_info={},
             request_time=0.042,
@@ -503,6 +1712,23 @@ class AsyncContainerDeleteTestCase(unittest.TestCase):
                 acd.delete_failure_detail,
                 type(acd).DFD_ERROR_DELETING_CONTAINER)
 
+    def test_container_not_found(self):
+        response = mock.Mock(
+            code=httplib.NOT_FOUND,
+            body=None,
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='GET'))
+        with AsyncHttpClientFetchPatcher(response=response):
+            callback = mock.Mock()
+            acd = AsyncContainerDelete(container_id=uuid.uuid4().hex)
+            acd.delete(callback)
+            callback.assert_called_once_with(True, acd)
+            self.assertEqual(
+                acd.delete_failure_detail,
+                type(acd).DFD_CONTAINER_NOT_FOUND)
+
     def test_happy_path(self):
         response = mock.Mock(
             code=httplib.NO_CONTENT,
@@ -518,6 +1744,84 @@ class AsyncContainerDeleteTestCase(unittest.TestCase):
             callback.assert_called_once_with(True, acd)
             self.assertEqual(acd.delete_failure_detail, type(acd).DFD_OK)
 
+    def test_force(self):
+        container_id = uuid.uuid4().hex
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            AsyncContainerDelete(container_id).delete(mock.Mock())
+            AsyncContainerDelete(container_id, force=True).delete(mock.Mock())
+
+            self.assertTrue(patcher.requests[0].url.endswith('/containers/%s?force=0' % container_id))
+            self.assertTrue(patcher.requests[1].url.endswith('/containers/%s?force=1' % container_id))
+
+
+class AsyncContainerListTestCase(unittest.TestCase):
+
+    def test_ctr_without_async_state(self):
+        label = uuid.uuid4().hex
+
+        acl = AsyncContainerList(label)
+
+        self.assertTrue(acl.label is label)
+        self.assertIsNone(acl.async_state)
+
+    def test_ctr_with_async_state(self):
+        label = uuid.uuid4().hex
+        async_state = uuid.uuid4().hex
+
+        acl = AsyncContainerList(label, async_state)
+
+        self.assertTrue(acl.label is label)
+        self.assertTrue(acl.async_state is async_state)
+
+    def test_ctr_with_endpoint(self):
+        label = uuid.uuid4().hex
+        endpoint = uuid.uuid4().hex
+
+        acl = AsyncContainerList(label, endpoint=endpoint)
+
+        self.assertTrue(acl.label is label)
+        self.assertTrue(acl.endpoint is endpoint)
+        self.assertIsNone(acl.async_state)
+
+    def test_list_error(self):
+        response = mock.Mock(
+            code=httplib.INTERNAL_SERVER_ERROR,
+            body=None,
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='GET'))
+        with AsyncHttpClientFetchPatcher(response=response):
+            callback = mock.Mock()
+            acl = AsyncContainerList(label=uuid.uuid4().hex)
+            acl.list(callback)
+            callback.assert_called_once_with(False, None, acl)
+            self.assertEqual(
+                acl.list_failure_detail,
+                type(acl).LFD_ERROR_LISTING_CONTAINERS)
+
+    def test_happy_path(self):
+        containers = [{'Id': uuid.uuid4().hex}, {'Id': uuid.uuid4().hex}]
+        response = mock.Mock(
+            code=httplib.OK,
+            body=json.dumps(containers),
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='GET'))
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
+            callback = mock.Mock()
+            acl = AsyncContainerList(label=LABEL_INSTANCE)
+            acl.list(callback)
+
+            url = patcher.requests[0].url
+            self.assertTrue('/containers/json?' in url)
+            self.assertTrue(LABEL_INSTANCE in urllib.unquote(url))
+
+            patcher.respond(response)
+            callback.assert_called_once_with(True, containers, acl)
+            self.assertEqual(acl.list_failure_detail, type(acl).LFD_OK)
+
 
 class AsyncContainerStatusTestCase(unittest.TestCase):
 
@@ -538,6 +1842,16 @@ class AsyncContainerStatusTestCase(unittest.TestCase):
         self.assertTrue(acs.container_id is container_id)
         self.assertTrue(acs.async_state is async_state)
 
+    def test_ctr_with_endpoint(self):
+        container_id = uuid.uuid4().hex
+        endpoint = uuid.uuid4().hex
+
+        acs = AsyncContainerStatus(container_id, endpoint=endpoint)
+
+        self.assertTrue(acs.container_id is container_id)
+        self.assertTrue(acs.endpoint is endpoint)
+        self.assertIsNone(acs.async_state)
+
     def test_error_fetching_container_status(self):
         response = mock.Mock(
             code=httplib.INTERNAL_SERVER_ERROR,
@@ -546,14 +1860,15 @@ class AsyncContainerStatusTestCase(unittest.TestCase):
             request_time=0.042,
             effective_url='http://www.bindle.com',
             request=mock.Mock(method='GET'))
-        with AsyncHttpClientFetchPatcher(response=response):
-            callback = mock.Mock()
-            acs = AsyncContainerStatus(container_id=uuid.uuid4().hex)
-            acs.fetch(callback)
-            callback.assert_called_once_with(False, None, acs)
-            self.assertEqual(
-                acs.fetch_failure_detail,
-                type(acs).SFD_ERROR_FETCHING_CONTAINER_STATUS)
+        with ContainerStatusModePatcher(async_docker_remote_api.CONTAINER_STATUS_MODE_POLL):
+            with AsyncHttpClientFetchPatcher(response=response):
+                callback = mock.Mock()
+                acs = AsyncContainerStatus(container_id=uuid.uuid4().hex)
+                acs.fetch(callback)
+                callback.assert_called_once_with(False, None, acs)
+                self.assertEqual(
+                    acs.fetch_failure_detail,
+                    type(acs).SFD_ERROR_FETCHING_CONTAINER_STATUS)
 
     def test_waited_too_long_for_container_to_exit(self):
         responses = [mock.Mock(
@@ -568,15 +1883,155 @@ class AsyncContainerStatusTestCase(unittest.TestCase):
             request_time=0.042,
             effective_url='http://www.bindle.com',
             request=mock.Mock(method='GET'))] * 1000
-        with AsyncHttpClientFetchPatcher(responses=responses):
-            with AsyncActionIOLoopAddTimeoutPatcher():
+        with ContainerStatusModePatcher(async_docker_remote_api.CONTAINER_STATUS_MODE_POLL):
+            with AsyncHttpClientFetchPatcher(responses=responses):
+                with AsyncActionIOLoopAddTimeoutPatcher():
+                    callback = mock.Mock()
+                    acs = AsyncContainerStatus(container_id=uuid.uuid4().hex)
+                    acs.fetch(callback)
+                    callback.assert_called_once_with(False, None, acs)
+                    self.assertEqual(acs.fetch_failure_detail, type(acs).SFD_WAITED_TOO_LONG)
+
+    def test_happy_path(self):
+        exit_code = 5
+        response = mock.Mock(
+            code=httplib.OK,
+            body=json.dumps({
+                'State': {
+                    'FinishedAt': '9999-01-01T00:00:00Z',
+                    'ExitCode': exit_code,
+                },
+            }),
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='GET'))
+        with ContainerStatusModePatcher(async_docker_remote_api.CONTAINER_STATUS_MODE_POLL):
+            with AsyncHttpClientFetchPatcher(response=response):
                 callback = mock.Mock()
                 acs = AsyncContainerStatus(container_id=uuid.uuid4().hex)
                 acs.fetch(callback)
-                callback.assert_called_once_with(False, None, acs)
-                self.assertEqual(acs.fetch_failure_detail, type(acs).SFD_WAITED_TOO_LONG)
+                callback.assert_called_once_with(True, exit_code, acs)
+                self.assertEqual(acs.fetch_failure_detail, type(acs).SFD_OK)
 
-    def test_happy_path(self):
+    def test_wait_happy_path(self):
+        exit_code = 5
+        container_id = uuid.uuid4().hex
+        response = mock.Mock(
+            code=httplib.OK,
+            body=json.dumps({
+                'StatusCode': exit_code,
+            }),
+            time_info={},
+            request_time=0.042,
+            request=mock.Mock(method='POST'))
+        with ContainerStatusModePatcher(async_docker_remote_api.CONTAINER_STATUS_MODE_WAIT):
+            with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                callback = mock.Mock()
+                acs = AsyncContainerStatus(container_id=container_id)
+                acs.fetch(callback)
+                self.assertEqual(len(patcher.requests), 1)
+                self.assertTrue(patcher.requests[0].url.endswith('/containers/%s/wait' % container_id))
+                self.assertEqual(patcher.requests[0].method, 'POST')
+                # the container can run for longer than request_timeout
+                self.assertEqual(patcher.requests[0].request_timeout, 0)
+                patcher.respond(response)
+                callback.assert_called_once_with(True, exit_code, acs)
+                self.assertEqual(acs.fetch_failure_detail, type(acs).SFD_OK)
+
+    def test_events_happy_path(self):
+        exit_code = 5
+        container_id = uuid.uuid4().hex
+        response = mock.Mock(
+            code=httplib.OK,
+            body=json.dumps({
+                'State': {
+                    'FinishedAt': '0001-01-01T00:00:00Z',
+                    'ExitCode': 0,
+                },
+            }),
+            time_info={},
+            request_time=0.042,
+            request=mock.Mock(method='GET'))
+        with ContainerStatusModePatcher(async_docker_remote_api.CONTAINER_STATUS_MODE_EVENTS):
+            with EventStreamsPatcher():
+                with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                    callback = mock.Mock()
+                    acs = AsyncContainerStatus(container_id=container_id)
+                    acs.fetch(callback)
+
+                    # 1st request = events stream & 2nd request = container status
+                    self.assertEqual(len(patcher.requests), 2)
+                    self.assertTrue('/events?' in patcher.requests[0].url)
+                    self.assertTrue(patcher.requests[1].url.endswith('/containers/%s/json' % container_id))
+
+                    patcher.respond(response, patcher.requests[1])
+                    self.assertFalse(callback.called)
+
+                    event = {
+                        'Type': 'container',
+                        'Action': 'die',
+                        'Actor': {
+                            'ID': container_id,
+                            'Attributes': {
+                                'exitCode': str(exit_code),
+                                LABEL_INSTANCE: instance_id,
+                            },
+                        },
+                        'time': 1,
+                    }
+                    patcher.requests[0].streaming_callback(json.dumps(event) + '\n')
+
+                    callback.assert_called_once_with(True, exit_code, acs)
+                    self.assertEqual(acs.fetch_failure_detail, type(acs).SFD_OK)
+
+    def test_events_watched_on_containers_docker_host(self):
+        exit_code = 5
+        container_id = uuid.uuid4().hex
+        response = mock.Mock(
+            code=httplib.OK,
+            body=json.dumps({
+                'State': {
+                    'FinishedAt': '0001-01-01T00:00:00Z',
+                    'ExitCode': 0,
+                },
+            }),
+            time_info={},
+            request_time=0.042,
+            request=mock.Mock(method='GET'))
+        endpoints = ['http://172.17.0.1:2375', 'http://172.17.0.2:2375']
+        with DockerHostsPatcher(endpoints):
+            with ContainerStatusModePatcher(async_docker_remote_api.CONTAINER_STATUS_MODE_EVENTS):
+                with EventStreamsPatcher():
+                    with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                        callback = mock.Mock()
+                        acs = AsyncContainerStatus(container_id=container_id, endpoint=endpoints[1])
+                        acs.fetch(callback)
+
+                        self.assertEqual(len(patcher.requests), 2)
+                        self.assertTrue(patcher.requests[0].url.startswith('%s/events?' % endpoints[1]))
+                        self.assertTrue(patcher.requests[1].url.startswith(endpoints[1]))
+                        self.assertNotIn(endpoints[0], async_docker_remote_api._event_streams)
+
+                        patcher.respond(response, patcher.requests[1])
+
+                        event = {
+                            'Type': 'container',
+                            'Action': 'die',
+                            'Actor': {
+                                'ID': container_id,
+                                'Attributes': {
+                                    'exitCode': str(exit_code),
+                                    LABEL_INSTANCE: instance_id,
+                                },
+                            },
+                            'time': 1,
+                        }
+                        patcher.requests[0].streaming_callback(json.dumps(event) + '\n')
+
+                        callback.assert_called_once_with(True, exit_code, acs)
+
+    def test_events_container_already_exited(self):
         exit_code = 5
         response = mock.Mock(
             code=httplib.OK,
@@ -588,14 +2043,97 @@ class AsyncContainerStatusTestCase(unittest.TestCase):
             }),
             time_info={},
             request_time=0.042,
-            effective_url='http://www.bindle.com',
             request=mock.Mock(method='GET'))
-        with AsyncHttpClientFetchPatcher(response=response):
-            callback = mock.Mock()
-            acs = AsyncContainerStatus(container_id=uuid.uuid4().hex)
-            acs.fetch(callback)
-            callback.assert_called_once_with(True, exit_code, acs)
-            self.assertEqual(acs.fetch_failure_detail, type(acs).SFD_OK)
+        with ContainerStatusModePatcher(async_docker_remote_api.CONTAINER_STATUS_MODE_EVENTS):
+            with EventStreamsPatcher():
+                with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                    callback = mock.Mock()
+                    acs = AsyncContainerStatus(container_id=uuid.uuid4().hex)
+                    acs.fetch(callback)
+                    patcher.respond(response, patcher.requests[1])
+                    callback.assert_called_once_with(True, exit_code, acs)
+                    self.assertEqual(async_docker_remote_api.event_stream()._waiters, {})
+
+    def test_events_falls_back_to_polling(self):
+        exit_code = 5
+        responses = [
+            mock.Mock(
+                code=httplib.OK,
+                body=json.dumps({
+                    'State': {
+                        'FinishedAt': '0001-01-01T00:00:00Z',
+                        'ExitCode': 0,
+                    },
+                }),
+                time_info={},
+                request_time=0.042,
+                request=mock.Mock(method='GET')),
+            mock.Mock(
+                code=599,
+                body=None,
+                time_info={},
+                request_time=0.042,
+                request=mock.Mock(method='GET')),
+            mock.Mock(
+                code=httplib.OK,
+                body=json.dumps({
+                    'State': {
+                        'FinishedAt': '9999-01-01T00:00:00Z',
+                        'ExitCode': exit_code,
+                    },
+                }),
+                time_info={},
+                request_time=0.042,
+                request=mock.Mock(method='GET')),
+        ]
+        with ContainerStatusModePatcher(async_docker_remote_api.CONTAINER_STATUS_MODE_EVENTS):
+            with EventStreamsPatcher():
+                with mock.patch('tornado.ioloop.IOLoop.add_timeout'):
+                    with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                        callback = mock.Mock()
+                        acs = AsyncContainerStatus(container_id=uuid.uuid4().hex)
+                        acs.fetch(callback)
+
+                        # container status response - container still running
+                        patcher.respond(responses[0], patcher.requests[1])
+                        self.assertFalse(callback.called)
+
+                        # events stream lost
+                        patcher.respond(responses[1], patcher.requests[0])
+                        self.assertEqual(len(patcher.requests), 3)
+
+                        # container status response - container exited
+                        patcher.respond(responses[2], patcher.requests[2])
+                        callback.assert_called_once_with(True, exit_code, acs)
+
+    def test_wait_falls_back_to_polling(self):
+        exit_code = 5
+        responses = [
+            mock.Mock(
+                code=httplib.INTERNAL_SERVER_ERROR,
+                body=None,
+                time_info={},
+                request_time=0.042,
+                request=mock.Mock(method='POST')),
+            mock.Mock(
+                code=httplib.OK,
+                body=json.dumps({
+                    'State': {
+                        'FinishedAt': '9999-01-01T00:00:00Z',
+                        'ExitCode': exit_code,
+                    },
+                }),
+                time_info={},
+                request_time=0.042,
+                request=mock.Mock(method='GET')),
+        ]
+        with ContainerStatusModePatcher(async_docker_remote_api.CONTAINER_STATUS_MODE_WAIT):
+            with AsyncHttpClientFetchPatcher(responses=responses):
+                callback = mock.Mock()
+                acs = AsyncContainerStatus(container_id=uuid.uuid4().hex)
+                acs.fetch(callback)
+                callback.assert_called_once_with(True, exit_code, acs)
+                self.assertEqual(acs.fetch_failure_detail, type(acs).SFD_OK)
 
 
 class AsyncContainerLogsTestCase(unittest.TestCase):
@@ -617,6 +2155,19 @@ class AsyncContainerLogsTestCase(unittest.TestCase):
         self.assertTrue(acl.container_id is container_id)
         self.assertTrue(acl.async_state is async_state)
 
+    def test_ctr_with_follow_and_endpoint(self):
+        container_id = uuid.uuid4().hex
+        frame_callback = mock.Mock()
+        endpoint = uuid.uuid4().hex
+
+        acl = AsyncContainerLogs(container_id, follow=True, frame_callback=frame_callback, endpoint=endpoint)
+
+        self.assertTrue(acl.container_id is container_id)
+        self.assertTrue(acl.follow)
+        self.assertTrue(acl.frame_callback is frame_callback)
+        self.assertTrue(acl.endpoint is endpoint)
+        self.assertIsNone(acl.async_state)
+
     def test_container_not_found(self):
         responses = [
             mock.Mock(
@@ -670,28 +2221,80 @@ class AsyncContainerLogsTestCase(unittest.TestCase):
                 type(acl).FFD_ERROR_FETCHING_CONTAINER_LOGS)
 
     def test_happy_path(self):
-        header = '-' * 8
-        stdout = 'something'
-        stderr = 'out'
-        responses = [
-            mock.Mock(
-                code=httplib.OK,
-                body=header + stdout,
-                time_info={},
-                request_time=0.042,
-                effective_url='http://www.bindle.com',
-                request=mock.Mock(method='GET')),
-            mock.Mock(
-                code=httplib.OK,
-                body=header + stderr,
-                time_info={},
-                request_time=0.042,
-                effective_url='http://www.bindle.com',
-                request=mock.Mock(method='GET')),
+        container_id = uuid.uuid4().hex
+        chunks = [
+            _frame(StreamDemuxer.STDOUT, 'some') + _frame(StreamDemuxer.STDERR, 'o'),
+            _frame(StreamDemuxer.STDOUT, 'thing')[:3],
+            _frame(StreamDemuxer.STDOUT, 'thing')[3:] + _frame(StreamDemuxer.STDERR, 'ut'),
         ]
-        with AsyncHttpClientFetchPatcher(responses=responses):
+        response = mock.Mock(
+            code=httplib.OK,
+            body='',
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='GET'))
+        with DeferredAsyncHttpClientFetchPatcher() as patcher:
             callback = mock.Mock()
-            acl = AsyncContainerLogs(container_id=uuid.uuid4().hex)
+            acl = AsyncContainerLogs(container_id=container_id)
             acl.fetch(callback)
-            callback.assert_called_once_with(True, stdout, stderr, acl)
+
+            self.assertEqual(len(patcher.requests), 1)
+            self.assertTrue('/containers/%s/logs?stdout=1&stderr=1&' % container_id in patcher.requests[0].url)
+            self.assertTrue('&follow=0' in patcher.requests[0].url)
+            self.assertEqual(
+                patcher.requests[0].request_timeout,
+                async_docker_remote_api.request_timeout / 1000.0)
+
+            for chunk in chunks:
+                patcher.requests[0].streaming_callback(chunk)
+            patcher.respond(response)
+
+            callback.assert_called_once_with(True, 'something', 'out', acl)
             self.assertEqual(acl.fetch_failure_detail, type(acl).FFD_OK)
+
+    def test_follow_with_frame_callback(self):
+        container_id = uuid.uuid4().hex
+        chunks = [
+            _frame(StreamDemuxer.STDOUT, 'some') + _frame(StreamDemuxer.STDERR, 'o'),
+            _frame(StreamDemuxer.STDOUT, 'thing')[:3],
+            _frame(StreamDemuxer.STDOUT, 'thing')[3:],
+        ]
+        response = mock.Mock(
+            code=httplib.OK,
+            body='',
+            time_info={},
+            request_time=0.042,
+            effective_url='http://www.bindle.com',
+            request=mock.Mock(method='GET'))
+        frames = []
+        bulkheads = {
+            BULKHEAD_STATUS: Bulkhead(BULKHEAD_STATUS),
+            BULKHEAD_LOGS: Bulkhead(BULKHEAD_LOGS),
+        }
+        with mock.patch.dict(async_docker_remote_api.docker_host().bulkheads, bulkheads):
+            with DeferredAsyncHttpClientFetchPatcher() as patcher:
+                callback = mock.Mock()
+                acl = AsyncContainerLogs(
+                    container_id=container_id,
+                    follow=True,
+                    frame_callback=lambda stream_type, payload: frames.append((stream_type, payload)))
+                acl.fetch(callback)
+
+                self.assertEqual(len(patcher.requests), 1)
+                self.assertTrue('&follow=1' in patcher.requests[0].url)
+                # the container can run for longer than request_timeout
+                self.assertEqual(patcher.requests[0].request_timeout, 0)
+
+                patcher.requests[0].streaming_callback(chunks[0])
+                self.assertEqual(frames, [(StreamDemuxer.STDOUT, 'some'), (StreamDemuxer.STDERR, 'o')])
+
+                for chunk in chunks[1:]:
+                    patcher.requests[0].streaming_callback(chunk)
+                patcher.respond(response)
+
+                self.assertEqual(frames[-1], (StreamDemuxer.STDOUT, 'thing'))
+                callback.assert_called_once_with(True, None, None, acl)
+                self.assertEqual(acl.fetch_failure_detail, type(acl).FFD_OK)
+                self.assertEqual(bulkheads[BULKHEAD_STATUS].number_requests, 1)
+                self.assertEqual(bulkheads[BULKHEAD_LOGS].number_requests, 0)
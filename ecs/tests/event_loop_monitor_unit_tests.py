@@ -0,0 +1,107 @@
+"""This module contains a collection of unit tests which
+validate the ..event_loop_monitor module.
+"""
+
+import sys
+import unittest
+
+import mock
+
+from .. import event_loop_monitor   # noqa
+from ..event_loop_monitor import EventLoopMonitor
+
+
+class EventLoopMonitorTestCase(unittest.TestCase):
+
+    def test_ctr(self):
+        elm = EventLoopMonitor()
+        self.assertFalse(elm.is_started)
+        self.assertEqual(elm.number_slow_callbacks, 0)
+        self.assertEqual(len(elm.lags), 0)
+        self.assertTrue(elm.is_healthy)
+        self.assertEqual(elm.percentiles(), [(50, 0.0), (90, 0.0), (99, 0.0)])
+
+    def test_percentiles(self):
+        elm = EventLoopMonitor()
+        elm.lags.extend([i / 1000.0 for i in range(100, 0, -1)])
+        self.assertEqual(elm.percentiles(), [(50, 0.050), (90, 0.090), (99, 0.099)])
+
+    def test_percentiles_of_most_recent_lags(self):
+        elm = EventLoopMonitor()
+        elm.lags.extend([1.0] * EventLoopMonitor._number_lags)
+        elm.lags.extend([0.0] * (EventLoopMonitor._number_lags - 1))
+        self.assertEqual(elm.percentile(100), 1.0)
+        elm.lags.append(0.0)
+        self.assertEqual(elm.percentile(100), 0.0)
+
+    def test_is_healthy(self):
+        with mock.patch(__name__ + '.event_loop_monitor.event_loop_lag_threshold', 250):
+            elm = EventLoopMonitor()
+            elm.lags.extend([0.001] * 99 + [0.250])
+            self.assertTrue(elm.is_healthy)
+            elm.lags.extend([0.251] * 2)
+            self.assertFalse(elm.is_healthy)
+
+    def test_start_measures_lag(self):
+        with mock.patch('tornado.ioloop.IOLoop.current') as current:
+            io_loop = current.return_value
+            io_loop.time.return_value = 100.0
+
+            elm = EventLoopMonitor()
+            elm.start()
+            self.assertTrue(elm.is_started)
+
+            (deadline, on_timeout) = io_loop.add_timeout.call_args[0]
+            self.assertEqual(deadline, 100.5)
+            (threshold, on_slow_callback) = io_loop.set_blocking_signal_threshold.call_args[0]
+            self.assertEqual(threshold, 0.1)
+
+            io_loop.time.return_value = 100.75
+            on_timeout()
+            self.assertEqual(list(elm.lags), [0.25])
+
+            # the next measurement is due an interval after the last one ran
+            (deadline, on_timeout) = io_loop.add_timeout.call_args[0]
+            self.assertEqual(deadline, 101.25)
+
+            elm.stop()
+            self.assertFalse(elm.is_started)
+            io_loop.remove_timeout.assert_called_once_with(io_loop.add_timeout.return_value)
+            io_loop.set_blocking_signal_threshold.assert_called_with(None, None)
+
+    def test_start_disabled(self):
+        with mock.patch(__name__ + '.event_loop_monitor.event_loop_monitor_interval', 0):
+            with mock.patch('tornado.ioloop.IOLoop.current') as current:
+                elm = EventLoopMonitor()
+                elm.start()
+                self.assertFalse(elm.is_started)
+                self.assertFalse(current.called)
+
+    def test_slow_callback_detection_disabled(self):
+        with mock.patch(__name__ + '.event_loop_monitor.event_loop_slow_callback_threshold', 0):
+            with mock.patch('tornado.ioloop.IOLoop.current') as current:
+                io_loop = current.return_value
+                io_loop.time.return_value = 100.0
+
+                elm = EventLoopMonitor()
+                elm.start()
+                elm.stop()
+                self.assertFalse(io_loop.set_blocking_signal_threshold.called)
+
+    def test_slow_callback_logs_stack(self):
+        with mock.patch('tornado.ioloop.IOLoop.current') as current:
+            io_loop = current.return_value
+            io_loop.time.return_value = 100.0
+
+            elm = EventLoopMonitor()
+            elm.start()
+            (threshold, on_slow_callback) = io_loop.set_blocking_signal_threshold.call_args[0]
+
+            with mock.patch(__name__ + '.event_loop_monitor._logger') as logger:
+                on_slow_callback(14, sys._getframe())
+                self.assertEqual(elm.number_slow_callbacks, 1)
+                (fmt, threshold, stack) = logger.warning.call_args[0]
+                self.assertEqual(threshold, 100)
+                self.assertIn('test_slow_callback_logs_stack', stack)
+
+            elm.stop()
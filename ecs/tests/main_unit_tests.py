@@ -3,17 +3,25 @@ validate ..main
 """
 
 from ConfigParser import ConfigParser
+import json
 import logging
 import os
 import sys
 import tempfile
 import unittest
+import uuid
 
 import mock
 import tornado.httpserver
 
+from ..main import Application
 from ..main import Main
+from .. import async_actions
 from .. import async_docker_remote_api
+from .. import event_loop_monitor
+from .. import metrics
+from .. import task_scheduler
+from .. import task_store
 
 
 class Patcher(object):
@@ -93,6 +101,43 @@ class ServiceConfigFile(object):
         self.docker_remote_api = 'http://2.2.2.2:6666'
         self.docker_remote_api_connect_timeout = 50
         self.docker_remote_api_request_timeout = 500
+        self.docker_remote_api_container_status_mode = async_docker_remote_api.CONTAINER_STATUS_MODE_POLL
+        self.image_cache_ttl = 5000
+        self.pull_policy = async_actions.PULL_POLICY_NEVER
+        self.container_reaper_max_concurrency = 42
+        self.container_reaper_max_attempts = 43
+        self.container_reaper_retry_delay = 44
+        self.container_sweeper_interval = 45
+        self.container_sweeper_min_age = 46
+        self.container_sweeper_max_age = 47
+        self.container_sweeper_batch_size = 48
+        self.task_template_pool_size = 49
+        self.task_template_refill_retry_delay = 50
+        self.task_template_name = uuid.uuid4().hex
+        self.task_template_docker_image = 'ubuntu:14.04'
+        self.task_template_cmd = ['echo', 'hello world!!!']
+        self.task_template_section_pool_size = 51
+        self.bulkhead_max_queue_depth = 52
+        self.bulkhead_max_concurrency = {
+            bulkhead: 60 + i for (i, bulkhead) in enumerate(async_docker_remote_api.BULKHEADS)
+        }
+        self.task_store_ttl = 53
+        self.task_store_max_bytes = 54
+        self.task_store_max_wait = 55
+        self.task_scheduler_max_concurrency = 42
+        self.task_scheduler_max_queue_depth = 84
+        self.task_scheduler_weights = {'alice': 4, 'bob': 2}
+        self.task_scheduler_default_weight = 3
+        self.task_scheduler_caller_header = 'X-ECS-Caller'
+        self.task_max_timeout = 60000
+        self.docker_host_load_bound = 150
+        self.docker_host_failure_threshold = 7
+        self.docker_host_probe_interval = 7500
+        self.health_check_refresh_interval = 2500
+        self.event_loop_monitor_interval = 250
+        self.event_loop_slow_callback_threshold = 50
+        self.event_loop_lag_threshold = 1000
+        self.task_scheduler_caller_ttl = 120000
 
         self.filename = None
 
@@ -112,6 +157,51 @@ class ServiceConfigFile(object):
         cp.set(self.section, 'docker_remote_api', self.docker_remote_api)
         cp.set(self.section, 'docker_remote_api_connect_timeout', self.docker_remote_api_connect_timeout)
         cp.set(self.section, 'docker_remote_api_request_timeout', self.docker_remote_api_request_timeout)
+        cp.set(
+            self.section,
+            'docker_remote_api_container_status_mode',
+            self.docker_remote_api_container_status_mode)
+        cp.set(self.section, 'image_cache_ttl', self.image_cache_ttl)
+        cp.set(self.section, 'pull_policy', self.pull_policy)
+        cp.set(self.section, 'container_reaper_max_concurrency', self.container_reaper_max_concurrency)
+        cp.set(self.section, 'container_reaper_max_attempts', self.container_reaper_max_attempts)
+        cp.set(self.section, 'container_reaper_retry_delay', self.container_reaper_retry_delay)
+        cp.set(self.section, 'container_sweeper_interval', self.container_sweeper_interval)
+        cp.set(self.section, 'container_sweeper_min_age', self.container_sweeper_min_age)
+        cp.set(self.section, 'container_sweeper_max_age', self.container_sweeper_max_age)
+        cp.set(self.section, 'container_sweeper_batch_size', self.container_sweeper_batch_size)
+        cp.set(self.section, 'task_template_pool_size', self.task_template_pool_size)
+        cp.set(self.section, 'task_template_refill_retry_delay', self.task_template_refill_retry_delay)
+        cp.set(self.section, 'task_templates', '%s, %s' % (self.task_template_name, 'no-section'))
+
+        task_template_section = '%s:template:%s' % (self.section, self.task_template_name)
+        cp.add_section(task_template_section)
+        cp.set(task_template_section, 'docker_image', self.task_template_docker_image)
+        cp.set(task_template_section, 'cmd', json.dumps(self.task_template_cmd))
+        cp.set(task_template_section, 'pool_size', self.task_template_section_pool_size)
+        cp.set(self.section, 'bulkhead_max_queue_depth', self.bulkhead_max_queue_depth)
+        for (bulkhead, max_concurrency) in self.bulkhead_max_concurrency.items():
+            cp.set(self.section, 'bulkhead_%s_max_concurrency' % bulkhead, max_concurrency)
+        cp.set(self.section, 'task_store_ttl', self.task_store_ttl)
+        cp.set(self.section, 'task_store_max_bytes', self.task_store_max_bytes)
+        cp.set(self.section, 'task_store_max_wait', self.task_store_max_wait)
+        cp.set(self.section, 'task_scheduler_max_concurrency', self.task_scheduler_max_concurrency)
+        cp.set(self.section, 'task_scheduler_max_queue_depth', self.task_scheduler_max_queue_depth)
+        # invalid weights are ignored
+        task_scheduler_weights = ['%s:%d' % item for item in self.task_scheduler_weights.items()]
+        task_scheduler_weights.extend(['carol:0', 'dave', ':5'])
+        cp.set(self.section, 'task_scheduler_weights', ', '.join(task_scheduler_weights))
+        cp.set(self.section, 'task_scheduler_default_weight', self.task_scheduler_default_weight)
+        cp.set(self.section, 'task_scheduler_caller_header', self.task_scheduler_caller_header)
+        cp.set(self.section, 'task_max_timeout', self.task_max_timeout)
+        cp.set(self.section, 'docker_host_load_bound', self.docker_host_load_bound)
+        cp.set(self.section, 'docker_host_failure_threshold', self.docker_host_failure_threshold)
+        cp.set(self.section, 'docker_host_probe_interval', self.docker_host_probe_interval)
+        cp.set(self.section, 'health_check_refresh_interval', self.health_check_refresh_interval)
+        cp.set(self.section, 'event_loop_monitor_interval', self.event_loop_monitor_interval)
+        cp.set(self.section, 'event_loop_slow_callback_threshold', self.event_loop_slow_callback_threshold)
+        cp.set(self.section, 'event_loop_lag_threshold', self.event_loop_lag_threshold)
+        cp.set(self.section, 'task_scheduler_caller_ttl', self.task_scheduler_caller_ttl)
 
         self.filename = tempfile.mktemp()
         with open(self.filename, 'w+') as fp:
@@ -149,6 +239,80 @@ class SysDotArgcPatcher(object):
 
 class MainTestCase(unittest.TestCase):
 
+    def setUp(self):
+        self._pull_policy = async_actions.pull_policy
+        self._container_reaper_max_concurrency = async_actions.container_reaper_max_concurrency
+        self._container_reaper_max_attempts = async_actions.container_reaper_max_attempts
+        self._container_reaper_retry_delay = async_actions.container_reaper_retry_delay
+        self._docker_remote_api_endpoint = async_docker_remote_api.docker_remote_api_endpoint
+        self._docker_remote_api_endpoints = async_docker_remote_api.docker_remote_api_endpoints
+        self._container_status_mode = async_docker_remote_api.container_status_mode
+        self._image_cache_ttl = async_docker_remote_api.image_cache_ttl
+        self._container_sweeper_interval = async_actions.container_sweeper_interval
+        self._container_sweeper_min_age = async_actions.container_sweeper_min_age
+        self._container_sweeper_max_age = async_actions.container_sweeper_max_age
+        self._container_sweeper_batch_size = async_actions.container_sweeper_batch_size
+        self._task_template_pool_size = async_actions.task_template_pool_size
+        self._task_template_refill_retry_delay = async_actions.task_template_refill_retry_delay
+        self._bulkhead_max_queue_depth = async_docker_remote_api.bulkhead_max_queue_depth
+        self._bulkhead_max_concurrency = dict(async_docker_remote_api.bulkhead_max_concurrency)
+        self._task_store_ttl = task_store.task_store_ttl
+        self._task_store_max_bytes = task_store.task_store_max_bytes
+        self._task_store_max_wait = task_store.task_store_max_wait
+        self._task_scheduler_max_concurrency = task_scheduler.task_scheduler_max_concurrency
+        self._task_scheduler_max_queue_depth = task_scheduler.task_scheduler_max_queue_depth
+        self._task_scheduler_weights = task_scheduler.task_scheduler_weights
+        self._task_scheduler_default_weight = task_scheduler.task_scheduler_default_weight
+        self._task_scheduler_caller_header = task_scheduler.task_scheduler_caller_header
+        self._task_max_timeout = async_actions.task_max_timeout
+        self._docker_host_load_bound = async_docker_remote_api.docker_host_load_bound
+        self._docker_host_failure_threshold = async_docker_remote_api.docker_host_failure_threshold
+        self._docker_host_probe_interval = async_docker_remote_api.docker_host_probe_interval
+        self._health_check_refresh_interval = async_actions.health_check_refresh_interval
+        self._event_loop_monitor_interval = event_loop_monitor.event_loop_monitor_interval
+        self._event_loop_slow_callback_threshold = event_loop_monitor.event_loop_slow_callback_threshold
+        self._event_loop_lag_threshold = event_loop_monitor.event_loop_lag_threshold
+        self._task_scheduler_caller_ttl = task_scheduler.task_scheduler_caller_ttl
+
+    def tearDown(self):
+        async_actions.container_sweeper.stop()
+        async_actions.task_templates.clear()
+        async_actions.pull_policy = self._pull_policy
+        async_actions.container_reaper_max_concurrency = self._container_reaper_max_concurrency
+        async_actions.container_reaper_max_attempts = self._container_reaper_max_attempts
+        async_actions.container_reaper_retry_delay = self._container_reaper_retry_delay
+        async_docker_remote_api.docker_remote_api_endpoint = self._docker_remote_api_endpoint
+        async_docker_remote_api.docker_remote_api_endpoints = self._docker_remote_api_endpoints
+        async_docker_remote_api.container_status_mode = self._container_status_mode
+        async_docker_remote_api.image_cache_ttl = self._image_cache_ttl
+        async_actions.container_sweeper_interval = self._container_sweeper_interval
+        async_actions.container_sweeper_min_age = self._container_sweeper_min_age
+        async_actions.container_sweeper_max_age = self._container_sweeper_max_age
+        async_actions.container_sweeper_batch_size = self._container_sweeper_batch_size
+        async_actions.task_template_pool_size = self._task_template_pool_size
+        async_actions.task_template_refill_retry_delay = self._task_template_refill_retry_delay
+        async_docker_remote_api.bulkhead_max_queue_depth = self._bulkhead_max_queue_depth
+        async_docker_remote_api.bulkhead_max_concurrency.update(self._bulkhead_max_concurrency)
+        task_store.task_store_ttl = self._task_store_ttl
+        task_store.task_store_max_bytes = self._task_store_max_bytes
+        task_store.task_store_max_wait = self._task_store_max_wait
+        task_scheduler.task_scheduler_max_concurrency = self._task_scheduler_max_concurrency
+        task_scheduler.task_scheduler_max_queue_depth = self._task_scheduler_max_queue_depth
+        task_scheduler.task_scheduler_weights = self._task_scheduler_weights
+        task_scheduler.task_scheduler_default_weight = self._task_scheduler_default_weight
+        task_scheduler.task_scheduler_caller_header = self._task_scheduler_caller_header
+        async_actions.task_max_timeout = self._task_max_timeout
+        async_docker_remote_api.docker_host_load_bound = self._docker_host_load_bound
+        async_docker_remote_api.docker_host_failure_threshold = self._docker_host_failure_threshold
+        async_docker_remote_api.docker_host_probe_interval = self._docker_host_probe_interval
+        async_actions.health_check_cache.stop()
+        event_loop_monitor.event_loop_monitor.stop()
+        async_actions.health_check_refresh_interval = self._health_check_refresh_interval
+        event_loop_monitor.event_loop_monitor_interval = self._event_loop_monitor_interval
+        event_loop_monitor.event_loop_slow_callback_threshold = self._event_loop_slow_callback_threshold
+        event_loop_monitor.event_loop_lag_threshold = self._event_loop_lag_threshold
+        task_scheduler.task_scheduler_caller_ttl = self._task_scheduler_caller_ttl
+
     def test_libcurl_async_dns_resolver(self):
         main = Main()
         with ServiceConfigFile(main.config_section) as service_config_file:
@@ -196,6 +360,130 @@ class MainTestCase(unittest.TestCase):
                 service_config_file.docker_remote_api_request_timeout,
                 async_docker_remote_api.request_timeout)
 
+            self.assertNotEqual(
+                service_config_file.docker_remote_api_container_status_mode,
+                async_docker_remote_api.container_status_mode)
+
+            self.assertNotEqual(
+                service_config_file.image_cache_ttl,
+                async_docker_remote_api.image_cache_ttl)
+
+            self.assertNotEqual(
+                service_config_file.pull_policy,
+                async_actions.pull_policy)
+
+            self.assertNotEqual(
+                service_config_file.container_reaper_max_concurrency,
+                async_actions.container_reaper_max_concurrency)
+
+            self.assertNotEqual(
+                service_config_file.container_reaper_max_attempts,
+                async_actions.container_reaper_max_attempts)
+
+            self.assertNotEqual(
+                service_config_file.container_reaper_retry_delay,
+                async_actions.container_reaper_retry_delay)
+
+            self.assertNotEqual(
+                service_config_file.container_sweeper_interval,
+                async_actions.container_sweeper_interval)
+
+            self.assertNotEqual(
+                service_config_file.container_sweeper_min_age,
+                async_actions.container_sweeper_min_age)
+
+            self.assertNotEqual(
+                service_config_file.container_sweeper_max_age,
+                async_actions.container_sweeper_max_age)
+
+            self.assertNotEqual(
+                service_config_file.container_sweeper_batch_size,
+                async_actions.container_sweeper_batch_size)
+
+            self.assertNotEqual(
+                service_config_file.task_template_pool_size,
+                async_actions.task_template_pool_size)
+
+            self.assertNotEqual(
+                service_config_file.task_template_refill_retry_delay,
+                async_actions.task_template_refill_retry_delay)
+
+            self.assertNotEqual(
+                service_config_file.bulkhead_max_queue_depth,
+                async_docker_remote_api.bulkhead_max_queue_depth)
+
+            self.assertNotEqual(
+                service_config_file.bulkhead_max_concurrency,
+                async_docker_remote_api.bulkhead_max_concurrency)
+
+            self.assertNotEqual(
+                service_config_file.task_store_ttl,
+                task_store.task_store_ttl)
+
+            self.assertNotEqual(
+                service_config_file.task_store_max_bytes,
+                task_store.task_store_max_bytes)
+
+            self.assertNotEqual(
+                service_config_file.task_store_max_wait,
+                task_store.task_store_max_wait)
+
+            self.assertNotEqual(
+                service_config_file.task_scheduler_max_concurrency,
+                task_scheduler.task_scheduler_max_concurrency)
+
+            self.assertNotEqual(
+                service_config_file.task_scheduler_max_queue_depth,
+                task_scheduler.task_scheduler_max_queue_depth)
+
+            self.assertNotEqual(
+                service_config_file.task_scheduler_weights,
+                task_scheduler.task_scheduler_weights)
+
+            self.assertNotEqual(
+                service_config_file.task_scheduler_default_weight,
+                task_scheduler.task_scheduler_default_weight)
+
+            self.assertNotEqual(
+                service_config_file.task_scheduler_caller_header,
+                task_scheduler.task_scheduler_caller_header)
+
+            self.assertNotEqual(
+                service_config_file.task_max_timeout,
+                async_actions.task_max_timeout)
+
+            self.assertNotEqual(
+                service_config_file.docker_host_load_bound,
+                async_docker_remote_api.docker_host_load_bound)
+
+            self.assertNotEqual(
+                service_config_file.docker_host_failure_threshold,
+                async_docker_remote_api.docker_host_failure_threshold)
+
+            self.assertNotEqual(
+                service_config_file.docker_host_probe_interval,
+                async_docker_remote_api.docker_host_probe_interval)
+
+            self.assertNotEqual(
+                service_config_file.health_check_refresh_interval,
+                async_actions.health_check_refresh_interval)
+
+            self.assertNotEqual(
+                service_config_file.event_loop_monitor_interval,
+                event_loop_monitor.event_loop_monitor_interval)
+
+            self.assertNotEqual(
+                service_config_file.event_loop_slow_callback_threshold,
+                event_loop_monitor.event_loop_slow_callback_threshold)
+
+            self.assertNotEqual(
+                service_config_file.event_loop_lag_threshold,
+                event_loop_monitor.event_loop_lag_threshold)
+
+            self.assertNotEqual(
+                service_config_file.task_scheduler_caller_ttl,
+                task_scheduler.task_scheduler_caller_ttl)
+
             sys_dot_arv = [
                 'service',
                 '--config=%s' % service_config_file.filename,
@@ -233,6 +521,167 @@ class MainTestCase(unittest.TestCase):
                             service_config_file.docker_remote_api_request_timeout,
                             async_docker_remote_api.request_timeout)
 
+                        self.assertEqual(
+                            service_config_file.docker_remote_api_container_status_mode,
+                            async_docker_remote_api.container_status_mode)
+
+                        self.assertEqual(
+                            service_config_file.image_cache_ttl,
+                            async_docker_remote_api.image_cache_ttl)
+
+                        self.assertEqual(
+                            service_config_file.pull_policy,
+                            async_actions.pull_policy)
+
+                        self.assertEqual(
+                            service_config_file.container_reaper_max_concurrency,
+                            async_actions.container_reaper_max_concurrency)
+
+                        self.assertEqual(
+                            service_config_file.container_reaper_max_attempts,
+                            async_actions.container_reaper_max_attempts)
+
+                        self.assertEqual(
+                            service_config_file.container_reaper_retry_delay,
+                            async_actions.container_reaper_retry_delay)
+
+                        self.assertEqual(
+                            service_config_file.container_sweeper_interval,
+                            async_actions.container_sweeper_interval)
+
+                        self.assertEqual(
+                            service_config_file.container_sweeper_min_age,
+                            async_actions.container_sweeper_min_age)
+
+                        self.assertEqual(
+                            service_config_file.container_sweeper_max_age,
+                            async_actions.container_sweeper_max_age)
+
+                        self.assertEqual(
+                            service_config_file.container_sweeper_batch_size,
+                            async_actions.container_sweeper_batch_size)
+
+                        self.assertEqual(
+                            service_config_file.task_template_pool_size,
+                            async_actions.task_template_pool_size)
+
+                        self.assertEqual(
+                            service_config_file.task_template_refill_retry_delay,
+                            async_actions.task_template_refill_retry_delay)
+
+                        # task template without a config section is ignored
+                        self.assertEqual(
+                            async_actions.task_templates.keys(),
+                            [service_config_file.task_template_name])
+                        task_template = async_actions.task_templates[service_config_file.task_template_name]
+                        self.assertEqual(
+                            service_config_file.task_template_docker_image,
+                            task_template.docker_image)
+                        self.assertEqual(
+                            service_config_file.task_template_cmd,
+                            task_template.cmd)
+                        self.assertEqual(
+                            service_config_file.task_template_section_pool_size,
+                            task_template.pool_size)
+
+                        self.assertEqual(
+                            service_config_file.bulkhead_max_queue_depth,
+                            async_docker_remote_api.bulkhead_max_queue_depth)
+
+                        self.assertEqual(
+                            service_config_file.bulkhead_max_concurrency,
+                            async_docker_remote_api.bulkhead_max_concurrency)
+
+                        self.assertEqual(
+                            service_config_file.task_store_ttl,
+                            task_store.task_store_ttl)
+
+                        self.assertEqual(
+                            service_config_file.task_store_max_bytes,
+                            task_store.task_store_max_bytes)
+
+                        self.assertEqual(
+                            service_config_file.task_store_max_wait,
+                            task_store.task_store_max_wait)
+
+                        self.assertEqual(
+                            service_config_file.task_scheduler_max_concurrency,
+                            task_scheduler.task_scheduler_max_concurrency)
+
+                        self.assertEqual(
+                            service_config_file.task_scheduler_max_queue_depth,
+                            task_scheduler.task_scheduler_max_queue_depth)
+
+                        self.assertEqual(
+                            service_config_file.task_scheduler_weights,
+                            task_scheduler.task_scheduler_weights)
+
+                        self.assertEqual(
+                            service_config_file.task_scheduler_default_weight,
+                            task_scheduler.task_scheduler_default_weight)
+
+                        self.assertEqual(
+                            service_config_file.task_scheduler_caller_header,
+                            task_scheduler.task_scheduler_caller_header)
+
+                        self.assertEqual(
+                            service_config_file.task_max_timeout,
+                            async_actions.task_max_timeout)
+
+                        self.assertEqual(
+                            service_config_file.docker_host_load_bound,
+                            async_docker_remote_api.docker_host_load_bound)
+
+                        self.assertEqual(
+                            service_config_file.docker_host_failure_threshold,
+                            async_docker_remote_api.docker_host_failure_threshold)
+
+                        self.assertEqual(
+                            service_config_file.docker_host_probe_interval,
+                            async_docker_remote_api.docker_host_probe_interval)
+
+                        self.assertEqual(
+                            service_config_file.health_check_refresh_interval,
+                            async_actions.health_check_refresh_interval)
+
+                        self.assertEqual(
+                            service_config_file.event_loop_monitor_interval,
+                            event_loop_monitor.event_loop_monitor_interval)
+
+                        self.assertEqual(
+                            service_config_file.event_loop_slow_callback_threshold,
+                            event_loop_monitor.event_loop_slow_callback_threshold)
+
+                        self.assertEqual(
+                            service_config_file.event_loop_lag_threshold,
+                            event_loop_monitor.event_loop_lag_threshold)
+
+                        self.assertEqual(
+                            service_config_file.task_scheduler_caller_ttl,
+                            task_scheduler.task_scheduler_caller_ttl)
+
+    def test_multiple_docker_remote_api_endpoints(self):
+        main = Main()
+        service_config_file = ServiceConfigFile(main.config_section)
+        service_config_file.docker_remote_api = 'http://2.2.2.2:6666, http://3.3.3.3:7777,'
+        with service_config_file:
+            sys_dot_arv = [
+                'service',
+                '--config=%s' % service_config_file.filename,
+            ]
+            with SysDotArgcPatcher(sys_dot_arv):
+                with TornadoHttpServerListenPatcher():
+                    with TornadoIOLoopInstancePatcher():
+                        main.configure()
+
+                        self.assertEqual(
+                            async_docker_remote_api.docker_remote_api_endpoints,
+                            ['http://2.2.2.2:6666', 'http://3.3.3.3:7777'])
+
+                        self.assertEqual(
+                            async_docker_remote_api.docker_remote_api_endpoint,
+                            'http://2.2.2.2:6666')
+
     def test_happy_path(self):
         main = Main()
         with ServiceConfigFile(main.config_section) as service_config_file:
@@ -245,3 +694,27 @@ class MainTestCase(unittest.TestCase):
                     with TornadoIOLoopInstancePatcher():
                         main.configure()
                         main.listen()
+
+
+class ApplicationTestCase(unittest.TestCase):
+
+    def test_log_request(self):
+        with mock.patch(__name__ + '.metrics.metrics', metrics.Metrics()) as patched_metrics:
+            app = Application()
+
+            handler = mock.Mock(url_spec='/v1.1/tasks/?')
+            handler.get_status.return_value = 201
+            handler.request.method = 'POST'
+            handler.request.request_time.return_value = 0.042
+            app.log_request(handler)
+
+            handler = mock.Mock(spec=['get_status', 'request', '_request_summary'])
+            handler.get_status.return_value = 404
+            handler.request.method = 'GET'
+            handler.request.request_time.return_value = 0.001
+            app.log_request(handler)
+
+            self.assertEqual(
+                sorted(patched_metrics.request_durations.keys()),
+                [('/v1.1/tasks/?', 'POST'), ('unknown', 'GET')])
+            self.assertEqual(patched_metrics.request_durations[('/v1.1/tasks/?', 'POST')].sum, 0.042)
@@ -0,0 +1,118 @@
+"""This module contains a collection of unit tests which
+validate the ..metrics module.
+"""
+
+import unittest
+
+from .. import metrics
+from ..metrics import Histogram
+from ..metrics import Metrics
+
+
+class AsyncWidgetFetch(object):
+
+    WFD_OK = 0x0000
+    WFD_ERROR = 0x0080
+    WFD_ERROR_FETCHING_WIDGET = WFD_ERROR | 0x0001
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_ctr(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.buckets, metrics.LATENCY_BUCKETS)
+        self.assertEqual(histogram.counts, [0] * (len(metrics.LATENCY_BUCKETS) + 1))
+        self.assertEqual(histogram.sum, 0.0)
+        self.assertEqual(histogram.count, 0)
+
+    def test_observe(self):
+        histogram = Histogram((1.0, 2.0))
+        for value in [0.5, 1.0, 1.5, 3.0, 4.0]:
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 2])
+        self.assertEqual(histogram.sum, 10.0)
+        self.assertEqual(histogram.count, 5)
+
+    def test_observe_does_not_allocate(self):
+        histogram = Histogram((1.0, 2.0))
+        counts = histogram.counts
+        histogram.observe(1.5)
+        self.assertTrue(histogram.counts is counts)
+
+    def test_render(self):
+        histogram = Histogram((1.0, 2.0))
+        for value in [0.5, 1.5, 3.0]:
+            histogram.observe(value)
+        expected_lines = [
+            'dave_bucket{le="1.0",x="y"} 1',
+            'dave_bucket{le="2.0",x="y"} 2',
+            'dave_bucket{le="+Inf",x="y"} 3',
+            'dave_sum{x="y"} 5.0',
+            'dave_count{x="y"} 3',
+        ]
+        self.assertEqual(histogram.render('dave', {'x': 'y'}), expected_lines)
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_ctr(self):
+        m = Metrics()
+        self.assertEqual(sorted(m.phase_durations.keys()), sorted(metrics.PHASES))
+        self.assertEqual(m.request_durations, {})
+        self.assertEqual(m.failure_details, {})
+
+    def test_observe_phase(self):
+        m = Metrics()
+        m.observe_phase(metrics.PHASE_WAIT, 2.0)
+        self.assertEqual(m.phase_durations[metrics.PHASE_WAIT].count, 1)
+        self.assertEqual(m.phase_durations[metrics.PHASE_PULL].count, 0)
+
+    def test_observe_request(self):
+        m = Metrics()
+        m.observe_request('/v1.1/tasks/?', 'POST', 0.2)
+        m.observe_request('/v1.1/tasks/?', 'POST', 0.4)
+        m.observe_request('/v1.1/_health', 'GET', 0.001)
+        self.assertEqual(m.request_durations[('/v1.1/tasks/?', 'POST')].count, 2)
+        self.assertEqual(m.request_durations[('/v1.1/_health', 'GET')].count, 1)
+
+        lines = m.render().split('\n')
+        self.assertIn('ecs_http_request_duration_seconds_count{endpoint="/v1.1/tasks/?",method="POST"} 2', lines)
+
+    def test_count_failure_detail(self):
+        m = Metrics()
+        m.count_failure_detail(AsyncWidgetFetch, 'WFD', AsyncWidgetFetch.WFD_OK)
+        m.count_failure_detail(AsyncWidgetFetch, 'WFD', AsyncWidgetFetch.WFD_ERROR_FETCHING_WIDGET)
+        m.count_failure_detail(AsyncWidgetFetch, 'WFD', AsyncWidgetFetch.WFD_ERROR_FETCHING_WIDGET)
+        m.count_failure_detail(AsyncWidgetFetch, 'WFD', 0x00ff)
+
+        lines = m.render().split('\n')
+        self.assertIn('# TYPE ecs_failure_details_total counter', lines)
+        fmt = 'ecs_failure_details_total{action="AsyncWidgetFetch",detail="%s"} %d'
+        self.assertIn(fmt % ('WFD_OK', 1), lines)
+        self.assertIn(fmt % ('WFD_ERROR_FETCHING_WIDGET', 2), lines)
+        self.assertIn(fmt % ('0x00ff', 1), lines)
+
+    def test_render_gauges(self):
+        gauges = [
+            ('ecs_dave', 'Some help.', [({}, 1), ({'endpoint': 'a"b\\c'}, 2)]),
+        ]
+        body = Metrics().render(gauges)
+        self.assertTrue(body.endswith('\n'))
+
+        lines = body.split('\n')
+        self.assertIn('# HELP ecs_dave Some help.', lines)
+        self.assertIn('# TYPE ecs_dave gauge', lines)
+        self.assertIn('ecs_dave 1', lines)
+        self.assertIn('ecs_dave{endpoint="a\\"b\\\\c"} 2', lines)
+
+    def test_render_histograms(self):
+        histogram = Histogram((1.0,))
+        histogram.observe(0.5)
+        histograms = [
+            ('ecs_dave_seconds', 'Some help.', [({'caller': 'alice'}, histogram)]),
+        ]
+        lines = Metrics().render(histograms=histograms).split('\n')
+        self.assertIn('# HELP ecs_dave_seconds Some help.', lines)
+        self.assertIn('# TYPE ecs_dave_seconds histogram', lines)
+        self.assertIn('ecs_dave_seconds_bucket{caller="alice",le="1.0"} 1', lines)
+        self.assertIn('ecs_dave_seconds_count{caller="alice"} 1', lines)
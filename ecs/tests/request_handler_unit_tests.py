@@ -6,20 +6,32 @@ import base64
 import httplib
 import json
 import re
+import time
 import uuid
 
 import mock
 import tor_async_util
 import tornado
+import tornado.gen
 import tornado.netutil
 import tornado.testing
 import tornado.web
+import tornado.websocket
 
+from .. import async_actions
+from .. import metrics
+from .. import task_scheduler
+from .. import task_store
 from ..async_actions import AsyncEndToEndContainerRunner     # noqa
+from ..async_docker_remote_api import StreamDemuxer
 import ecs
+from ..request_handlers import BatchTasksRequestHandler
 from ..request_handlers import HealthRequestHandler
+from ..request_handlers import MetricsRequestHandler
 from ..request_handlers import NoOpRequestHandler
+from ..request_handlers import TaskRequestHandler
 from ..request_handlers import TasksRequestHandler
+from ..request_handlers import TasksWebSocketHandler
 from ..request_handlers import VersionRequestHandler
 
 
@@ -97,6 +109,59 @@ class WriteAndVerifyPatcher(Patcher):
         Patcher.__init__(self, patcher)
 
 
+class TooBusyTaskSchedulerPatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch which replaces task_scheduler.task_scheduler with a
+    task scheduler which rejects all tasks.
+    """
+
+    def __init__(self):
+        self.task_scheduler = task_scheduler.TaskScheduler()
+        self.task_scheduler._time_between_completions = 2.5
+
+        self._max_concurrency_patcher = mock.patch(
+            __name__ + '.task_scheduler.task_scheduler_max_concurrency',
+            0)
+        self._max_queue_depth_patcher = mock.patch(
+            __name__ + '.task_scheduler.task_scheduler_max_queue_depth',
+            0)
+
+        patcher = mock.patch(
+            __name__ + '.task_scheduler.task_scheduler',
+            self.task_scheduler)
+
+        Patcher.__init__(self, patcher)
+
+    def __enter__(self):
+        self._max_concurrency_patcher.start()
+        self._max_queue_depth_patcher.start()
+        return Patcher.__enter__(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        Patcher.__exit__(self, exc_type, exc_value, traceback)
+        self._max_queue_depth_patcher.stop()
+        self._max_concurrency_patcher.stop()
+
+
+class SlowTaskSchedulerPatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch which replaces task_scheduler.task_scheduler with a
+    task scheduler which has no free slots and has observed tasks
+    completing every 2.5 seconds.
+    """
+
+    def __init__(self):
+        self.task_scheduler = task_scheduler.TaskScheduler()
+        self.task_scheduler._time_between_completions = 2.5
+        self.task_scheduler.number_running = task_scheduler.task_scheduler_max_concurrency
+
+        patcher = mock.patch(
+            __name__ + '.task_scheduler.task_scheduler',
+            self.task_scheduler)
+
+        Patcher.__init__(self, patcher)
+
+
 class AsyncRequestHandlerTestCase(tornado.testing.AsyncHTTPTestCase):
 
     def assertDebugDetail(self, response, expected_value):
@@ -163,6 +228,208 @@ class TasksRequestHandlerTestCase(AsyncRequestHandlerTestCase):
 
         self.assertEmptyJsonDocumentResponse(response)
 
+    def test_post_bad_pull_policy(self):
+        headers = {
+            'Content-Type': 'application/json; charset=utf-8',
+        }
+        body = {
+            'docker_image': 'ubuntu:latest',
+            'cmd': [
+                'echo',
+                'hello world!!!',
+            ],
+            'pull_policy': uuid.uuid4().hex,
+        }
+        response = self.fetch(
+            '/v1.1/tasks',
+            method='POST',
+            headers=headers,
+            body=json.dumps(body))
+
+        self.assertEqual(response.code, httplib.BAD_REQUEST)
+
+        self.assertDebugDetail(
+            response,
+            TasksRequestHandler.PDD_BAD_REQUEST_BODY)
+
+        self.assertEmptyJsonDocumentResponse(response)
+
+    def test_too_busy(self):
+        with TooBusyTaskSchedulerPatcher():
+            with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create') as create:
+                headers = {
+                    'Content-Type': 'application/json; charset=utf-8',
+                }
+                body = {
+                    'docker_image': 'ubuntu:latest',
+                    'cmd': [
+                        'echo',
+                        'hello world!!!',
+                    ],
+                }
+                for query_string in ['', '?async=true', '?stream=true']:
+                    response = self.fetch(
+                        '/v1.1/tasks%s' % query_string,
+                        method='POST',
+                        headers=headers,
+                        body=json.dumps(body))
+
+                    self.assertEqual(response.code, httplib.SERVICE_UNAVAILABLE)
+
+                    self.assertDebugDetail(
+                        response,
+                        TasksRequestHandler.PDD_TOO_BUSY)
+
+                    self.assertEqual(response.headers['Retry-After'], '3')
+
+                    self.assertEmptyJsonDocumentResponse(response)
+
+                self.assertFalse(create.called)
+
+    def test_deadline_cannot_be_met(self):
+        with SlowTaskSchedulerPatcher() as patcher:
+            with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create') as create:
+                headers = {
+                    'Content-Type': 'application/json; charset=utf-8',
+                }
+                body = {
+                    'docker_image': 'ubuntu:latest',
+                    'cmd': [
+                        'echo',
+                        'hello world!!!',
+                    ],
+                    'priority': 'interactive',
+                    'deadline': 1000,
+                }
+                for query_string in ['', '?async=true', '?stream=true']:
+                    response = self.fetch(
+                        '/v1.1/tasks%s' % query_string,
+                        method='POST',
+                        headers=headers,
+                        body=json.dumps(body))
+
+                    self.assertEqual(response.code, httplib.SERVICE_UNAVAILABLE)
+
+                    self.assertDebugDetail(
+                        response,
+                        TasksRequestHandler.PDD_DEADLINE_CANNOT_BE_MET)
+
+                    self.assertEqual(response.headers['Retry-After'], '3')
+
+                    self.assertEmptyJsonDocumentResponse(response)
+
+                self.assertFalse(create.called)
+                self.assertEqual(patcher.task_scheduler.number_submitted, 0)
+
+    def test_rejected_by_task_scheduler(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler.submit', return_value=False):
+            with mock.patch(__name__ + '.task_scheduler.task_scheduler.can_submit', side_effect=[True, True]):
+                headers = {
+                    'Content-Type': 'application/json; charset=utf-8',
+                }
+                body = {
+                    'docker_image': 'ubuntu:latest',
+                    'cmd': [
+                        'echo',
+                        'hello world!!!',
+                    ],
+                    'deadline': 1000,
+                }
+                response = self.fetch(
+                    '/v1.1/tasks',
+                    method='POST',
+                    headers=headers,
+                    body=json.dumps(body))
+
+                self.assertEqual(response.code, httplib.SERVICE_UNAVAILABLE)
+                self.assertDebugDetail(response, TasksRequestHandler.PDD_DEADLINE_CANNOT_BE_MET)
+                self.assertIn('Retry-After', response.headers)
+
+            for query_string in ['', '?async=true', '?stream=true']:
+                with mock.patch(__name__ + '.task_scheduler.task_scheduler.can_submit', side_effect=[True, False]):
+                    number_running = task_store.task_store.number_running
+                    number_finished = task_store.task_store.number_finished
+
+                    response = self.fetch(
+                        '/v1.1/tasks%s' % query_string,
+                        method='POST',
+                        headers=headers,
+                        body=json.dumps(body))
+
+                    self.assertEqual(response.code, httplib.SERVICE_UNAVAILABLE)
+                    self.assertDebugDetail(response, TasksRequestHandler.PDD_TOO_BUSY)
+                    self.assertIn('Retry-After', response.headers)
+                    self.assertEmptyJsonDocumentResponse(response)
+
+                    self.assertEqual(task_store.task_store.number_running, number_running)
+                    self.assertEqual(task_store.task_store.number_finished, number_finished)
+
+    def test_priority_and_deadline_submitted(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler.submit') as submit:
+            def submit_patch(acr, callback, caller, priority, deadline):
+                callback(False, None, None, None, None, acr)
+                return True
+
+            submit.side_effect = submit_patch
+
+            headers = {
+                'Content-Type': 'application/json; charset=utf-8',
+            }
+            body = {
+                'docker_image': 'ubuntu:latest',
+                'cmd': [
+                    'echo',
+                    'hello world!!!',
+                ],
+                'priority': 'batch',
+                'deadline': 60000,
+            }
+            response = self.fetch(
+                '/v1.1/tasks',
+                method='POST',
+                headers=headers,
+                body=json.dumps(body))
+
+            self.assertEqual(response.code, httplib.INTERNAL_SERVER_ERROR)
+
+            self.assertEqual(submit.call_args[0][3:], ('batch', 60000))
+
+    def test_caller_identification(self):
+        basic_auth = 'Basic %s' % base64.b64encode('alice:secret')
+        cases = [
+            ({}, None, None),
+            ({'Authorization': basic_auth}, None, 'alice'),
+            ({'Authorization': 'Basic !!!'}, None, None),
+            ({'Authorization': 'Bearer abc'}, None, None),
+            ({'Authorization': basic_auth, 'X-ECS-Caller': 'bob'}, None, 'alice'),
+            ({'Authorization': basic_auth, 'X-ECS-Caller': 'bob'}, 'X-ECS-Caller', 'bob'),
+            ({'Authorization': basic_auth}, 'X-ECS-Caller', 'alice'),
+        ]
+
+        def submit_patch(acr, callback, caller):
+            callback(False, None, None, None, None, acr)
+            return True
+
+        for (headers, caller_header, expected_caller) in cases:
+            with mock.patch(__name__ + '.task_scheduler.task_scheduler_caller_header', caller_header):
+                with mock.patch(__name__ + '.task_scheduler.task_scheduler.submit', side_effect=submit_patch) as submit:
+                    headers['Content-Type'] = 'application/json; charset=utf-8'
+                    body = {
+                        'docker_image': 'ubuntu:latest',
+                        'cmd': [
+                            'echo',
+                            'hello world!!!',
+                        ],
+                    }
+                    self.fetch(
+                        '/v1.1/tasks',
+                        method='POST',
+                        headers=headers,
+                        body=json.dumps(body))
+
+                    self.assertEqual(submit.call_count, 1)
+                    self.assertEqual(submit.call_args[0][2], expected_caller)
+
     def test_container_runner_error(self):
         with AsyncEndToEndContainerRunnerPatcher(is_ok=False):
             headers = {
@@ -280,6 +547,808 @@ class TasksRequestHandlerTestCase(AsyncRequestHandlerTestCase):
             }
             self.assertJsonDocumentResponse(response, expected_body)
 
+    def test_no_stdout_or_stderr(self):
+        with AsyncEndToEndContainerRunnerPatcher(is_ok=True,
+                                                 is_image_found=True,
+                                                 exit_code=0,
+                                                 stdout=None,
+                                                 stderr=None):
+            headers = {
+                'Content-Type': 'application/json; charset=utf-8',
+            }
+            body = {
+                'docker_image': 'ubuntu:latest',
+                'cmd': [
+                    'true',
+                ],
+            }
+            response = self.fetch(
+                '/v1.1/tasks',
+                method='POST',
+                headers=headers,
+                body=json.dumps(body))
+
+            self.assertEqual(response.code, httplib.CREATED)
+            self.assertNoDebugDetail(response)
+
+            expected_body = {
+                'exitCode': 0,
+                'stdout': '',
+                'stderr': '',
+            }
+            self.assertJsonDocumentResponse(response, expected_body)
+
+    def test_timed_out(self):
+        def create_patch(acr, callback):
+            self.assertEqual(acr.timeout, 2000)
+            acr.is_timed_out = True
+            callback(True, True, 137, 'partial', '', acr)
+
+        with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create', create_patch):
+            headers = {
+                'Content-Type': 'application/json; charset=utf-8',
+            }
+            body = {
+                'docker_image': 'ubuntu:latest',
+                'cmd': [
+                    'sleep',
+                    '3600',
+                ],
+                'timeout_ms': 2000,
+            }
+            response = self.fetch(
+                '/v1.1/tasks',
+                method='POST',
+                headers=headers,
+                body=json.dumps(body))
+
+            self.assertEqual(response.code, httplib.CREATED)
+            self.assertNoDebugDetail(response)
+
+            expected_body = {
+                'exitCode': 137,
+                'stdout': base64.b64encode('partial'),
+                'stderr': '',
+                'timedOut': True,
+            }
+            self.assertJsonDocumentResponse(response, expected_body)
+
+    def test_server_timing(self):
+        def create_patch(acr, callback):
+            acr.started_at = time.time()
+            acr.phase_durations = {
+                metrics.PHASE_PULL: 0.25,
+                metrics.PHASE_START: 0.0015,
+            }
+            self.cid = acr.cid
+            callback(True, True, 0, '', '', acr)
+
+        with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create', create_patch):
+            headers = {
+                'Content-Type': 'application/json; charset=utf-8',
+            }
+            body = {
+                'docker_image': 'ubuntu:latest',
+                'cmd': [
+                    'echo',
+                    'hello world!!!',
+                ],
+            }
+            response = self.fetch(
+                '/v1.1/tasks',
+                method='POST',
+                headers=headers,
+                body=json.dumps(body))
+
+            self.assertEqual(response.code, httplib.CREATED)
+
+            server_timing = [metric.strip() for metric in response.headers['Server-Timing'].split(',')]
+            self.assertEqual(len(server_timing), 5)
+            self.assertRegexpMatches(server_timing[0], r'^queue;dur=\d+\.\d{3}$')
+            self.assertEqual(server_timing[1], 'pull;dur=250.000')
+            self.assertEqual(server_timing[2], 'start;dur=1.500')
+            self.assertRegexpMatches(server_timing[3], r'^encode;dur=\d+\.\d{3}$')
+            self.assertEqual(server_timing[4], 'cid;desc="%s"' % self.cid)
+
+    def test_server_timing_on_image_not_found(self):
+        with AsyncEndToEndContainerRunnerPatcher(is_ok=True, is_image_found=False):
+            headers = {
+                'Content-Type': 'application/json; charset=utf-8',
+            }
+            body = {
+                'docker_image': 'ubuntu:latest',
+                'cmd': [
+                    'echo',
+                    'hello world!!!',
+                ],
+            }
+            response = self.fetch(
+                '/v1.1/tasks',
+                method='POST',
+                headers=headers,
+                body=json.dumps(body))
+
+            self.assertEqual(response.code, httplib.NOT_FOUND)
+            self.assertRegexpMatches(
+                response.headers['Server-Timing'],
+                r'^encode;dur=\d+\.\d{3}, cid;desc="[0-9a-f]{32}"$')
+
+    def test_post_template_and_docker_image(self):
+        headers = {
+            'Content-Type': 'application/json; charset=utf-8',
+        }
+        body = {
+            'template': uuid.uuid4().hex,
+            'docker_image': 'ubuntu:latest',
+            'cmd': [
+                'echo',
+                'hello world!!!',
+            ],
+        }
+        response = self.fetch(
+            '/v1.1/tasks',
+            method='POST',
+            headers=headers,
+            body=json.dumps(body))
+
+        self.assertEqual(response.code, httplib.BAD_REQUEST)
+
+        self.assertDebugDetail(
+            response,
+            TasksRequestHandler.PDD_BAD_REQUEST_BODY)
+
+        self.assertEmptyJsonDocumentResponse(response)
+
+    def test_template_not_found(self):
+        with mock.patch(__name__ + '.async_actions.task_templates', {}):
+            headers = {
+                'Content-Type': 'application/json; charset=utf-8',
+            }
+            body = {
+                'template': uuid.uuid4().hex,
+            }
+            response = self.fetch(
+                '/v1.1/tasks',
+                method='POST',
+                headers=headers,
+                body=json.dumps(body))
+
+            self.assertEqual(response.code, httplib.NOT_FOUND)
+
+            self.assertDebugDetail(
+                response,
+                TasksRequestHandler.PDD_TEMPLATE_NOT_FOUND)
+
+            self.assertEmptyJsonDocumentResponse(response)
+
+    def test_template_happy_path(self):
+        exit_code = 0
+        stdout = uuid.uuid4().hex
+        stderr = uuid.uuid4().hex
+        task_template = async_actions.TaskTemplate(
+            uuid.uuid4().hex,
+            'ubuntu:latest',
+            ['echo', 'hello world!!!'])
+        task_templates = {
+            task_template.name: task_template,
+        }
+        acrs = []
+
+        def create_patch(acr, callback):
+            acrs.append(acr)
+            callback(True, True, exit_code, stdout, stderr, acr)
+
+        with mock.patch(__name__ + '.async_actions.task_templates', task_templates):
+            with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create', create_patch):
+                headers = {
+                    'Content-Type': 'application/json; charset=utf-8',
+                }
+                body = {
+                    'template': task_template.name,
+                }
+                response = self.fetch(
+                    '/v1.1/tasks',
+                    method='POST',
+                    headers=headers,
+                    body=json.dumps(body))
+
+                self.assertEqual(response.code, httplib.CREATED)
+                self.assertNoDebugDetail(response)
+
+                self.assertEqual(len(acrs), 1)
+                self.assertTrue(acrs[0].task_template is task_template)
+                self.assertEqual(acrs[0].docker_image, task_template.docker_image)
+                self.assertEqual(acrs[0].cmd, task_template.cmd)
+
+
+class StreamingTasksRequestHandlerTestCase(AsyncRequestHandlerTestCase):
+    """Unit tests for TasksRequestHandler when a task's
+    stdout and stderr are streamed.
+    """
+
+    def get_app(self):
+        handlers = [
+            (
+                TasksRequestHandler.url_spec,
+                TasksRequestHandler
+            ),
+        ]
+        return tornado.web.Application(handlers=handlers)
+
+    def _post(self, query_string='?stream=true'):
+        headers = {
+            'Content-Type': 'application/json; charset=utf-8',
+        }
+        body = {
+            'docker_image': 'ubuntu:latest',
+            'cmd': [
+                'echo',
+                'hello world!!!',
+            ],
+        }
+        return self.fetch(
+            '/v1.1/tasks%s' % query_string,
+            method='POST',
+            headers=headers,
+            body=json.dumps(body))
+
+    def test_async_and_stream(self):
+        response = self._post('?stream=true&async=true')
+
+        self.assertEqual(response.code, httplib.BAD_REQUEST)
+
+        self.assertDebugDetail(
+            response,
+            TasksRequestHandler.PDD_BAD_QUERY_STRING)
+
+        self.assertEmptyJsonDocumentResponse(response)
+
+    def test_container_runner_error_before_output(self):
+        with AsyncEndToEndContainerRunnerPatcher(is_ok=False):
+            response = self._post()
+
+            self.assertEqual(response.code, httplib.INTERNAL_SERVER_ERROR)
+
+            self.assertDebugDetail(
+                response,
+                TasksRequestHandler.PDD_ERROR_CREATING_RAW_CRAWL)
+
+            self.assertEmptyJsonDocumentResponse(response)
+
+    def test_image_not_found(self):
+        with AsyncEndToEndContainerRunnerPatcher(is_ok=True, is_image_found=False):
+            response = self._post()
+
+            self.assertEqual(response.code, httplib.NOT_FOUND)
+
+            self.assertDebugDetail(
+                response,
+                TasksRequestHandler.PDD_IMAGE_NOT_FOUND)
+
+            self.assertEmptyJsonDocumentResponse(response)
+
+    def test_container_runner_error_after_output(self):
+
+        def create_patch(acr, callback):
+            acr.frame_callback(StreamDemuxer.STDOUT, 'out')
+            callback(False, None, None, None, None, acr)
+
+        with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create', create_patch):
+            response = self._post()
+
+            self.assertEqual(response.code, httplib.OK)
+            self.assertNoDebugDetail(response)
+
+            lines = [json.loads(line) for line in response.body.splitlines()]
+            expected_lines = [
+                {'stream': 'stdout', 'data': base64.b64encode('out')},
+                {'state': task_store.Task.STATE_FAILED},
+            ]
+            self.assertEqual(lines, expected_lines)
+
+    def test_happy_path(self):
+
+        def create_patch(acr, callback):
+            acr.frame_callback(StreamDemuxer.STDOUT, 'hello ')
+            acr.frame_callback(StreamDemuxer.STDERR, 'oops')
+            acr.frame_callback(StreamDemuxer.STDOUT, 'world')
+            callback(True, True, 3, None, None, acr)
+
+        with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create', create_patch):
+            response = self._post()
+
+            self.assertEqual(response.code, httplib.OK)
+            self.assertNoDebugDetail(response)
+            self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+
+            lines = [json.loads(line) for line in response.body.splitlines()]
+            expected_lines = [
+                {'stream': 'stdout', 'data': base64.b64encode('hello ')},
+                {'stream': 'stderr', 'data': base64.b64encode('oops')},
+                {'stream': 'stdout', 'data': base64.b64encode('world')},
+                {'state': task_store.Task.STATE_FINISHED, 'exitCode': 3},
+            ]
+            self.assertEqual(lines, expected_lines)
+
+    def test_no_output(self):
+        with AsyncEndToEndContainerRunnerPatcher(is_ok=True, is_image_found=True, exit_code=0):
+            response = self._post()
+
+            self.assertEqual(response.code, httplib.OK)
+
+            lines = [json.loads(line) for line in response.body.splitlines()]
+            expected_lines = [
+                {'state': task_store.Task.STATE_FINISHED, 'exitCode': 0},
+            ]
+            self.assertEqual(lines, expected_lines)
+
+
+class TaskStorePatcher(Patcher):
+    """This context manager provides an easy way to install a
+    patch which replaces task_store.task_store with a new, empty
+    task store.
+    """
+
+    def __init__(self):
+        self.task_store = task_store.TaskStore()
+
+        patcher = mock.patch(
+            __name__ + '.task_store.task_store',
+            self.task_store)
+
+        Patcher.__init__(self, patcher)
+
+
+class AsyncTasksRequestHandlerTestCase(AsyncRequestHandlerTestCase):
+    """Unit tests for TasksRequestHandler and TaskRequestHandler
+    when tasks are submitted asynchronously.
+    """
+
+    def get_app(self):
+        handlers = [
+            (
+                TasksRequestHandler.url_spec,
+                TasksRequestHandler
+            ),
+            (
+                TaskRequestHandler.url_spec,
+                TaskRequestHandler
+            ),
+        ]
+        return tornado.web.Application(handlers=handlers)
+
+    def _post_async(self):
+        headers = {
+            'Content-Type': 'application/json; charset=utf-8',
+        }
+        body = {
+            'docker_image': 'ubuntu:latest',
+            'cmd': [
+                'echo',
+                'hello world!!!',
+            ],
+        }
+        return self.fetch(
+            '/v1.1/tasks?async=true',
+            method='POST',
+            headers=headers,
+            body=json.dumps(body))
+
+    def test_post_async_and_get(self):
+        exit_code = 45
+        stdout = uuid.uuid4().hex
+        stderr = uuid.uuid4().hex
+        with TaskStorePatcher():
+            with AsyncEndToEndContainerRunnerPatcher(is_ok=True,
+                                                     is_image_found=True,
+                                                     exit_code=exit_code,
+                                                     stdout=stdout,
+                                                     stderr=stderr):
+                response = self._post_async()
+
+                self.assertEqual(response.code, httplib.ACCEPTED)
+                self.assertNoDebugDetail(response)
+
+                task_id = json.loads(response.body)['id']
+                location = response.headers['Location']
+                self.assertTrue(location.endswith('/v1.1/tasks/%s' % task_id))
+                self.assertEqual(json.loads(response.body)['links']['self']['href'], location)
+
+                response = self.fetch('/v1.1/tasks/%s' % task_id)
+
+                self.assertEqual(response.code, httplib.OK)
+                self.assertNoDebugDetail(response)
+
+                body = json.loads(response.body)
+                self.assertEqual(body['id'], task_id)
+                self.assertEqual(body['state'], task_store.Task.STATE_FINISHED)
+                self.assertEqual(body['exitCode'], exit_code)
+                self.assertEqual(body['stdout'], base64.b64encode(stdout))
+                self.assertEqual(body['stderr'], base64.b64encode(stderr))
+
+    def test_post_async_container_runner_error(self):
+        with TaskStorePatcher():
+            with AsyncEndToEndContainerRunnerPatcher(is_ok=False):
+                response = self._post_async()
+                self.assertEqual(response.code, httplib.ACCEPTED)
+
+                task_id = json.loads(response.body)['id']
+                response = self.fetch('/v1.1/tasks/%s' % task_id)
+
+                self.assertEqual(response.code, httplib.OK)
+                body = json.loads(response.body)
+                self.assertEqual(body['state'], task_store.Task.STATE_FAILED)
+                self.assertNotIn('exitCode', body)
+
+    def test_post_async_image_not_found(self):
+        with TaskStorePatcher():
+            with AsyncEndToEndContainerRunnerPatcher(is_ok=True, is_image_found=False):
+                response = self._post_async()
+                self.assertEqual(response.code, httplib.ACCEPTED)
+
+                task_id = json.loads(response.body)['id']
+                response = self.fetch('/v1.1/tasks/%s' % task_id)
+
+                self.assertEqual(response.code, httplib.OK)
+                body = json.loads(response.body)
+                self.assertEqual(body['state'], task_store.Task.STATE_IMAGE_NOT_FOUND)
+
+    def test_get_task_not_found(self):
+        with TaskStorePatcher():
+            response = self.fetch('/v1.1/tasks/%s' % uuid.uuid4().hex)
+
+            self.assertEqual(response.code, httplib.NOT_FOUND)
+            self.assertDebugDetail(response, TaskRequestHandler.GDD_TASK_NOT_FOUND)
+
+    def test_get_bad_wait(self):
+        with TaskStorePatcher() as patcher:
+            task = patcher.task_store.add(uuid.uuid4().hex)
+            response = self.fetch('/v1.1/tasks/%s?wait=abc' % task.task_id)
+
+            self.assertEqual(response.code, httplib.BAD_REQUEST)
+            self.assertDebugDetail(response, TaskRequestHandler.GDD_BAD_WAIT)
+
+    def test_get_running_task(self):
+        with TaskStorePatcher() as patcher:
+            task = patcher.task_store.add(uuid.uuid4().hex)
+            response = self.fetch('/v1.1/tasks/%s' % task.task_id)
+
+            self.assertEqual(response.code, httplib.OK)
+            body = json.loads(response.body)
+            self.assertEqual(body['state'], task_store.Task.STATE_RUNNING)
+
+    def test_get_long_poll_until_finished(self):
+        with TaskStorePatcher() as patcher:
+            task = patcher.task_store.add(uuid.uuid4().hex)
+
+            self.io_loop.call_later(
+                0.1,
+                patcher.task_store.finish,
+                task.task_id,
+                task_store.Task.STATE_FINISHED,
+                0,
+                'out',
+                'err')
+
+            response = self.fetch('/v1.1/tasks/%s?wait=5000' % task.task_id)
+
+            self.assertEqual(response.code, httplib.OK)
+            body = json.loads(response.body)
+            self.assertEqual(body['state'], task_store.Task.STATE_FINISHED)
+            self.assertEqual(body['stdout'], base64.b64encode('out'))
+
+    def test_get_long_poll_timeout(self):
+        with TaskStorePatcher() as patcher:
+            task = patcher.task_store.add(uuid.uuid4().hex)
+
+            response = self.fetch('/v1.1/tasks/%s?wait=100' % task.task_id)
+
+            self.assertEqual(response.code, httplib.OK)
+            body = json.loads(response.body)
+            self.assertEqual(body['state'], task_store.Task.STATE_RUNNING)
+
+
+class BatchTasksRequestHandlerTestCase(AsyncRequestHandlerTestCase):
+    """Unit tests for BatchTasksRequestHandler"""
+
+    def get_app(self):
+        handlers = [
+            (
+                BatchTasksRequestHandler.url_spec,
+                BatchTasksRequestHandler
+            ),
+        ]
+        return tornado.web.Application(handlers=handlers)
+
+    def _post(self, body):
+        headers = {
+            'Content-Type': 'application/json; charset=utf-8',
+        }
+        return self.fetch(
+            '/v1.1/tasks/_batch',
+            method='POST',
+            headers=headers,
+            body=json.dumps(body))
+
+    def test_post_bad_request_body(self):
+        bodies = [
+            [],
+            {'docker_image': 'ubuntu:latest', 'cmd': ['echo', 'hello']},
+            [{'docker_image': 'ubuntu:latest'}],
+        ]
+        for body in bodies:
+            response = self._post(body)
+
+            self.assertEqual(response.code, httplib.BAD_REQUEST)
+
+            self.assertDebugDetail(
+                response,
+                BatchTasksRequestHandler.PDD_BAD_REQUEST_BODY)
+
+            self.assertEmptyJsonDocumentResponse(response)
+
+    def test_template_not_found(self):
+        acrs = []
+
+        def create_patch(acr, callback):
+            acrs.append(acr)
+
+        with mock.patch(__name__ + '.async_actions.task_templates', {}):
+            with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create', create_patch):
+                body = [
+                    {'docker_image': 'ubuntu:latest', 'cmd': ['echo', 'hello']},
+                    {'template': uuid.uuid4().hex},
+                ]
+                response = self._post(body)
+
+                self.assertEqual(response.code, httplib.NOT_FOUND)
+
+                self.assertDebugDetail(
+                    response,
+                    BatchTasksRequestHandler.PDD_TEMPLATE_NOT_FOUND)
+
+                self.assertEmptyJsonDocumentResponse(response)
+
+                # no task in the batch is started if any template isn't found
+                self.assertEqual(acrs, [])
+
+    def test_too_busy(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_queue_depth', 1):
+                with mock.patch(__name__ + '.task_scheduler.task_scheduler', task_scheduler.TaskScheduler()):
+                    with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create') as create:
+                        body = [
+                            {'docker_image': 'ubuntu:latest', 'cmd': ['echo', 'hello']},
+                            {'docker_image': 'ubuntu:latest', 'cmd': ['echo', 'hello']},
+                            {'docker_image': 'ubuntu:latest', 'cmd': ['echo', 'hello']},
+                        ]
+                        response = self._post(body)
+
+                        self.assertEqual(response.code, httplib.SERVICE_UNAVAILABLE)
+
+                        self.assertDebugDetail(
+                            response,
+                            BatchTasksRequestHandler.PDD_TOO_BUSY)
+
+                        self.assertEqual(response.headers['Retry-After'], '1')
+
+                        self.assertEmptyJsonDocumentResponse(response)
+
+                        # none of the batch's tasks are started
+                        self.assertFalse(create.called)
+
+    def test_deadline_cannot_be_met(self):
+        with SlowTaskSchedulerPatcher():
+            with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create') as create:
+                body = [
+                    {'docker_image': 'ubuntu:latest', 'cmd': ['echo', 'hello']},
+                    {'docker_image': 'ubuntu:latest', 'cmd': ['echo', 'hello'], 'deadline': 1000},
+                ]
+                response = self._post(body)
+
+                self.assertEqual(response.code, httplib.SERVICE_UNAVAILABLE)
+
+                self.assertDebugDetail(
+                    response,
+                    BatchTasksRequestHandler.PDD_DEADLINE_CANNOT_BE_MET)
+
+                self.assertEmptyJsonDocumentResponse(response)
+
+                # none of the batch's tasks are started
+                self.assertFalse(create.called)
+
+    def test_happy_path(self):
+        results = {
+            'ok:latest': (True, True, 0, 'out', 'err'),
+            'error:latest': (False, None, None, None, None),
+            'not-found:latest': (True, False, None, None, None),
+        }
+
+        def create_patch(acr, callback):
+            callback(*(results[acr.docker_image] + (acr,)))
+
+        with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create', create_patch):
+            body = [
+                {'docker_image': 'ok:latest', 'cmd': ['echo', 'hello']},
+                {'docker_image': 'error:latest', 'cmd': ['echo', 'hello']},
+                {'docker_image': 'not-found:latest', 'cmd': ['echo', 'hello']},
+            ]
+            response = self._post(body)
+
+            self.assertEqual(response.code, httplib.OK)
+            self.assertNoDebugDetail(response)
+            self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+
+            lines = [json.loads(line) for line in response.body.splitlines()]
+            self.assertEqual(len(lines), len(body))
+            lines = {line['index']: line for line in lines}
+            for line in lines.values():
+                self.assertIsNotNone(line['id'])
+
+            self.assertEqual(lines[0]['state'], task_store.Task.STATE_FINISHED)
+            self.assertEqual(lines[0]['exitCode'], 0)
+            self.assertEqual(lines[0]['stdout'], base64.b64encode('out'))
+            self.assertEqual(lines[0]['stderr'], base64.b64encode('err'))
+
+            self.assertEqual(lines[1]['state'], task_store.Task.STATE_FAILED)
+            self.assertNotIn('exitCode', lines[1])
+
+            self.assertEqual(lines[2]['state'], task_store.Task.STATE_IMAGE_NOT_FOUND)
+            self.assertNotIn('exitCode', lines[2])
+
+
+class TasksWebSocketHandlerTestCase(AsyncRequestHandlerTestCase):
+    """Unit tests for TasksWebSocketHandler"""
+
+    def get_app(self):
+        handlers = [
+            (
+                TasksWebSocketHandler.url_spec,
+                TasksWebSocketHandler
+            ),
+        ]
+        return tornado.web.Application(handlers=handlers)
+
+    @tornado.gen.coroutine
+    def _connect(self):
+        url = 'ws://127.0.0.1:%d/v1.1/tasks/ws' % self.get_http_port()
+        connection = yield tornado.websocket.websocket_connect(url)
+        raise tornado.gen.Return(connection)
+
+    @tornado.gen.coroutine
+    def _read_messages(self, connection, number_messages):
+        messages = []
+        for i in range(number_messages):
+            message = yield connection.read_message()
+            messages.append(json.loads(message))
+        raise tornado.gen.Return(messages)
+
+    @tornado.testing.gen_test
+    def test_bad_message(self):
+        connection = yield self._connect()
+
+        messages = [
+            'dave was here',
+            json.dumps({'ref': 'abc'}),
+            json.dumps({'ref': 'abc', 'task': {'docker_image': 'ubuntu:latest'}}),
+        ]
+        for message in messages:
+            connection.write_message(message)
+            response = yield self._read_messages(connection, 1)
+            self.assertEqual(response, [{'event': TasksWebSocketHandler.EVENT_ERROR, 'reason': 'bad request'}])
+
+        connection.close()
+
+    @tornado.testing.gen_test
+    def test_template_not_found(self):
+        with mock.patch(__name__ + '.async_actions.task_templates', {}):
+            connection = yield self._connect()
+
+            connection.write_message(json.dumps({'ref': 'abc', 'task': {'template': uuid.uuid4().hex}}))
+            response = yield self._read_messages(connection, 1)
+            expected_response = [
+                {
+                    'event': TasksWebSocketHandler.EVENT_ERROR,
+                    'reason': 'template not found',
+                    'ref': 'abc',
+                },
+            ]
+            self.assertEqual(response, expected_response)
+
+            connection.close()
+
+    @tornado.testing.gen_test
+    def test_too_busy(self):
+        with TooBusyTaskSchedulerPatcher():
+            connection = yield self._connect()
+
+            task = {'docker_image': 'ubuntu:latest', 'cmd': ['echo', 'out']}
+            connection.write_message(json.dumps({'ref': 'abc', 'task': task}))
+            response = yield self._read_messages(connection, 1)
+            expected_response = [
+                {
+                    'event': TasksWebSocketHandler.EVENT_ERROR,
+                    'reason': 'too busy',
+                    'ref': 'abc',
+                    'retryAfter': 3,
+                },
+            ]
+            self.assertEqual(response, expected_response)
+
+            connection.close()
+
+    @tornado.testing.gen_test
+    def test_rejected_by_task_scheduler(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler.submit', return_value=False):
+            connection = yield self._connect()
+
+            task = {'docker_image': 'ubuntu:latest', 'cmd': ['echo', 'out']}
+            connection.write_message(json.dumps({'ref': 'abc', 'task': task}))
+            response = yield self._read_messages(connection, 2)
+            self.assertEqual(
+                [message['event'] for message in response],
+                [TasksWebSocketHandler.EVENT_ACCEPTED, TasksWebSocketHandler.EVENT_RESULT])
+            self.assertEqual(response[1]['state'], task_store.Task.STATE_REJECTED)
+            self.assertEqual(response[1]['ref'], 'abc')
+            self.assertIn('retryAfter', response[1])
+
+            connection.close()
+
+    @tornado.testing.gen_test
+    def test_happy_path(self):
+
+        def create_patch(acr, callback):
+            if acr.docker_image == 'error:latest':
+                callback(False, None, None, None, None, acr)
+                return
+            acr.progress_callback(AsyncEndToEndContainerRunner.PROGRESS_PULLED, acr)
+            acr.progress_callback(AsyncEndToEndContainerRunner.PROGRESS_STARTED, acr)
+            acr.frame_callback(StreamDemuxer.STDOUT, 'out')
+            acr._exit_code = 1
+            acr.progress_callback(AsyncEndToEndContainerRunner.PROGRESS_EXITED, acr)
+            callback(True, True, 1, None, None, acr)
+
+        with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create', create_patch):
+            connection = yield self._connect()
+
+            task = {'docker_image': 'ubuntu:latest', 'cmd': ['echo', 'out']}
+            connection.write_message(json.dumps({'ref': 'abc', 'task': task}))
+            messages = yield self._read_messages(connection, 6)
+
+            task_id = messages[0]['id']
+            self.assertIsNotNone(task_id)
+            for message in messages:
+                self.assertEqual(message['id'], task_id)
+                self.assertEqual(message['ref'], 'abc')
+
+            self.assertEqual(
+                [message['event'] for message in messages],
+                [
+                    TasksWebSocketHandler.EVENT_ACCEPTED,
+                    AsyncEndToEndContainerRunner.PROGRESS_PULLED,
+                    AsyncEndToEndContainerRunner.PROGRESS_STARTED,
+                    TasksWebSocketHandler.EVENT_OUTPUT,
+                    AsyncEndToEndContainerRunner.PROGRESS_EXITED,
+                    TasksWebSocketHandler.EVENT_RESULT,
+                ])
+            self.assertEqual(messages[3]['stream'], 'stdout')
+            self.assertEqual(messages[3]['data'], base64.b64encode('out'))
+            self.assertEqual(messages[4]['exitCode'], 1)
+            self.assertEqual(messages[5]['state'], task_store.Task.STATE_FINISHED)
+            self.assertEqual(messages[5]['exitCode'], 1)
+
+            # a second task on the same connection and without a ref
+            task = {'docker_image': 'error:latest', 'cmd': ['echo', 'out']}
+            connection.write_message(json.dumps({'task': task}))
+            messages = yield self._read_messages(connection, 2)
+
+            self.assertNotEqual(messages[0]['id'], task_id)
+            self.assertNotIn('ref', messages[0])
+            self.assertEqual(messages[1]['event'], TasksWebSocketHandler.EVENT_RESULT)
+            self.assertEqual(messages[1]['state'], task_store.Task.STATE_FAILED)
+
+            connection.close()
+
 
 class VersionRequestHandlerTestCase(AsyncRequestHandlerTestCase):
     """Unit tests for NoOpRequestHandler"""
@@ -380,3 +1449,49 @@ class HealthRequestHandlerTestCase(AsyncRequestHandlerTestCase):
             },
         }
         self.assertJsonDocumentResponse(response, expected_response_body)
+
+
+class MetricsRequestHandlerTestCase(AsyncRequestHandlerTestCase):
+    """Unit tests for MetricsRequestHandler"""
+
+    def get_app(self):
+        handlers = [
+            (
+                MetricsRequestHandler.url_spec,
+                MetricsRequestHandler
+            ),
+        ]
+        return tornado.web.Application(handlers=handlers)
+
+    def test_happy_path(self):
+        with mock.patch(__name__ + '.metrics.metrics', metrics.Metrics()) as patched_metrics:
+            patched_metrics.observe_phase(metrics.PHASE_PULL, 0.3)
+
+            response = self.fetch('/v1.1/_metrics', method='GET')
+
+            self.assertEqual(response.code, httplib.OK)
+            self.assertNoDebugDetail(response)
+            self.assertEqual(response.headers['Content-Type'], metrics.CONTENT_TYPE)
+
+            lines = response.body.split('\n')
+            self.assertIn('ecs_task_phase_duration_seconds_bucket{le="0.5",phase="pull"} 1', lines)
+            self.assertIn('ecs_task_phase_duration_seconds_count{phase="pull"} 1', lines)
+            self.assertIn('# TYPE ecs_tasks_running gauge', lines)
+            self.assertIn('ecs_tasks_running 0', lines)
+            self.assertIn('ecs_docker_host_healthy{endpoint="http://172.17.0.1:2375"} 1', lines)
+            self.assertIn('ecs_bulkhead_queue_depth{bulkhead="pull",endpoint="http://172.17.0.1:2375"} 0', lines)
+            self.assertIn('ecs_event_loop_lag_seconds{quantile="0.99"} 0.0', lines)
+
+    def test_caller_metrics(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler', task_scheduler.TaskScheduler()) as ts:
+            with mock.patch(__name__ + '.AsyncEndToEndContainerRunner.create'):
+                ts.submit(AsyncEndToEndContainerRunner('ubuntu', ['echo'], None, None, None), mock.Mock(), 'alice')
+
+            response = self.fetch('/v1.1/_metrics', method='GET')
+
+            self.assertEqual(response.code, httplib.OK)
+            lines = response.body.split('\n')
+            self.assertIn('ecs_caller_tasks_waiting{caller="alice"} 0', lines)
+            self.assertIn('# TYPE ecs_caller_task_wait_seconds histogram', lines)
+            self.assertIn('ecs_caller_task_wait_seconds_count{caller="alice"} 1', lines)
+            self.assertIn('# TYPE ecs_event_loop_slow_callbacks gauge', lines)
@@ -0,0 +1,368 @@
+"""This module contains a collection of unit tests which
+validate the ..task_scheduler module.
+"""
+
+import unittest
+import uuid
+
+import mock
+
+from .. import task_scheduler   # noqa
+from ..task_scheduler import TaskScheduler
+
+
+class TimePatcher(object):
+    """This context manager provides an easy way to install a
+    patch allowing the caller to determine the value returned
+    by time.time() in the task_scheduler module.
+    """
+
+    def __init__(self, now):
+        object.__init__(self)
+        self.now = now
+        self._patcher = mock.patch(
+            __name__ + '.task_scheduler.time.time',
+            lambda: self.now)
+
+    def __enter__(self):
+        self._patcher.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._patcher.stop()
+
+
+class DeferredContainerRunner(object):
+    """A stand-in for AsyncEndToEndContainerRunner which records
+    the callback passed to create() so the test can decide when
+    the runner finishes.
+    """
+
+    def __init__(self, caller=None, started=None):
+        object.__init__(self)
+        self.cid = uuid.uuid4().hex
+        self.caller = caller
+        self.started = started
+        self.callback = None
+
+    @property
+    def is_running(self):
+        return self.callback is not None
+
+    def create(self, callback):
+        self.callback = callback
+        if self.started is not None:
+            self.started.append(self)
+
+    def finish(self):
+        self.callback(True, True, 0, '', '', self)
+
+
+class TaskSchedulerTestCase(unittest.TestCase):
+
+    def test_ctr(self):
+        ts = TaskScheduler()
+        self.assertEqual(ts.number_running, 0)
+        self.assertEqual(ts.number_submitted, 0)
+        self.assertEqual(ts.number_rejected, 0)
+        self.assertEqual(ts.number_deadlines_rejected, 0)
+        self.assertEqual(ts.number_completed, 0)
+        self.assertEqual(ts.queue_depth, 0)
+        self.assertEqual(ts.retry_after, 1)
+
+    def test_submit_runs_immediately(self):
+        ts = TaskScheduler()
+        acr = DeferredContainerRunner()
+        callback = mock.Mock()
+
+        self.assertTrue(ts.submit(acr, callback))
+        self.assertTrue(acr.is_running)
+        self.assertEqual(ts.number_running, 1)
+        self.assertFalse(callback.called)
+
+        acr.finish()
+        callback.assert_called_once_with(True, True, 0, '', '', acr)
+        self.assertEqual(ts.number_running, 0)
+        self.assertEqual(ts.number_completed, 1)
+
+    def test_queue_and_reject(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 2):
+            with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_queue_depth', 1):
+                ts = TaskScheduler()
+                acrs = [DeferredContainerRunner() for i in range(4)]
+                callback = mock.Mock()
+
+                self.assertTrue(ts.can_submit(3))
+                self.assertFalse(ts.can_submit(4))
+
+                self.assertTrue(ts.submit(acrs[0], callback))
+                self.assertTrue(ts.submit(acrs[1], callback))
+                self.assertTrue(ts.submit(acrs[2], callback))
+                self.assertFalse(ts.submit(acrs[3], callback))
+
+                self.assertEqual([acr.is_running for acr in acrs], [True, True, False, False])
+                self.assertEqual(ts.number_running, 2)
+                self.assertEqual(ts.queue_depth, 1)
+                self.assertEqual(ts.number_submitted, 3)
+                self.assertEqual(ts.number_rejected, 1)
+
+                acrs[1].finish()
+                self.assertTrue(acrs[2].is_running)
+                self.assertEqual(ts.number_running, 2)
+                self.assertEqual(ts.queue_depth, 0)
+
+                acrs[0].finish()
+                acrs[2].finish()
+                self.assertEqual(ts.number_running, 0)
+                self.assertEqual(callback.call_count, 3)
+
+    def test_callback_raising_still_dispatches(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            ts = TaskScheduler()
+            acrs = [DeferredContainerRunner() for i in range(2)]
+
+            ts.submit(acrs[0], mock.Mock(side_effect=Exception()))
+            ts.submit(acrs[1], mock.Mock())
+            self.assertFalse(acrs[1].is_running)
+
+            with self.assertRaises(Exception):
+                acrs[0].finish()
+            self.assertTrue(acrs[1].is_running)
+
+    def test_retry_after(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            with TimePatcher(100.0) as time_patcher:
+                ts = TaskScheduler()
+                acrs = [DeferredContainerRunner() for i in range(5)]
+                for acr in acrs:
+                    ts.submit(acr, mock.Mock())
+
+                acrs[0].finish()
+                self.assertEqual(ts.retry_after, 1)
+
+                # tasks completing every 2 seconds with 2 tasks waiting
+                time_patcher.now = 102.0
+                acrs[1].finish()
+                self.assertEqual(ts.queue_depth, 2)
+                self.assertEqual(ts.retry_after, 6)
+
+                # a quicker completion moves the average a little
+                time_patcher.now = 103.0
+                acrs[2].finish()
+                self.assertEqual(ts.queue_depth, 1)
+                self.assertEqual(ts.retry_after, 4)
+
+    def test_idle_time_not_counted_as_time_between_completions(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            with TimePatcher(100.0) as time_patcher:
+                ts = TaskScheduler()
+                acrs = [DeferredContainerRunner() for i in range(3)]
+                ts.submit(acrs[0], mock.Mock())
+                ts.submit(acrs[1], mock.Mock())
+
+                time_patcher.now = 101.0
+                acrs[0].finish()
+                time_patcher.now = 103.0
+                acrs[1].finish()
+                self.assertEqual(ts._time_between_completions, 2.0)
+
+                # an idle hour later a single task runs on its own
+                time_patcher.now = 3700.0
+                ts.submit(acrs[2], mock.Mock())
+                time_patcher.now = 3701.0
+                acrs[2].finish()
+                self.assertEqual(ts._time_between_completions, 2.0)
+                self.assertEqual(ts.retry_after, 2)
+                self.assertTrue(ts.can_meet_deadline(deadline=5000))
+
+    def _finish_all(self, started):
+        """Finish each task in ```started``` - including tasks started
+        as a result of finishing earlier tasks - and return the callers
+        of the tasks in the order they were started.
+        """
+        for acr in started:
+            acr.finish()
+        return [acr.caller for acr in started]
+
+    def test_weighted_fair_order(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            with mock.patch(__name__ + '.task_scheduler.task_scheduler_weights', {'alice': 2}):
+                ts = TaskScheduler()
+                started = []
+
+                ts.submit(DeferredContainerRunner('carol', started), mock.Mock(), 'carol')
+                for caller in ['alice', 'bob']:
+                    for i in range(4):
+                        ts.submit(DeferredContainerRunner(caller, started), mock.Mock(), caller)
+                self.assertEqual(ts.callers['alice'].queue_depth, 4)
+                self.assertEqual(ts.callers['bob'].queue_depth, 4)
+
+                expected_callers = ['carol', 'alice', 'alice', 'bob', 'alice', 'alice', 'bob', 'bob', 'bob']
+                self.assertEqual(self._finish_all(started), expected_callers)
+
+    def test_burst_does_not_starve_other_callers(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            ts = TaskScheduler()
+            started = []
+
+            ts.submit(DeferredContainerRunner('carol', started), mock.Mock(), 'carol')
+            for i in range(10):
+                ts.submit(DeferredContainerRunner('alice', started), mock.Mock(), 'alice')
+            ts.submit(DeferredContainerRunner('bob', started), mock.Mock(), 'bob')
+
+            self.assertEqual(self._finish_all(started)[:4], ['carol', 'alice', 'bob', 'alice'])
+
+    def test_caller_stats(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_queue_depth', 1):
+                with TimePatcher(100.0) as time_patcher:
+                    ts = TaskScheduler()
+                    acrs = [DeferredContainerRunner() for i in range(3)]
+                    self.assertTrue(ts.submit(acrs[0], mock.Mock(), 'alice'))
+                    self.assertTrue(ts.submit(acrs[1], mock.Mock(), 'alice'))
+                    self.assertFalse(ts.submit(acrs[2], mock.Mock(), 'alice'))
+
+                    caller = ts.callers['alice']
+                    self.assertEqual(caller.weight, 1)
+                    self.assertEqual(caller.queue_depth, 1)
+                    self.assertEqual(caller.number_submitted, 2)
+                    self.assertEqual(caller.number_rejected, 1)
+                    self.assertEqual(caller.number_dispatched, 1)
+
+                    time_patcher.now = 102.5
+                    acrs[0].finish()
+
+                    self.assertEqual(caller.queue_depth, 0)
+                    self.assertEqual(caller.number_dispatched, 2)
+                    self.assertEqual(caller.total_wait_time, 2.5)
+                    self.assertEqual(caller.max_wait_time, 2.5)
+
+    def test_caller_wait_times(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            with TimePatcher(100.0) as time_patcher:
+                ts = TaskScheduler()
+                acrs = [DeferredContainerRunner() for i in range(2)]
+                for acr in acrs:
+                    ts.submit(acr, mock.Mock(), 'alice')
+
+                time_patcher.now = 100.3
+                acrs[0].finish()
+
+                wait_times = ts.callers['alice'].wait_times
+                self.assertEqual(wait_times.count, 2)
+                self.assertAlmostEqual(wait_times.sum, 0.3)
+
+    def test_idle_callers_forgotten(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            with mock.patch(__name__ + '.task_scheduler.task_scheduler_caller_ttl', 1000):
+                with TimePatcher(100.0) as time_patcher:
+                    ts = TaskScheduler()
+                    acrs = [DeferredContainerRunner() for i in range(4)]
+                    ts.submit(acrs[0], mock.Mock(), 'alice')
+                    ts.submit(acrs[1], mock.Mock(), 'bob')
+
+                    # bob has a task waiting so isn't forgotten
+                    time_patcher.now = 101.5
+                    ts.submit(acrs[2], mock.Mock(), 'carol')
+                    self.assertEqual(ts.callers.keys(), ['bob', 'carol'])
+
+                    # bob's task starting to run makes bob active again
+                    acrs[0].finish()
+                    time_patcher.now = 102.0
+                    ts.submit(acrs[3], mock.Mock(), 'dave')
+                    self.assertEqual(ts.callers.keys(), ['carol', 'bob', 'dave'])
+
+                    # carol and dave have tasks waiting
+                    time_patcher.now = 103.0
+                    ts.submit(DeferredContainerRunner(), mock.Mock(), 'alice')
+                    self.assertEqual(ts.callers.keys(), ['carol', 'dave', 'alice'])
+                    self.assertEqual(ts.callers['alice'].number_submitted, 1)
+
+    def test_anonymous_caller(self):
+        ts = TaskScheduler()
+        ts.submit(DeferredContainerRunner(), mock.Mock())
+        self.assertEqual(ts.callers.keys(), [''])
+
+    def test_priority_order(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            ts = TaskScheduler()
+            started = []
+
+            ts.submit(DeferredContainerRunner('first', started), mock.Mock())
+            ts.submit(DeferredContainerRunner('batch', started), mock.Mock(), priority=task_scheduler.PRIORITY_BATCH)
+            ts.submit(DeferredContainerRunner('normal', started), mock.Mock())
+            ts.submit(
+                DeferredContainerRunner('interactive', started),
+                mock.Mock(),
+                priority=task_scheduler.PRIORITY_INTERACTIVE)
+
+            self.assertEqual(self._finish_all(started), ['first', 'interactive', 'normal', 'batch'])
+
+    def test_earliest_deadline_first(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            with TimePatcher(100.0):
+                ts = TaskScheduler()
+                started = []
+
+                ts.submit(DeferredContainerRunner('first', started), mock.Mock())
+                ts.submit(DeferredContainerRunner('none', started), mock.Mock())
+                ts.submit(DeferredContainerRunner('late', started), mock.Mock(), deadline=60000)
+                ts.submit(DeferredContainerRunner('early', started), mock.Mock(), deadline=30000)
+                ts.submit(
+                    DeferredContainerRunner('batch', started),
+                    mock.Mock(),
+                    priority=task_scheduler.PRIORITY_BATCH,
+                    deadline=10000)
+
+                self.assertEqual(self._finish_all(started), ['first', 'early', 'late', 'none', 'batch'])
+
+    def test_deadline_cannot_be_met(self):
+        with mock.patch(__name__ + '.task_scheduler.task_scheduler_max_concurrency', 1):
+            with TimePatcher(100.0):
+                ts = TaskScheduler()
+                ts._time_between_completions = 3.0
+
+                # a free slot means the task starts right away
+                self.assertTrue(ts.can_meet_deadline(deadline=1))
+                self.assertTrue(ts.can_meet_deadline())
+
+                ts.submit(DeferredContainerRunner(), mock.Mock())
+
+                # no free slot means waiting for a running task to finish
+                self.assertTrue(ts.can_meet_deadline(deadline=3000))
+                self.assertFalse(ts.can_meet_deadline(deadline=2999))
+
+                self.assertTrue(ts.submit(DeferredContainerRunner(), mock.Mock(), deadline=5000))
+                ts.submit(DeferredContainerRunner(), mock.Mock())
+                ts.submit(DeferredContainerRunner(), mock.Mock(), priority=task_scheduler.PRIORITY_BATCH)
+
+                # of the waiting tasks only the normal task with the earlier
+                # deadline is ahead of a normal task with a 6 second deadline
+                self.assertTrue(ts.can_meet_deadline(deadline=6000))
+                self.assertFalse(ts.can_meet_deadline(deadline=5999))
+
+                # no waiting task is ahead of an interactive task
+                self.assertTrue(ts.can_meet_deadline(task_scheduler.PRIORITY_INTERACTIVE, 3000))
+
+                acr = DeferredContainerRunner('alice')
+                self.assertFalse(ts.submit(acr, mock.Mock(), 'alice', deadline=5999))
+                self.assertFalse(acr.is_running)
+                self.assertEqual(ts.queue_depth, 3)
+                self.assertEqual(ts.number_rejected, 1)
+                self.assertEqual(ts.number_deadlines_rejected, 1)
+                self.assertEqual(ts.callers['alice'].number_rejected, 1)
+
+    def test_long_tasks_dont_reject_tight_deadlines_when_idle(self):
+        with TimePatcher(100.0) as time_patcher:
+            ts = TaskScheduler()
+            acr = DeferredContainerRunner()
+            ts.submit(acr, mock.Mock(), priority=task_scheduler.PRIORITY_BATCH)
+            time_patcher.now = 160.0
+            acr.finish()
+
+            self.assertTrue(ts.can_meet_deadline(task_scheduler.PRIORITY_INTERACTIVE, 5000))
+            self.assertTrue(ts.submit(
+                DeferredContainerRunner(),
+                mock.Mock(),
+                priority=task_scheduler.PRIORITY_INTERACTIVE,
+                deadline=5000))
@@ -0,0 +1,201 @@
+"""This module contains a collection of unit tests which
+validate the ..task_store module.
+"""
+
+import unittest
+import uuid
+
+import mock
+
+from .. import task_store   # noqa
+from ..task_store import Task
+from ..task_store import TaskStore
+
+
+class TimePatcher(object):
+    """This context manager provides an easy way to install a
+    patch allowing the caller to determine the value returned
+    by time.time() in the task_store module.
+    """
+
+    def __init__(self, now):
+        object.__init__(self)
+        self.now = now
+        self._patcher = mock.patch(
+            __name__ + '.task_store.time.time',
+            lambda: self.now)
+
+    def __enter__(self):
+        self._patcher.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._patcher.stop()
+
+
+class TaskStoreTestCase(unittest.TestCase):
+
+    def test_ctr(self):
+        ts = TaskStore()
+        self.assertEqual(ts.number_running, 0)
+        self.assertEqual(ts.number_finished, 0)
+        self.assertEqual(ts.number_bytes, 0)
+        self.assertEqual(ts.number_evictions, 0)
+
+    def test_get_unknown_task(self):
+        ts = TaskStore()
+        self.assertIsNone(ts.get(uuid.uuid4().hex))
+
+    def test_add_and_finish(self):
+        ts = TaskStore()
+        task_id = uuid.uuid4().hex
+
+        task = ts.add(task_id)
+        self.assertTrue(ts.get(task_id) is task)
+        self.assertTrue(task.is_running)
+        self.assertEqual(ts.number_running, 1)
+
+        ts.finish(task_id, Task.STATE_FINISHED, 1, 'out', 'error')
+        self.assertTrue(ts.get(task_id) is task)
+        self.assertFalse(task.is_running)
+        self.assertEqual(task.state, Task.STATE_FINISHED)
+        self.assertEqual(task.exit_code, 1)
+        self.assertEqual(task.stdout, 'out')
+        self.assertEqual(task.stderr, 'error')
+        self.assertFalse(task.is_timed_out)
+        self.assertEqual(ts.number_running, 0)
+        self.assertEqual(ts.number_finished, 1)
+        self.assertEqual(ts.number_bytes, 8)
+
+    def test_finish_timed_out_task(self):
+        ts = TaskStore()
+        task_id = uuid.uuid4().hex
+        task = ts.add(task_id)
+        ts.finish(task_id, Task.STATE_FINISHED, 137, 'out', '', True)
+        self.assertTrue(task.is_timed_out)
+
+    def test_finish_unknown_task(self):
+        ts = TaskStore()
+        ts.finish(uuid.uuid4().hex, Task.STATE_FAILED)
+        self.assertEqual(ts.number_finished, 0)
+
+    def test_remove(self):
+        ts = TaskStore()
+        task_id = uuid.uuid4().hex
+        ts.add(task_id)
+        ts.remove(task_id)
+        self.assertIsNone(ts.get(task_id))
+        self.assertEqual(ts.number_running, 0)
+        self.assertEqual(ts.number_finished, 0)
+
+    def test_remove_unknown_task(self):
+        ts = TaskStore()
+        ts.remove(uuid.uuid4().hex)
+        self.assertEqual(ts.number_running, 0)
+
+    def test_ttl_eviction(self):
+        with mock.patch(__name__ + '.task_store.task_store_ttl', 1000):
+            with TimePatcher(100.0) as time_patcher:
+                ts = TaskStore()
+                task_ids = [uuid.uuid4().hex for i in range(2)]
+                for task_id in task_ids:
+                    ts.add(task_id)
+
+                ts.finish(task_ids[0], Task.STATE_FINISHED, 0, 'a', 'b')
+                time_patcher.now = 100.5
+                ts.finish(task_ids[1], Task.STATE_FINISHED, 0, 'a', 'b')
+
+                time_patcher.now = 101.0
+                self.assertIsNone(ts.get(task_ids[0]))
+                self.assertIsNotNone(ts.get(task_ids[1]))
+                self.assertEqual(ts.number_evictions, 1)
+                self.assertEqual(ts.number_bytes, 2)
+
+                time_patcher.now = 102.0
+                self.assertIsNone(ts.get(task_ids[1]))
+                self.assertEqual(ts.number_bytes, 0)
+
+    def test_running_tasks_never_evicted(self):
+        with mock.patch(__name__ + '.task_store.task_store_ttl', 1000):
+            with TimePatcher(100.0) as time_patcher:
+                ts = TaskStore()
+                task_id = uuid.uuid4().hex
+                ts.add(task_id)
+                time_patcher.now = 1000.0
+                self.assertIsNotNone(ts.get(task_id))
+
+    def test_byte_budget_eviction(self):
+        with mock.patch(__name__ + '.task_store.task_store_max_bytes', 25):
+            ts = TaskStore()
+            task_ids = [uuid.uuid4().hex for i in range(3)]
+            for task_id in task_ids:
+                ts.add(task_id)
+                ts.finish(task_id, Task.STATE_FINISHED, 0, 'x' * 5, 'y' * 5)
+
+            self.assertIsNone(ts.get(task_ids[0]))
+            self.assertIsNotNone(ts.get(task_ids[1]))
+            self.assertIsNotNone(ts.get(task_ids[2]))
+            self.assertEqual(ts.number_bytes, 20)
+            self.assertEqual(ts.number_evictions, 1)
+
+    def test_wait_on_finished_task(self):
+        ts = TaskStore()
+        task_id = uuid.uuid4().hex
+        task = ts.add(task_id)
+        ts.finish(task_id, Task.STATE_FAILED)
+
+        callback = mock.Mock()
+        ts.wait(task, callback, 1000)
+        callback.assert_called_once_with(task)
+
+    def test_wait_until_finished(self):
+        with mock.patch('tornado.ioloop.IOLoop.current') as current:
+            io_loop = current.return_value
+            ts = TaskStore()
+            task_id = uuid.uuid4().hex
+            task = ts.add(task_id)
+
+            callback = mock.Mock()
+            ts.wait(task, callback, 1000)
+            self.assertEqual(io_loop.add_timeout.call_count, 1)
+            self.assertFalse(callback.called)
+
+            ts.finish(task_id, Task.STATE_FINISHED, 0, '', '')
+            callback.assert_called_once_with(task)
+            io_loop.remove_timeout.assert_called_once_with(io_loop.add_timeout.return_value)
+
+    def test_wait_timeout(self):
+        with mock.patch(__name__ + '.task_store.task_store_max_wait', 500):
+            with mock.patch('tornado.ioloop.IOLoop.current') as current:
+                io_loop = current.return_value
+                ts = TaskStore()
+                task_id = uuid.uuid4().hex
+                task = ts.add(task_id)
+
+                callback = mock.Mock()
+                ts.wait(task, callback, 1000)
+
+                (deadline, on_timeout) = io_loop.add_timeout.call_args[0]
+                self.assertEqual(deadline.total_seconds(), 0.5)
+
+                on_timeout()
+                callback.assert_called_once_with(task)
+
+                # finishing after the timeout doesn't call back again
+                ts.finish(task_id, Task.STATE_FINISHED, 0, '', '')
+                callback.assert_called_once_with(task)
+
+    def test_wait_cancel(self):
+        with mock.patch('tornado.ioloop.IOLoop.current') as current:
+            io_loop = current.return_value
+            ts = TaskStore()
+            task_id = uuid.uuid4().hex
+            task = ts.add(task_id)
+
+            callback = mock.Mock()
+            cancel = ts.wait(task, callback, 1000)
+            cancel()
+            self.assertEqual(io_loop.remove_timeout.call_count, 1)
+
+            ts.finish(task_id, Task.STATE_FINISHED, 0, '', '')
+            self.assertFalse(callback.called)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""This script benchmarks the Docker Remote API transports used by
+ECS by issuing the same series of requests against each of a tcp
+endpoint and a unix domain socket endpoint using the same http client
+and request class the service uses.
+
+Example usage
+
+    docker_remote_api_benchmark.py \
+        --requests=5000 \
+        --concurrency=10 \
+        http://172.17.0.1:2375 \
+        unix:///var/run/docker.sock
+"""
+
+import optparse
+import sys
+import time
+
+import tornado.httpclient
+import tornado.ioloop
+
+from ecs import async_docker_remote_api
+
+
+class _CommandLineParser(optparse.OptionParser):
+
+    def __init__(self):
+        optparse.OptionParser.__init__(
+            self,
+            'usage: %prog [options] <endpoint> ...',
+            description='benchmark Docker Remote API transports')
+
+        default = 1000
+        help = 'number of requests per endpoint - default = %d' % default
+        self.add_option(
+            '--requests',
+            action='store',
+            dest='number_requests',
+            default=default,
+            type='int',
+            help=help)
+
+        default = 10
+        help = 'number of concurrent requests - default = %d' % default
+        self.add_option(
+            '--concurrency',
+            action='store',
+            dest='concurrency',
+            default=default,
+            type='int',
+            help=help)
+
+        default = '/_ping'
+        help = 'path requested - default = %s' % default
+        self.add_option(
+            '--path',
+            action='store',
+            dest='path',
+            default=default,
+            type='string',
+            help=help)
+
+
+class _Benchmark(object):
+
+    def __init__(self, endpoint, path, number_requests, concurrency):
+        object.__init__(self)
+
+        self.endpoint = endpoint
+        self.path = path
+        self.number_requests = number_requests
+        self.concurrency = concurrency
+
+        self.latencies = []
+        self.number_errors = 0
+        self.elapsed_time = None
+
+        self._number_started = 0
+        self._start_time = None
+
+    def run(self):
+        async_docker_remote_api.docker_remote_api_endpoint = self.endpoint
+
+        self._start_time = time.time()
+        for i in range(min(self.concurrency, self.number_requests)):
+            self._fetch()
+
+        tornado.ioloop.IOLoop.current().start()
+
+    def _fetch(self):
+        self._number_started += 1
+        request = async_docker_remote_api.HTTPRequest(self.path)
+        http_client = async_docker_remote_api.http_client(request)
+        http_client.fetch(
+            request,
+            callback=self._on_http_client_fetch_done)
+
+    def _on_http_client_fetch_done(self, response):
+        if response.error:
+            self.number_errors += 1
+        else:
+            self.latencies.append(response.request_time * 1000.0)
+
+        if self._number_started < self.number_requests:
+            self._fetch()
+            return
+
+        if len(self.latencies) + self.number_errors == self.number_requests:
+            self.elapsed_time = time.time() - self._start_time
+            tornado.ioloop.IOLoop.current().stop()
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+    def __str__(self):
+        fmt = (
+            '%-40s %6d reqs %4d errors %8.1f reqs/sec '
+            'p50 = %6.2f ms p95 = %6.2f ms p99 = %6.2f ms'
+        )
+        args = (
+            self.endpoint,
+            len(self.latencies),
+            self.number_errors,
+            len(self.latencies) / self.elapsed_time if self.elapsed_time else 0.0,
+            self.percentile(50),
+            self.percentile(95),
+            self.percentile(99),
+        )
+        return fmt % args
+
+
+if __name__ == '__main__':
+    clp = _CommandLineParser()
+    (clo, endpoints) = clp.parse_args()
+    if not endpoints:
+        clp.error('at least one endpoint is required')
+
+    tornado.httpclient.AsyncHTTPClient.configure(
+        'tornado.curl_httpclient.CurlAsyncHTTPClient',
+        max_clients=clo.concurrency)
+
+    for endpoint in endpoints:
+        is_unix_socket_endpoint = async_docker_remote_api.is_unix_socket_endpoint(endpoint)
+        if is_unix_socket_endpoint and not async_docker_remote_api.is_unix_socket_supported():
+            sys.stderr.write('libcurl does not support unix domain sockets - skipping %s\n' % endpoint)
+            continue
+
+        benchmark = _Benchmark(endpoint, clo.path, clo.number_requests, clo.concurrency)
+        benchmark.run()
+        print benchmark
+
+    sys.exit(0)